@@ -0,0 +1,41 @@
+from . import metrics
+
+
+class Broadcast:
+    # fans the frames one session plays out to any number of watch-only tracks; runs on the
+    # event loop, every subscriber has a bounded queue and a slow one loses its oldest frames
+
+    def __init__(self, sessionid: int = 0):
+        self.sessionid = sessionid
+        self.subscribers = set()
+        self.dropped = 0
+
+    def subscribe(self, track):
+        self.subscribers.add(track)
+
+    def unsubscribe(self, track):
+        self.subscribers.discard(track)
+
+    def publish(self, kind: str, frame):
+        for track in list(self.subscribers):
+            if track.kind != kind:
+                continue
+            if track._queue.full():
+                track._queue.get_nowait()
+                self.dropped += 1
+                metrics.dropped_frames.inc(1, self.sessionid, 'slow_viewer')
+            track._queue.put_nowait(frame)
+
+    def close(self):
+        # the session is gone: wake every viewer with the end-of-stream marker
+        for track in list(self.subscribers):
+            while not track._queue.empty():
+                track._queue.get_nowait()
+            track._queue.put_nowait(None)
+        self.subscribers.clear()
+
+    def viewers(self) -> int:
+        return sum(1 for track in self.subscribers if track.kind == 'video')
+
+    def stats(self) -> dict:
+        return {"viewers": self.viewers(), "dropped": self.dropped}
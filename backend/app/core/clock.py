@@ -0,0 +1,104 @@
+import time
+import asyncio
+import threading
+
+from . import metrics
+
+clock_jitter_seconds = metrics.registry.register(metrics.Histogram(
+    'livetalking_clock_jitter_seconds', 'Distance between a frame or render batch and its slot on the session clock',
+    ('session', 'kind'), buckets=(0.001, 0.0025, 0.005, 0.01, 0.02, 0.04, 0.08, 0.16, 0.32, 0.64)))
+clock_corrections = metrics.registry.register(metrics.Counter(
+    'livetalking_clock_corrections_total', 'Times a session clock was moved forward because playout fell behind', ('session',)))
+
+
+class MasterClock:
+    # one monotonic timeline per session: both tracks play slot n at origin + n * ptime and the
+    # render thread starts each batch a lead ahead of the video slot it will fill, so audio,
+    # video and rendering share a single reference and cannot drift apart
+
+    def __init__(self, fps: int, sessionid: int = 0, max_late: float = 0.2):
+        self.audio_ptime = 1 / fps  # one asr chunk
+        self.video_ptime = 2 / fps  # every video frame carries two chunks
+        self.sessionid = sessionid
+        self.max_late = max_late
+        # unpaced clocks never wait, used to measure raw throughput
+        self.paced = True
+        self.origin = None
+        self.shift = 0.0
+        self.corrections = 0
+        self._started = threading.Event()
+        self._lock = threading.Lock()
+
+    def start(self) -> float:
+        with self._lock:
+            if self.origin is None:
+                self.origin = time.monotonic()
+                self._started.set()
+            return self.origin
+
+    def reset(self):
+        with self._lock:
+            self.origin = None
+            self.shift = 0.0
+            self._started.clear()
+
+    def slot(self) -> int:
+        # video slot playing now, 0 before playout starts
+        if self.origin is None:
+            return 0
+        return max(0, int((time.monotonic() - self.origin) / self.video_ptime))
+
+    async def pace(self, kind: str, index: int, ptime: float) -> float:
+        # waits for slot index of a track and returns its position on the timeline in seconds
+        origin = self.start()
+        due = origin + index * ptime
+        if self.paced:
+            wait = due - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            late = time.monotonic() - due
+            clock_jitter_seconds.observe(abs(late), self.sessionid, kind)
+            if late > self.max_late:
+                # the track ran dry (stalled render, dropped frames): move the whole timeline
+                # instead of bursting the backlog out, both tracks see the same correction
+                with self._lock:
+                    self.origin += late
+                    self.shift += late
+                    self.corrections += 1
+                clock_corrections.inc(1, self.sessionid)
+        return index * ptime + self.shift
+
+    def deadline(self, index: float):
+        # render side: monotonic time video slot index is due, None while playout has not started
+        if not self.paced:
+            return 0.0
+        if self.origin is None:
+            return None if index > 0 else 0.0
+        return self.origin + index * self.video_ptime
+
+    def mark(self, due: float):
+        # a render batch started for a slot due at due
+        if self.paced and due:
+            clock_jitter_seconds.observe(abs(time.monotonic() - due), self.sessionid, 'render')
+
+    def wait_slot(self, index: float, quit_event: threading.Event):
+        # blocks the render thread until video slot index is due, at once when it is already past
+        due = self.deadline(index)
+        while due is None:
+            if quit_event.is_set():
+                return
+            self._started.wait(0.1)
+            due = self.deadline(index)
+        wait = due - time.monotonic()
+        if wait > 0:
+            quit_event.wait(wait)
+        self.mark(due)
+
+    def stats(self) -> dict:
+        jitter = {}
+        for kind in ('audio', 'video', 'render'):
+            counts, total = clock_jitter_seconds.totals(self.sessionid, kind)
+            count = sum(counts)
+            jitter[kind] = round(total / count * 1000, 2) if count else None
+        return {"position_s": round(self.slot() * self.video_ptime, 2), "corrections": self.corrections,
+                "mean_jitter_ms": jitter}
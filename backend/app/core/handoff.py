@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from collections import deque
+
+
+class Handoff:
+    # render side to event loop: items for the track queues collect in one list and a single
+    # callback per batch moves them, instead of a coroutine, a future and a wakeup per item. A
+    # full track queue gets a backlog that is fed into it in order as the track consumes, the
+    # same backpressure as awaiting put() on it: nothing is dropped and nothing overtakes
+
+    def __init__(self, loop):
+        self.loop = loop
+        self._pending = []
+        self._scheduled = False
+        # bumped by discard, a callback scheduled before it has nothing left to move
+        self._generation = 0
+        self._lock = threading.Lock()
+        # loop side only
+        self._backlog = {}
+        self._refills = {}
+        self.batches = 0
+        self.items = 0
+
+    def put(self, items):
+        # (queue, item) pairs of one video frame and its audio, from any thread
+        with self._lock:
+            self._pending.extend(items)
+            if self._scheduled:
+                return
+            self._scheduled = True
+            generation = self._generation
+        self.loop.call_soon_threadsafe(self._drain, generation)
+
+    def _drain(self, generation: int):
+        with self._lock:
+            if generation != self._generation:
+                return
+            pending, self._pending = self._pending, []
+            self._scheduled = False
+        self.batches += 1
+        self.items += len(pending)
+        for queue, item in pending:
+            backlog = self._backlog.get(queue)
+            if backlog is not None:
+                backlog.append(item)
+                continue
+            try:
+                queue.put_nowait(item)
+            except asyncio.QueueFull:
+                self._backlog[queue] = deque([item])
+                self._refills[queue] = self.loop.create_task(self._refill(queue))
+
+    async def _refill(self, queue):
+        backlog = self._backlog[queue]
+        while backlog:
+            await queue.put(backlog[0])
+            backlog.popleft()
+        del self._backlog[queue]
+        del self._refills[queue]
+
+    def discard(self, tracks):
+        # barge-in, from any thread: what was handed over but not played is dropped on the loop,
+        # items put after this call are kept
+        with self._lock:
+            self._generation += 1
+            self._pending.clear()
+            self._scheduled = False
+        self.loop.call_soon_threadsafe(self._clear, tracks)
+
+    def _clear(self, tracks):
+        for task in self._refills.values():
+            task.cancel()
+        self._refills.clear()
+        self._backlog.clear()
+        for track in tracks:
+            while not track._queue.empty():
+                track._queue.get_nowait()
+
+    def backlog(self) -> int:
+        return len(self._pending) + sum(len(backlog) for backlog in list(self._backlog.values()))
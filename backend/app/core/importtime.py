@@ -0,0 +1,116 @@
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+import subprocess
+import importlib.abc
+
+
+class _TimedLoader:
+
+    def __init__(self, loader, recorder):
+        self._loader = loader
+        self._recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._recorder.enter(module.__name__)
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._recorder.leave(module.__name__)
+
+
+class ImportRecorder(importlib.abc.MetaPathFinder):
+
+    def __init__(self):
+        self.records = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def enter(self, name):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append([name, time.perf_counter(), 0.0])
+
+    def leave(self, name):
+        stack = self._local.stack
+        name, start, children = stack.pop()
+        cumulative = time.perf_counter() - start
+        if stack:
+            stack[-1][2] += cumulative
+        with self._lock:
+            self.records[name] = (cumulative - children, cumulative)
+
+    def top(self, n=20, key="self"):
+        index = 0 if key == "self" else 1
+        with self._lock:
+            rows = sorted(self.records.items(), key=lambda item: item[1][index], reverse=True)
+        return [(name, self_s, cumulative_s) for name, (self_s, cumulative_s) in rows[:n]]
+
+    def report(self, n=20) -> str:
+        lines = [f"{'self ms':>10} {'cumul ms':>10}  module"]
+        for name, self_s, cumulative_s in self.top(n):
+            lines.append(f"{self_s * 1000:10.1f} {cumulative_s * 1000:10.1f}  {name}")
+        return "\n".join(lines)
+
+recorder = ImportRecorder()
+
+def install():
+    if recorder not in sys.meta_path:
+        sys.meta_path.insert(0, recorder)
+
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def measure(module: str):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us) / 1e6, int(cumulative_us) / 1e6, len(indent) // 2))
+    return rows
+
+
+if __name__ == "__main__":
+    from config.settings import settings
+
+    parser = argparse.ArgumentParser(description="Report per-module import time and enforce an import budget")
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--budget-ms", type=float, default=settings.import_budget_ms)
+    args = parser.parse_args()
+
+    rows = measure(args.module)
+    total = next(cumulative for name, _, cumulative, _ in reversed(rows) if name == args.module)
+    print(f"{'self ms':>10} {'cumul ms':>10}  module")
+    for name, self_s, cumulative_s, _ in sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]:
+        print(f"{self_s * 1000:10.1f} {cumulative_s * 1000:10.1f}  {name}")
+    print(f"import {args.module}: {total * 1000:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    if args.budget_ms > 0 and total * 1000 > args.budget_ms:
+        sys.exit(1)
@@ -0,0 +1,180 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Tuple
+
+# seconds, covering sub-millisecond paste-back up to multi-second stalls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            child = self._children.get(labels)
+            if child is None:
+                child = self._children[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            child[0][index] += 1
+            child[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def remove(self, *labels):
+        # drops every child whose leading label values are labels, e.g. all kinds of one session
+        with self._lock:
+            for key in [key for key in self._children if key[:len(labels)] == labels]:
+                del self._children[key]
+
+    def totals(self, *labels) -> Tuple[list, float]:
+        with self._lock:
+            counts, total = self._children.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+            return list(counts), total
+
+    def samples(self):
+        with self._lock:
+            children = [(labels, list(counts), total) for labels, (counts, total) in self._children.items()]
+        for labels, counts, total in children:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def remove(self, *labels):
+        # drops every child whose leading label values are labels, e.g. all reasons of one session
+        with self._lock:
+            for key in [key for key in self._values if key[:len(labels)] == labels]:
+                del self._values[key]
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+class Gauge:
+    # values come from a callback at scrape time, so nothing is paid on the hot path
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (),
+                 collect: Callable[[], Dict[Tuple, float]] = None):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.collect = collect
+
+    def samples(self):
+        for labels, value in self.collect().items():
+            if value is not None:
+                yield f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+        # collectors that raised, reported once each
+        self.failed = set()
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def remove_session(self, sessionid):
+        # a finished session leaves no series behind; gauges are collected from live sessions
+        for metric in self.metrics:
+            if metric.labelnames[:1] == ('session',) and hasattr(metric, 'remove'):
+                metric.remove(sessionid)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception as e:
+                if metric.name not in self.failed:
+                    self.failed.add(metric.name)
+                    print(f"metric {metric.name} failed to collect: {e!r}")
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+asr_step_seconds = registry.register(Histogram('livetalking_asr_step_seconds', 'Time of one asr step (2 x batch audio frames)'))
+whisper_encode_seconds = registry.register(Histogram('livetalking_whisper_encode_seconds', 'Time of whisper feature extraction per asr step'))
+unet_seconds = registry.register(Histogram('livetalking_unet_seconds', 'Time of one unet batch'))
+vae_decode_seconds = registry.register(Histogram('livetalking_vae_decode_seconds', 'Time of one vae decode batch'))
+paste_back_seconds = registry.register(Histogram('livetalking_paste_back_seconds', 'Time to blend one rendered face back into its frame'))
+track_send_seconds = registry.register(Histogram('livetalking_track_send_seconds', 'Time to wrap one video frame and its audio and hand them to the tracks'))
+dropped_frames = registry.register(Counter('livetalking_dropped_frames_total', 'Frames dropped before playback', ('session', 'reason')))
+
+
+def register_session_gauges(session_manager):
+    def active():
+        return {(): session_manager.session_count()}
+
+    def depths():
+        values = {}
+        for sessionid, nerfreal in list(session_manager.nerfreals.items()):
+            if nerfreal is not None:
+                for queue, depth in nerfreal.queue_depths().items():
+                    values[(sessionid, queue)] = depth
+        return values
+
+    def fps():
+        values = {}
+        for sessionid, nerfreal in list(session_manager.nerfreals.items()):
+            for track in getattr(nerfreal, 'output_tracks', ()):
+                if track.kind == 'video' and getattr(track, 'fps', None) is not None:
+                    values[(sessionid,)] = track.fps
+        return values
+
+    registry.register(Gauge('livetalking_active_sessions', 'Sessions with a running avatar', collect=active))
+    registry.register(Gauge('livetalking_queue_depth', 'Items waiting in each pipeline queue', ('session', 'queue'), depths))
+    registry.register(Gauge('livetalking_session_fps', 'Video frames per second delivered by the track', ('session',), fps))
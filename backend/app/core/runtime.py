@@ -0,0 +1,132 @@
+import time
+import heapq
+import threading
+import itertools
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from config.settings import settings
+
+
+class Strand:
+    # runs the calls submitted to it one at a time and in order on a shared executor, so the
+    # stages of one session keep their ordering without owning a thread
+
+    def __init__(self, runtime, executor: ThreadPoolExecutor):
+        self.runtime = runtime
+        self.executor = executor
+        self._pending = deque()
+        self._running = False
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args):
+        if self.runtime.closed:
+            return
+        with self._lock:
+            self._pending.append((fn, args))
+            if self._running:
+                return
+            self._running = True
+        self.executor.submit(self._run_one)
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _run_one(self):
+        # one call per executor task: a busy session cannot hold a worker away from the others
+        with self._lock:
+            fn, args = self._pending.popleft()
+        try:
+            fn(*args)
+        except Exception as e:
+            self.runtime.failures += 1
+            print(f"{getattr(fn, '__qualname__', fn)} failed: {e!r}\n{traceback.format_exc()}")
+        with self._lock:
+            if not self._pending or self.runtime.closed:
+                self._running = False
+                return
+        self.executor.submit(self._run_one)
+
+class Timer:
+    # a single thread for every delayed call of every session
+
+    def __init__(self):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._quit = False
+
+    def call_at(self, when: float, fn, *args):
+        with self._cond:
+            if self._quit:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="runtime-timer", daemon=True)
+                self._thread.start()
+            heapq.heappush(self._heap, (when, next(self._seq), fn, args))
+            self._cond.notify()
+
+    def stop(self):
+        with self._cond:
+            self._quit = True
+            self._heap.clear()
+            self._cond.notify()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._quit and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    self._cond.wait(self._heap[0][0] - time.monotonic() if self._heap else None)
+                if self._quit:
+                    return
+                _, _, fn, args = heapq.heappop(self._heap)
+            # one raising callback must not stop the pacing of every other session
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f"timer callback {getattr(fn, '__qualname__', fn)} failed: {e!r}\n{traceback.format_exc()}")
+
+
+class Runtime:
+    # sized pools shared by all sessions: asr steps and composition run on the workers, model
+    # calls on the inference executor and tts synthesis on its own pool, so adding a session
+    # adds tasks instead of threads
+
+    def __init__(self, workers: int, inference_workers: int, tts_workers: int):
+        self.workers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="worker")
+        self.inference = ThreadPoolExecutor(max_workers=inference_workers, thread_name_prefix="inference")
+        self.tts = ThreadPoolExecutor(max_workers=tts_workers, thread_name_prefix="tts")
+        self.timer = Timer()
+        self.failures = 0
+        self.closed = False
+
+    def strand(self, executor: ThreadPoolExecutor) -> Strand:
+        return Strand(self, executor)
+
+    def call_at(self, when: float, fn, *args):
+        # fn runs on the timer thread and must only hand work to a strand
+        self.timer.call_at(when, fn, *args)
+
+    def shutdown(self):
+        # stops the timer first so nothing is resubmitted, then lets the running tasks finish;
+        # queued ones are cancelled
+        self.closed = True
+        self.timer.stop()
+        for executor in (self.workers, self.inference, self.tts):
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers._max_workers,
+            "inference_workers": self.inference._max_workers,
+            "tts_workers": self.tts._max_workers,
+            "threads": threading.active_count(),
+            "failures": self.failures,
+        }
+
+runtime = Runtime(settings.worker_threads, settings.inference_threads, settings.tts_threads)
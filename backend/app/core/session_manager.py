@@ -1,13 +1,16 @@
+import copy
 import asyncio
-from typing import Dict
+from typing import Dict, Set
 from concurrent.futures import ThreadPoolExecutor
 
 from config.settings import settings
+from . import metrics
 
 class SessionManager:
 
     def __init__(self):
         self.nerfreals: Dict[int, object] = {}
+        self.chat_tasks: Dict[int, Set[asyncio.Task]] = {}
         self.executor = ThreadPoolExecutor(max_workers=4)
 
     def create_session(self, sessionid: int):
@@ -16,19 +19,51 @@ class SessionManager:
     def session_exists(self, sessionid: int) -> bool:
         return sessionid in self.nerfreals and self.nerfreals[sessionid] is not None
 
+    def session_count(self) -> int:
+        return sum(1 for nerfreal in self.nerfreals.values() if nerfreal is not None)
+
+    def session_stats(self) -> dict:
+        return {
+            sessionid: {"tts": nerfreal.tts.stats(), "latency": nerfreal.tracer.percentiles(),
+                        "clock": nerfreal.clock.stats(), "broadcast": nerfreal.broadcast.stats(),
+                        "recording": nerfreal.recording_stats()}
+            for sessionid, nerfreal in list(self.nerfreals.items()) if nerfreal is not None
+        }
+
+    def chrome_trace(self, sessionid: int) -> dict:
+        if self.session_exists(sessionid):
+            return self.nerfreals[sessionid].tracer.chrome_trace(sessionid)
+        return None
+
     def cleanup_session(self, sessionid: int):
+        self.cancel_chat(sessionid)
         if sessionid in self.nerfreals:
-            del self.nerfreals[sessionid]
+            nerfreal = self.nerfreals.pop(sessionid)
+            if nerfreal is not None:
+                # watchers of the session see the end of the stream
+                nerfreal.broadcast.close()
+                nerfreal.release()
+
+    def stop_recordings(self):
+        # shutdown: the sessions stop feeding their recorders, then every file is finished
+        from ..push.record import stop_all
+
+        for nerfreal in list(self.nerfreals.values()):
+            if nerfreal is not None:
+                nerfreal.stop_recording()
+        stop_all()
 
     def build_nerfreal(self, sessionid: int):
         from ..services import model_service
 
-        settings.sessionid = sessionid
+        # a copy per session: the pool thread and /offer build concurrently
+        opt = copy.copy(settings)
+        opt.sessionid = sessionid
         if settings.model == 'wav2lip':
             raise NotImplementedError("Wav2Lip model not yet implemented")
         elif settings.model == 'musetalk':
             from ..models.musereal import MuseReal
-            nerfreal = MuseReal(settings, model_service.model, model_service.avatar)
+            nerfreal = MuseReal(opt, model_service.model, model_service.avatar)
         elif settings.model == 'ultralight':
             raise NotImplementedError("UltraLight model not yet implemented")
         else:
@@ -44,18 +79,27 @@ class SessionManager:
             self.nerfreals[sessionid].put_audio_file(audio_data)
 
     def handle_chat(self, sessionid: int, text: str):
+        # called from a request handler: the answer is streamed to tts in the background
         if self.session_exists(sessionid):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                from ..services.llm_service import llm_response
-                result = loop.run_until_complete(llm_response(text, self.nerfreals[sessionid]))
-                self.nerfreals[sessionid].put_msg_txt(result)
-            finally:
-                loop.close()
+            from ..services.llm_service import llm_response
+
+            task = asyncio.get_running_loop().create_task(llm_response(text, self.nerfreals[sessionid]))
+            tasks = self.chat_tasks.setdefault(sessionid, set())
+            tasks.add(task)
+            task.add_done_callback(lambda t: self._chat_done(sessionid, t))
+
+    def _chat_done(self, sessionid: int, task: asyncio.Task):
+        self.chat_tasks.get(sessionid, set()).discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"chat for session {sessionid} failed: {task.exception()!r}")
+
+    def cancel_chat(self, sessionid: int):
+        for task in list(self.chat_tasks.pop(sessionid, ())):
+            task.cancel()
 
     def interrupt_session(self, sessionid: int):
         if self.session_exists(sessionid):
+            self.cancel_chat(sessionid)
             self.nerfreals[sessionid].flush_talk()
 
     def set_audio_type(self, sessionid: int, audiotype: str, reinit: bool):
@@ -64,11 +108,13 @@ class SessionManager:
 
     def start_recording(self, sessionid: int):
         if self.session_exists(sessionid):
-            self.nerfreals[sessionid].start_recording()
+            return self.nerfreals[sessionid].start_recording()
+        return None
 
     def stop_recording(self, sessionid: int):
         if self.session_exists(sessionid):
-            self.nerfreals[sessionid].stop_recording()
+            return self.nerfreals[sessionid].stop_recording()
+        return None
 
     def is_speaking(self, sessionid: int) -> bool:
         if self.session_exists(sessionid):
@@ -76,3 +122,4 @@ class SessionManager:
         return False
 
 session_manager = SessionManager()
+metrics.register_session_gauges(session_manager)
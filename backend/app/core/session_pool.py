@@ -0,0 +1,110 @@
+import threading
+import time
+import traceback
+from collections import deque
+
+from config.settings import settings
+from .session_manager import session_manager
+
+
+class SessionPool:
+    # a failed build is retried after backoff seconds, doubling up to MAX_BACKOFF
+
+    BACKOFF = 1.0
+    MAX_BACKOFF = 60.0
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._quit = threading.Event()
+        self._thread = None
+
+        self.hits = 0
+        self.misses = 0
+        self.build_failures = 0
+        self.last_build_ms = 0.0
+        self.last_claim_ms = 0.0
+        self.total_claim_ms = 0.0
+        self.claims = 0
+
+    def start(self):
+        if self._thread is not None or self.size <= 0:
+            return
+        self._quit.clear()
+        self._thread = threading.Thread(target=self._run, name="session-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._quit.set()
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        with self._lock:
+            idle = list(self._idle)
+            self._idle.clear()
+        # never claimed, but they own video decoders and metric series like any session
+        for nerfreal in idle:
+            nerfreal.release()
+
+    def depth(self) -> int:
+        return len(self._idle)
+
+    def _run(self):
+        backoff = self.BACKOFF
+        while not self._quit.is_set():
+            failed = False
+            while self.depth() < self.size and not self._quit.is_set():
+                t = time.perf_counter()
+                try:
+                    nerfreal = session_manager.build_nerfreal(0)
+                except Exception as e:
+                    self.build_failures += 1
+                    failed = True
+                    print(f"session pool build failed, retrying in {backoff:.1f}s: {e!r}\n{traceback.format_exc()}")
+                    break
+                backoff = self.BACKOFF
+                self.last_build_ms = (time.perf_counter() - t) * 1000
+                with self._lock:
+                    self._idle.append(nerfreal)
+            if failed:
+                # a broken model or avatar fails every time: claims are not allowed to cut the
+                # wait short, /offer builds its sessions meanwhile
+                self._quit.wait(backoff)
+                backoff = min(backoff * 2, self.MAX_BACKOFF)
+            else:
+                self._wakeup.wait(timeout=1.0)
+            self._wakeup.clear()
+
+    def claim(self, sessionid: int):
+        with self._lock:
+            nerfreal = self._idle.popleft() if self._idle else None
+        self._wakeup.set()
+        if nerfreal is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        nerfreal.sessionid = sessionid
+        return nerfreal
+
+    def record_claim(self, seconds: float):
+        self.last_claim_ms = seconds * 1000
+        self.total_claim_ms += self.last_claim_ms
+        self.claims += 1
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "depth": self.depth(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "build_failures": self.build_failures,
+            "last_build_ms": round(self.last_build_ms, 2),
+            "last_claim_ms": round(self.last_claim_ms, 2),
+            "avg_claim_ms": round(self.total_claim_ms / self.claims, 2) if self.claims else 0.0,
+        }
+
+session_pool = SessionPool(settings.pool_size)
@@ -0,0 +1,64 @@
+import time
+import random
+import threading
+from collections import deque
+
+from . import metrics
+
+# a frame trace is a dict of perf_counter stamps: ingress (put_audio_frame), feat (features
+# queued), infer (unet/vae done), compose (pasted back) and egress (returned by the track)
+_SPANS = (("asr", "ingress", "feat"), ("inference", "feat", "infer"),
+          ("compose", "infer", "compose"), ("playout", "compose", "egress"))
+
+glass_to_glass_seconds = metrics.registry.register(metrics.Histogram(
+    'livetalking_glass_to_glass_seconds', 'Time from put_audio_frame to the lip-synced video frame leaving the track',
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)))
+
+
+class LatencyTracer:
+    # per session: every traced frame feeds the percentiles, a sample keeps its full trace
+
+    def __init__(self, sample_rate: float = 0.1, size: int = 2000):
+        self.sample_rate = sample_rate
+        self.latencies = deque(maxlen=size)
+        self.traces = deque(maxlen=size)
+        self.frames = 0
+        self._lock = threading.Lock()
+
+    def record(self, trace: dict):
+        if trace.get("egress") is None:
+            trace["egress"] = time.perf_counter()
+        latency = trace["egress"] - trace["ingress"]
+        glass_to_glass_seconds.observe(latency)
+        with self._lock:
+            self.frames += 1
+            self.latencies.append(latency)
+            if self.sample_rate > 0 and random.random() < self.sample_rate:
+                self.traces.append(dict(trace, frame=self.frames))
+
+    def percentiles(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return {"frames": self.frames, "p50_ms": None, "p90_ms": None, "p99_ms": None}
+        pick = lambda q: round(latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000, 1)
+        return {"frames": self.frames, "p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99)}
+
+    def chrome_trace(self, pid: int = 0) -> dict:
+        # load in chrome://tracing or perfetto: one lane per stage, one slice per sampled frame
+        with self._lock:
+            traces = list(self.traces)
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0,
+                   "args": {"name": f"session {pid}"}}]
+        for tid, (name, _, _) in enumerate(_SPANS, start=1):
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+        for trace in traces:
+            for tid, (name, start, end) in enumerate(_SPANS, start=1):
+                if trace.get(start) is None or trace.get(end) is None:
+                    continue
+                events.append({
+                    "name": name, "ph": "X", "pid": pid, "tid": tid,
+                    "ts": round(trace[start] * 1e6, 1), "dur": round((trace[end] - trace[start]) * 1e6, 1),
+                    "args": {"frame": trace["frame"]},
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class AudioBatch:
+    # the audio of one inference batch: every chunk in one float32 array, their types in an int8
+    # array and the few eventpoints by chunk index. Converted to int16 once for the whole batch,
+    # the tracks get views of it
+
+    __slots__ = ('pcm', 'types', 'eventpoints', '_pcm16', '_typelist')
+
+    def __init__(self, pcm: np.ndarray, types: np.ndarray, eventpoints: dict):
+        self.pcm = pcm
+        self.types = types
+        self.eventpoints = eventpoints
+        self._pcm16 = None
+        self._typelist = None
+
+    @classmethod
+    def from_chunks(cls, chunks, epoch: int):
+        # (frame, type, eventpoint, epoch, stamp) items off the asr output queue; audio of an
+        # older epoch was still in the delay line when the talk was interrupted and is silenced.
+        # A short chunk (the tail of a custom audio stream) is padded
+        frames = [chunk[0] for chunk in chunks]
+        width = max(frame.shape[0] for frame in frames)
+        if all(frame.shape[0] == width for frame in frames):
+            pcm = np.array(frames, dtype=np.float32)
+        else:
+            pcm = np.zeros((len(frames), width), dtype=np.float32)
+            for index, frame in enumerate(frames):
+                pcm[index, :frame.shape[0]] = frame
+        types = np.array([chunk[1] for chunk in chunks], dtype=np.int8)
+        eventpoints = {}
+        for index, (_, _, eventpoint, chunk_epoch, _) in enumerate(chunks):
+            if chunk_epoch != epoch:
+                pcm[index] = 0
+                types[index] = 1
+            elif eventpoint:
+                eventpoints[index] = eventpoint
+        return cls(pcm, types, eventpoints)
+
+    @property
+    def pcm16(self) -> np.ndarray:
+        if self._pcm16 is None:
+            self._pcm16 = (self.pcm * 32767).astype(np.int16)
+        return self._pcm16
+
+    @property
+    def typelist(self) -> list:
+        # plain ints for per-frame checks, cheaper than indexing the array
+        if self._typelist is None:
+            self._typelist = self.types.tolist()
+        return self._typelist
+
+    def span(self, start: int, count: int = 2) -> 'AudioSpan':
+        return AudioSpan(self, start, count)
+
+    def __len__(self) -> int:
+        return self.types.shape[0]
+
+
+class AudioSpan:
+    # the chunks played with one video frame, two per frame
+
+    __slots__ = ('batch', 'start', 'count')
+
+    def __init__(self, batch: AudioBatch, start: int, count: int):
+        self.batch = batch
+        self.start = start
+        self.count = count
+
+    @property
+    def silent(self) -> bool:
+        # no chunk carries speech (type 0): the frame shows the idle or custom image
+        return 0 not in self.batch.typelist[self.start:self.start + self.count]
+
+    @property
+    def type(self) -> int:
+        return self.batch.typelist[self.start]
+
+    def frames(self):
+        # (int16 samples, eventpoint) per chunk; the samples are views into the batch
+        pcm16 = self.batch.pcm16
+        eventpoints = self.batch.eventpoints
+        for index in range(self.start, self.start + self.count):
+            yield pcm16[index], eventpoints.get(index)
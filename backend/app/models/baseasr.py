@@ -1,11 +1,8 @@
 import time
 import numpy as np
-from scipy import signal
-from scipy.fft import rfft, rfftfreq
 
 import queue
 from queue import Queue
-import torch.multiprocessing as mp
 
 from .basereal import BaseReal
 
@@ -19,15 +16,19 @@ class BaseASR:
         self.sample_rate = 16000
         self.chunk = self.sample_rate // self.fps
         self.queue = Queue()
-        self.output_queue = mp.Queue()
+        self.output_queue = Queue()
+        # how long a step waits for pushed audio before using silence; 0 on the shared runtime
+        self.audio_wait = 0.01
 
         self.batch_size = opt.batch_size
         self.audio_gain = getattr(opt, 'audio_gain', 1.0)
 
         self.frames = []
+        self.feats = []
         self.stride_left_size = opt.l
         self.stride_right_size = opt.r
-        self.feat_queue = mp.Queue(8)
+        self.feat_queue = Queue(8)
+        self.epoch = 0
 
         self.vad_state = False
         self.vad_hysteresis_counter = 0
@@ -36,10 +37,23 @@ class BaseASR:
     def flush_talk(self):
         self.queue.queue.clear()
 
-    def put_audio_frame(self,audio_chunk,datainfo:dict):
-        self.queue.put((audio_chunk,datainfo))
+    def put_audio_frame(self,audio_chunk,datainfo:dict,feat=None,epoch:int=0,stamp:float=None):
+        self.queue.put((audio_chunk,datainfo,feat,epoch,stamp))
+
+    def sync_epoch(self) -> int:
+        # a new epoch means the talk was interrupted: forget the stale speech context
+        epoch = self.parent.epoch if self.parent is not None else 0
+        if epoch != self.epoch:
+            self.epoch = epoch
+            self.frames = [np.zeros(self.chunk, dtype=np.float32)] * len(self.frames)
+            self.feats = [None] * len(self.feats)
+            self.vad_state = False
+            self.vad_hysteresis_counter = 0
+        return epoch
 
     def detect_voice_activity(self, frame):
+        from scipy.fft import rfft, rfftfreq
+
         rms = np.sqrt(np.mean(frame**2))
         if rms < 0.005:
             return False
@@ -80,7 +94,9 @@ class BaseASR:
 
     def get_audio_frame(self):
         try:
-            frame,eventpoint = self.queue.get(block=True,timeout=0.01)
+            frame,eventpoint,feat,epoch,stamp = self.queue.get(block=self.audio_wait>0,timeout=self.audio_wait)
+            while epoch < self.epoch:
+                frame,eventpoint,feat,epoch,stamp = self.queue.get_nowait()
             if self.audio_gain != 1.0:
                 frame = frame * self.audio_gain
                 max_val = np.abs(frame).max()
@@ -121,17 +137,20 @@ class BaseASR:
                 frame = np.zeros(self.chunk, dtype=np.float32)
                 type = 1
             eventpoint = None
+            feat = None
+            stamp = None
 
-        return frame,type,eventpoint 
+        return frame,type,eventpoint,feat,stamp
 
     def get_audio_out(self): 
         return self.output_queue.get()
     
     def warm_up(self):
         for _ in range(self.stride_left_size + self.stride_right_size):
-            audio_frame,type,eventpoint=self.get_audio_frame()
+            audio_frame,type,eventpoint,feat,stamp=self.get_audio_frame()
             self.frames.append(audio_frame)
-            self.output_queue.put((audio_frame,type,eventpoint))
+            self.feats.append(feat)
+            self.output_queue.put((audio_frame,type,eventpoint,self.epoch,stamp))
         for _ in range(self.stride_left_size):
             self.output_queue.get()
 
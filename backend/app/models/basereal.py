@@ -1,35 +1,69 @@
 import math
-import torch
 import numpy as np
 
-import subprocess
 import os
 import time
-import cv2
 import glob
-import resampy
 
 import queue
 from queue import Queue
-from threading import Thread, Event
+from threading import Thread, Event, Lock
 from io import BytesIO
-import soundfile as sf
+from types import MappingProxyType
 
-import asyncio
-from av import AudioFrame, VideoFrame
-
-import av
 from fractions import Fraction
 
+from ..core import metrics
+from ..core.broadcast import Broadcast
+from ..core.clock import MasterClock
+from ..core.handoff import Handoff
+from ..core.tracing import LatencyTracer
+
 
-from tqdm import tqdm
 def read_imgs(img_list):
+    import cv2
+    from tqdm import tqdm
+
     frames = []  
     for img_path in tqdm(img_list):
         frame = cv2.imread(img_path)
         frames.append(frame)
     return frames
 
+class CustomAssets:
+    def __init__(self, customopt):
+        img_cycle = {}
+        audio_cycle = {}
+        opt = {}
+        import soundfile as sf
+
+        for item in customopt:
+            input_img_list = glob.glob(os.path.join(item['imgpath'], '*.[jpJP][pnPN]*[gG]'))
+            input_img_list = sorted(input_img_list, key=lambda x: int(os.path.splitext(os.path.basename(x))[0]))
+            frames = read_imgs(input_img_list)
+            for frame in frames:
+                frame.setflags(write=False)
+            stream, sample_rate = sf.read(item['audiopath'], dtype='float32')
+            stream.setflags(write=False)
+            img_cycle[item['audiotype']] = tuple(frames)
+            audio_cycle[item['audiotype']] = stream
+            opt[item['audiotype']] = MappingProxyType(dict(item))
+        self.img_cycle = MappingProxyType(img_cycle)
+        self.audio_cycle = MappingProxyType(audio_cycle)
+        self.opt = MappingProxyType(opt)
+
+_custom_assets = {}
+_custom_assets_lock = Lock()
+
+def load_custom_assets(customopt) -> CustomAssets:
+    key = tuple((item['audiotype'], item['imgpath'], item['audiopath']) for item in customopt)
+    with _custom_assets_lock:
+        assets = _custom_assets.get(key)
+        if assets is None:
+            assets = CustomAssets(customopt)
+            _custom_assets[key] = assets
+        return assets
+
 def play_audio(quit_event,queue):        
     import pyaudio
     p = pyaudio.PyAudio()
@@ -50,44 +84,78 @@ class BaseReal:
         self.opt = opt
         self.sample_rate = 16000
         self.chunk = self.sample_rate // opt.fps
-        self.sessionid = self.opt.sessionid
+        self._sessionid = self.opt.sessionid
 
         self.speaking = False
-
+        # bumped by flush_talk, every stage drops work tagged with an older epoch
+        self.epoch = 0
+        self.tracer = LatencyTracer(getattr(opt, 'trace_sample', 0.1))
+        # paces the render thread and both tracks from one timeline
+        self.clock = MasterClock(opt.fps, self.sessionid, getattr(opt, 'clock_max_late', 0.2))
+        # watch-only viewers get a copy of every frame the session plays out
+        self.broadcast = Broadcast(self.sessionid)
+
+        # composed frames wait in the track queues; remembered so flush_talk can drop them
+        self.output_loop = None
+        self.output_tracks = ()
+        self.output_lock = Lock()
+        # batches the puts into the track queues, one loop wakeup per batch
+        self.handoff = None
+
+        # frames are handed to the recorder thread, see start_recording
         self.recording = False
-        self._record_video_pipe = None
-        self._record_audio_pipe = None
-        self.width = self.height = 0
+        self.recorder = None
+        # position in the mirrored idle loop of the frame just composed, None unless untouched
+        self.idle_position = None
+        # 'packets' when the output tracks encode themselves and the recorder can remux their bitstream
+        self.record_source = 'frames'
 
         self.curr_state=0
-        self.custom_img_cycle = {}
-        self.custom_audio_cycle = {}
-        self.custom_audio_index = {}
-        self.custom_index = {}
-        self.custom_opt = {}
-        self.__loadcustom()
+        self.custom_assets = load_custom_assets(self.opt.customopt)
+        self.custom_img_cycle = self.custom_assets.img_cycle
+        self.custom_audio_cycle = self.custom_assets.audio_cycle
+        self.custom_opt = self.custom_assets.opt
+        self.custom_audio_index = {audiotype: 0 for audiotype in self.custom_audio_cycle}
+        self.custom_index = {audiotype: 0 for audiotype in self.custom_img_cycle}
         
-        self.video_cap = None
+        # LIVETALKING_VIDEO: idle frames come from a decoder thread or a shared in-memory clip
+        self.video_source = None
         self.video_path = os.path.expanduser(getattr(opt, 'video', ''))
-        self.video_frame_index = 0
-        self.video_total_frames = 0
         if self.video_path and os.path.exists(self.video_path):
-            self.video_cap = cv2.VideoCapture(self.video_path)
-            if not self.video_cap.isOpened():
-                self.video_cap = None
-            else:
-                self.video_total_frames = int(self.video_cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        
+            from .videosource import open_video
+            self.video_source = open_video(self.video_path, self.sessionid,
+                                           getattr(opt, 'video_memory_mb', 256), getattr(opt, 'video_ring', 50))
+
+    @property
+    def sessionid(self):
+        return self._sessionid
+
+    @sessionid.setter
+    def sessionid(self, sessionid):
+        # a pooled session is built before its id is known: the parts that label metrics and
+        # stats with it follow the id it is claimed under
+        self._sessionid = sessionid
+        self.clock.sessionid = sessionid
+        self.broadcast.sessionid = sessionid
+        if self.video_source is not None:
+            self.video_source.sessionid = sessionid
 
     def __del__(self):
-        if hasattr(self, 'video_cap') and self.video_cap is not None:
-            self.video_cap.release()
+        if getattr(self, 'video_source', None) is not None:
+            self.video_source.close()
+
+    def release(self):
+        # the session is over: finish its recording, stop its video decoder and drop its metric series
+        self.stop_recording()
+        if self.video_source is not None:
+            self.video_source.close()
+        metrics.registry.remove_session(self.sessionid)
 
     def put_msg_txt(self,msg,datainfo:dict={}):
         self.tts.put_msg_txt(msg,datainfo)
     
-    def put_audio_frame(self,audio_chunk,datainfo:dict={}): #16khz 20ms pcm
-        self.asr.put_audio_frame(audio_chunk,datainfo)
+    def put_audio_frame(self,audio_chunk,datainfo:dict={},feat=None,epoch:int=None): #16khz 20ms pcm
+        self.asr.put_audio_frame(audio_chunk,datainfo,feat,self.epoch if epoch is None else epoch,time.perf_counter())
 
     def put_audio_file(self,filebyte,datainfo:dict={}):
         input_stream = BytesIO(filebyte)
@@ -113,6 +181,9 @@ class BaseReal:
             pass
     
     def __create_bytes_stream(self,byte_stream):
+        import soundfile as sf
+        import resampy
+
         stream, sample_rate = sf.read(byte_stream)
         stream = stream.astype(np.float32)
 
@@ -125,22 +196,40 @@ class BaseReal:
         return stream
 
     def flush_talk(self):
+        self.epoch += 1
         self.tts.flush_talk()
         self.asr.flush_talk()
+        self.drop_rendered()
+
+    def drop_rendered(self):
+        # the lock keeps whole video+audio bundles on one side of the drop so a/v stay aligned
+        if self.output_loop is None:
+            return
+        with self.output_lock:
+            if self.handoff is not None:
+                self.handoff.discard(self.output_tracks)
+
+    def queue_depths(self) -> dict:
+        depths = {
+            "tts": self.tts.msgqueue.qsize(),
+            "asr": self.asr.queue.qsize(),
+        }
+        for name, q in (("feat", self.asr.feat_queue), ("audio_out", self.asr.output_queue),
+                        ("res_frame", getattr(self, 'res_frame_queue', None))):
+            if q is not None:
+                try:
+                    depths[name] = q.qsize()
+                except NotImplementedError:
+                    pass
+        for track in self.output_tracks:
+            depths[f"{track.kind}_track"] = track._queue.qsize()
+        if self.handoff is not None:
+            depths["handoff"] = self.handoff.backlog()
+        return depths
 
     def is_speaking(self)->bool:
         return self.speaking
     
-    def __loadcustom(self):
-        for item in self.opt.customopt:
-            input_img_list = glob.glob(os.path.join(item['imgpath'], '*.[jpJP][pnPN]*[gG]'))
-            input_img_list = sorted(input_img_list, key=lambda x: int(os.path.splitext(os.path.basename(x))[0]))
-            self.custom_img_cycle[item['audiotype']] = read_imgs(input_img_list)
-            self.custom_audio_cycle[item['audiotype']], sample_rate = sf.read(item['audiopath'], dtype='float32')
-            self.custom_audio_index[item['audiotype']] = 0
-            self.custom_index[item['audiotype']] = 0
-            self.custom_opt[item['audiotype']] = item
-
     def init_customindex(self):
         self.curr_state=0
         for key in self.custom_audio_index:
@@ -152,155 +241,44 @@ class BaseReal:
         pass
 
     def start_recording(self):
-        if self.recording:
-            return
-
-        acommand = ['ffmpeg',
-                    '-y', '-vn',
-                    '-f', 's16le',
-                    '-ac', '1',
-                    '-ar', '16000',
-                    '-i', '-',
-                    '-acodec', 'aac',
-                    f'temp{self.opt.sessionid}.aac']
-        self._record_audio_pipe = subprocess.Popen(acommand, shell=False, stdin=subprocess.PIPE)
-
+        from ..push.record import Recorder
+
+        if self.recorder is not None and self.recorder.active:
+            return self.recorder.path
+        directory = getattr(self.opt, 'record_dir', './data/record')
+        path = os.path.join(directory, f"{self.sessionid}-{time.strftime('%Y%m%d-%H%M%S')}.mp4")
+        self.recorder = Recorder(path, self.sessionid, 1 / self.clock.video_ptime,
+                                 getattr(self.opt, 'push_bitrate', 2000000),
+                                 getattr(self.opt, 'record_queue_size', 100),
+                                 getattr(self.opt, 'record_drop_policy', 'newest'),
+                                 self.record_source)
+        self.recorder.start()
         self.recording = True
-    
+        return path
+
     def record_video_data(self,image):
-        if self.width == 0:
-            self.height,self.width,_ = image.shape
-
-        if self.recording:
-            if self._record_video_pipe is None:
-                command = ['ffmpeg',
-                          '-y', '-an',
-                          '-f', 'rawvideo',
-                          '-vcodec','rawvideo',
-                          '-pix_fmt', 'bgr24',
-                          '-s', "{}x{}".format(self.width, self.height),
-                          '-r', str(25),
-                          '-i', '-',
-                          '-pix_fmt', 'yuv420p',
-                          '-vcodec', "h264",
-                          f'temp{self.opt.sessionid}.mp4']
-                self._record_video_pipe = subprocess.Popen(command, shell=False, stdin=subprocess.PIPE)
-
-            self._record_video_pipe.stdin.write(image.tobytes())
+        if self.recording and self.recorder.source == 'frames':
+            self.recorder.put_video(image)
 
     def record_audio_data(self,frame):
-        if self.recording and self._record_audio_pipe is not None:
-            try:
-                if not isinstance(frame, np.ndarray):
-                    return
-                if frame.size == 0:
-                    return
-                if frame.dtype != np.int16:
-                    frame = frame.astype(np.int16)
-                data = frame.tobytes()
-                self._record_audio_pipe.stdin.write(data)
-                self._record_audio_pipe.stdin.flush()
-            except (BrokenPipeError, OSError) as e:
-                self.recording = False
-            except Exception as e:
-                self.recording = False
-		
+        if self.recording and self.recorder.source == 'frames':
+            self.recorder.put_audio(frame)
+
+    def record_track_data(self,kind,data,position):
+        # what the tracks send, stamped with its slot on the session clock
+        if self.recording and self.recorder.source == 'packets':
+            self.recorder.put(kind, data, position)
+
     def stop_recording(self):
+        # the recorder finishes the file on its own thread, nothing here waits for the disk
         if not self.recording:
-            return
-        self.recording = False 
-        
-        try:
-            if self._record_video_pipe is not None:
-                self._record_video_pipe.stdin.flush()
-                self._record_video_pipe.stdin.close()
-                self._record_video_pipe.wait()
-        except Exception as e:
-            pass
-        
-        try:
-            self._record_audio_pipe.stdin.flush()
-            self._record_audio_pipe.stdin.close()
-            self._record_audio_pipe.wait()
-        except Exception as e:
-            pass
-        
-        audio_file = f'temp{self.opt.sessionid}.aac'
-        video_file = f'temp{self.opt.sessionid}.mp4'
-        output_file = 'data/record.mp4'
-        
-        if not os.path.exists(audio_file):
-            return
-        if not os.path.exists(video_file):
-            return
-        
-        audio_file_size = os.path.getsize(audio_file) if os.path.exists(audio_file) else 0
-        if audio_file_size == 0:
-            try:
-                probe_cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', video_file]
-                result = subprocess.run(probe_cmd, capture_output=True, text=True, check=True)
-                video_duration = float(result.stdout.strip())
-                
-                silent_audio_file = f'temp{self.opt.sessionid}_silent.aac'
-                silent_cmd = [
-                    'ffmpeg', '-y', '-f', 'lavfi',
-                    '-i', f'anullsrc=channel_layout=mono:sample_rate=16000',
-                    '-t', str(video_duration),
-                    '-c:a', 'aac',
-                    '-b:a', '128k',
-                    silent_audio_file
-                ]
-                subprocess.run(silent_cmd, capture_output=True, text=True, check=True)
-                audio_file = silent_audio_file
-            except Exception as e:
-                pass
-                
-        if os.path.getsize(video_file) == 0:
-            return
-        
-        os.makedirs('data', exist_ok=True)
-        
-        cmd_combine = [
-            'ffmpeg', '-y',
-            '-i', video_file,
-            '-i', audio_file,
-            '-c:v', 'copy',
-            '-c:a', 'aac',
-            '-b:a', '128k',
-            '-shortest',
-            '-map', '0:v:0',
-            '-map', '1:a:0',
-            output_file
-        ]
-        
-        try:
-            result = subprocess.run(cmd_combine, capture_output=True, text=True, check=True)
-        except subprocess.CalledProcessError as e:
-            cmd_combine_fallback = [
-                'ffmpeg', '-y',
-                '-i', video_file,
-                '-i', audio_file,
-                '-c:v', 'copy',
-                '-c:a', 'aac',
-                '-b:a', '128k',
-                '-shortest',
-                output_file
-            ]
-            try:
-                result = subprocess.run(cmd_combine_fallback, capture_output=True, text=True, check=True)
-            except subprocess.CalledProcessError as e2:
-                cmd_video_only = [
-                    'ffmpeg', '-y',
-                    '-i', video_file,
-                    '-c:v', 'copy',
-                    output_file
-                ]
-                try:
-                    result = subprocess.run(cmd_video_only, capture_output=True, text=True, check=True)
-                except subprocess.CalledProcessError as e3:
-                    pass
-        except Exception as e:
-            pass
+            return None
+        self.recording = False
+        self.recorder.close()
+        return self.recorder.path
+
+    def recording_stats(self):
+        return self.recorder.stats() if self.recorder is not None else None
 
     def mirror_index(self,size, index):
         turn = index // size
@@ -326,112 +304,128 @@ class BaseReal:
             self.custom_audio_index[audiotype] = 0
             self.custom_index[audiotype] = 0
             
+    def loop_position(self, idx, previous):
+        # position of frame_list_cycle[idx] in the mirrored idle loop, continuing from the previous
+        # idle frame; the same image is played once forwards and once backwards per loop
+        size = len(self.frame_list_cycle)
+        if previous is not None:
+            position = (previous + 1) % (2 * size)
+            if self.mirror_index(size, position) == idx:
+                return position
+        return idx
+
+    def compose_frame(self,res_frame,idx,audio):
+        # the frame to show for one rendered face: the idle/custom video while silent, the pasted back face otherwise
+        previous, self.idle_position = self.idle_position, None
+        if audio.silent:
+            self.speaking = False
+            audiotype = audio.type
+            
+            target_frame = self.video_source.read() if self.video_source is not None else None
+            if target_frame is not None:
+                return target_frame
+            if self.custom_index.get(audiotype) is not None:
+                mirindex = self.mirror_index(len(self.custom_img_cycle[audiotype]),self.custom_index[audiotype])
+                target_frame = self.custom_img_cycle[audiotype][mirindex]
+                self.custom_index[audiotype] += 1
+            else:
+                target_frame = self.frame_list_cycle[idx]
+                self.idle_position = self.loop_position(idx, previous)
+            return target_frame
+        self.speaking = True
+        try:
+            with metrics.paste_back_seconds.time():
+                return self.paste_back_frame(res_frame,idx)
+        except Exception as e:
+            metrics.dropped_frames.inc(1, self.sessionid, 'paste_back')
+            return None
+
+    def output_frame(self,item,loop,audio_track,video_track):
+        # compose one item of res_frame_queue and hand the video frame and its audio to the tracks
+        from av import AudioFrame, VideoFrame
+
+        res_frame,idx,audio,epoch,trace = item
+        if epoch != self.epoch:
+            metrics.dropped_frames.inc(1, self.sessionid, 'interrupted')
+            return
+        combine_frame = self.compose_frame(res_frame,idx,audio)
+        if combine_frame is None:
+            return
+
+        send_start = time.perf_counter()
+        if trace is not None:
+            trace["compose"] = send_start
+        with self.output_lock:
+            if epoch != self.epoch:
+                metrics.dropped_frames.inc(1, self.sessionid, 'interrupted')
+                return
+            if self.idle_position is not None and getattr(video_track, 'idle_cache', False):
+                # the track replays this frame from its pre-encoded idle loop
+                from ..webrtc.idle import IdleFrame
+                new_frame = IdleFrame(self.frame_list_cycle, self.idle_position)
+            else:
+                new_frame = VideoFrame.from_ndarray(combine_frame, format="bgr24")
+            items = [(video_track._queue, (new_frame,None,trace))]
+            self.record_video_data(combine_frame)
+
+            for frame,eventpoint in audio.frames():
+                new_frame = AudioFrame(format='s16', layout='mono', samples=frame.shape[0])
+                new_frame.planes[0].update(frame)
+                new_frame.sample_rate=16000
+                items.append((audio_track._queue, (new_frame,eventpoint,None)))
+                self.record_audio_data(frame)
+            if self.handoff is None or self.handoff.loop is not loop:
+                self.handoff = Handoff(loop)
+            self.handoff.put(items)
+        metrics.track_send_seconds.observe(time.perf_counter() - send_start)
+
     def process_frames(self,quit_event,loop=None,audio_track=None,video_track=None):
-        enable_transition = False
-        
-        if enable_transition:
-            _last_speaking = False
-            _transition_start = time.time()
-            _transition_duration = 0.1
-            _last_silent_frame = None
-            _last_speaking_frame = None
-        
-        if self.opt.transport=='virtualcam':
-            import pyvirtualcam
-            vircam = None
+        if self.opt.transport!='virtualcam':
+            if loop is not None:
+                self.output_loop = loop
+                self.output_tracks = tuple(track for track in (video_track, audio_track) if track is not None)
+            while not quit_event.is_set():
+                try:
+                    item = self.res_frame_queue.get(block=True, timeout=1)
+                except queue.Empty:
+                    continue
+                self.output_frame(item,loop,audio_track,video_track)
+            return
+
+        import pyvirtualcam
+        vircam = None
 
-            audio_tmp = queue.Queue(maxsize=3000)
-            audio_thread = Thread(target=play_audio, args=(quit_event,audio_tmp,), daemon=True, name="pyaudio_stream")
-            audio_thread.start()
+        audio_tmp = queue.Queue(maxsize=3000)
+        audio_thread = Thread(target=play_audio, args=(quit_event,audio_tmp,), daemon=True, name="pyaudio_stream")
+        audio_thread.start()
         
         while not quit_event.is_set():
             try:
-                res_frame,idx,audio_frames = self.res_frame_queue.get(block=True, timeout=1)
+                res_frame,idx,audio,epoch,trace = self.res_frame_queue.get(block=True, timeout=1)
             except queue.Empty:
                 continue
-            
-            if enable_transition:
-                current_speaking = not (audio_frames[0][1]!=0 and audio_frames[1][1]!=0)
-                if current_speaking != _last_speaking:
-                    _transition_start = time.time()
-                _last_speaking = current_speaking
-
-            if audio_frames[0][1]!=0 and audio_frames[1][1]!=0:
-                self.speaking = False
-                audiotype = audio_frames[0][1]
-                
-                if self.video_cap is not None and self.video_cap.isOpened():
-                    ret, target_frame = self.video_cap.read()
-                    if not ret:
-                        self.video_cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                        ret, target_frame = self.video_cap.read()
-                        if not ret:
-                            if self.custom_index.get(audiotype) is not None:
-                                mirindex = self.mirror_index(len(self.custom_img_cycle[audiotype]),self.custom_index[audiotype])
-                                target_frame = self.custom_img_cycle[audiotype][mirindex]
-                                self.custom_index[audiotype] += 1
-                            else:
-                                target_frame = self.frame_list_cycle[idx]
-                    self.video_frame_index += 1
-                elif self.custom_index.get(audiotype) is not None:
-                    mirindex = self.mirror_index(len(self.custom_img_cycle[audiotype]),self.custom_index[audiotype])
-                    target_frame = self.custom_img_cycle[audiotype][mirindex]
-                    self.custom_index[audiotype] += 1
-                else:
-                    target_frame = self.frame_list_cycle[idx]
-                
-                if enable_transition:
-                    if time.time() - _transition_start < _transition_duration and _last_speaking_frame is not None:
-                        alpha = min(1.0, (time.time() - _transition_start) / _transition_duration)
-                        combine_frame = cv2.addWeighted(_last_speaking_frame, 1-alpha, target_frame, alpha, 0)
-                    else:
-                        combine_frame = target_frame
-                    _last_silent_frame = combine_frame.copy()
-                else:
-                    combine_frame = target_frame
-            else:
-                self.speaking = True
-                try:
-                    current_frame = self.paste_back_frame(res_frame,idx)
-                except Exception as e:
+            if epoch != self.epoch:
+                metrics.dropped_frames.inc(1, self.sessionid, 'interrupted')
+                continue
+            combine_frame = self.compose_frame(res_frame,idx,audio)
+            if combine_frame is None:
+                continue
+
+            with self.output_lock:
+                if epoch != self.epoch:
+                    metrics.dropped_frames.inc(1, self.sessionid, 'interrupted')
                     continue
-                if enable_transition:
-                    if time.time() - _transition_start < _transition_duration and _last_silent_frame is not None:
-                        alpha = min(1.0, (time.time() - _transition_start) / _transition_duration)
-                        combine_frame = cv2.addWeighted(_last_silent_frame, 1-alpha, current_frame, alpha, 0)
-                    else:
-                        combine_frame = current_frame
-                    _last_speaking_frame = combine_frame.copy()
-                else:
-                    combine_frame = current_frame
-
-            if self.opt.transport=='virtualcam':
                 if vircam==None:
                     height, width,_= combine_frame.shape
                     vircam = pyvirtualcam.Camera(width=width, height=height, fps=25, fmt=pyvirtualcam.PixelFormat.BGR,print_fps=True)
                 vircam.send(combine_frame)
-            else:
-                image = combine_frame
-                new_frame = VideoFrame.from_ndarray(image, format="bgr24")
-                asyncio.run_coroutine_threadsafe(video_track._queue.put((new_frame,None)), loop)
-            self.record_video_data(combine_frame)
+                self.record_video_data(combine_frame)
 
-            for audio_frame in audio_frames:
-                frame,type,eventpoint = audio_frame
-                frame = (frame * 32767).astype(np.int16)
-
-                if self.opt.transport=='virtualcam':
+                for frame,eventpoint in audio.frames():
                     audio_tmp.put(frame.tobytes())
-                else:
-                    new_frame = AudioFrame(format='s16', layout='mono', samples=frame.shape[0])
-                    new_frame.planes[0].update(frame.tobytes())
-                    new_frame.sample_rate=16000
-                    asyncio.run_coroutine_threadsafe(audio_track._queue.put((new_frame,eventpoint)), loop)
-                self.record_audio_data(frame)
-            if self.opt.transport=='virtualcam':
-                vircam.sleep_until_next_frame()
-        if self.opt.transport=='virtualcam':
-            audio_thread.join()
-            vircam.close()
+                    self.record_audio_data(frame)
+            vircam.sleep_until_next_frame()
+        audio_thread.join()
+        vircam.close()
     
         
\ No newline at end of file
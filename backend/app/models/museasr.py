@@ -1,28 +1,60 @@
 import time
+from typing import TYPE_CHECKING
+
 import numpy as np
 
 import queue
 from queue import Queue
+from ..core import metrics
 from .baseasr import BaseASR
-from musetalk.whisper.audio2feature import Audio2Feature
+
+if TYPE_CHECKING:
+    from musetalk.whisper.audio2feature import Audio2Feature
 
 class MuseASR(BaseASR):
-    def __init__(self, opt, parent,audio_processor:Audio2Feature):
+    def __init__(self, opt, parent,audio_processor:'Audio2Feature'):
         super().__init__(opt,parent)
         self.audio_processor = audio_processor
+        self.cached_steps = 0
 
     def run_step(self):
-        start_time = time.time()
+        # threads runtime: collect and encode on the render thread
+        step = self.collect()
+        if step is not None:
+            self.feat_queue.put(self.encode(step))
+
+    def collect(self):
+        # moves one batch of audio through the delay line and returns the window to encode, None
+        # while the context is still filling
+        start = time.perf_counter()
+        epoch = self.sync_epoch()
         for _ in range(self.batch_size*2):
-            audio_frame,type,eventpoint = self.get_audio_frame()
+            audio_frame,type,eventpoint,feat,stamp = self.get_audio_frame()
             self.frames.append(audio_frame)
-            self.output_queue.put((audio_frame,type,eventpoint))
+            self.feats.append(feat)
+            self.output_queue.put((audio_frame,type,eventpoint,epoch,stamp))
         
         if len(self.frames) <= self.stride_left_size + self.stride_right_size:
-            return
+            return None
         
-        inputs = np.concatenate(self.frames)
-        whisper_feature = self.audio_processor.audio2feat(inputs)
-        whisper_chunks = self.audio_processor.feature2chunks(feature_array=whisper_feature,fps=self.fps/2,batch_size=self.batch_size,start=self.stride_left_size/2 )
-        self.feat_queue.put(whisper_chunks)
+        # every frame in the window came with cached whisper features, or the pcm is encoded
+        cached = all(feat is not None for feat in self.feats)
+        window = np.concatenate(self.feats if cached else self.frames)
         self.frames = self.frames[-(self.stride_left_size + self.stride_right_size):]
+        self.feats = self.feats[-(self.stride_left_size + self.stride_right_size):]
+        return window, cached, epoch, time.perf_counter() - start
+
+    def encode(self, step):
+        # the whisper call; the pool runtime runs it on the inference executor
+        window, cached, epoch, collect_seconds = step
+        start = time.perf_counter()
+        if cached:
+            whisper_feature = window
+            self.cached_steps += 1
+        else:
+            with metrics.whisper_encode_seconds.time():
+                whisper_feature = self.audio_processor.audio2feat(window)
+        whisper_chunks = self.audio_processor.feature2chunks(feature_array=whisper_feature,fps=self.fps/2,batch_size=self.batch_size,start=self.stride_left_size/2 )
+        # collect and encode only, not the wait between them or for the feature queue
+        metrics.asr_step_seconds.observe(collect_seconds + time.perf_counter() - start)
+        return whisper_chunks, epoch, time.perf_counter()
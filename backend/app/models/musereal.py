@@ -2,10 +2,8 @@ import math
 import torch
 import numpy as np
 
-import subprocess
 import os
 import time
-import torch.nn.functional as F
 import cv2
 import glob
 import pickle
@@ -13,29 +11,51 @@ import copy
 
 import queue
 from queue import Queue
-from threading import Thread, Event
+from threading import Thread, Event, Lock
 import torch.multiprocessing as mp
 
-from musetalk.utils.utils import get_file_type,get_video_fps,datagen
 from musetalk.myutil import get_image_blending
-from musetalk.utils.utils import load_all_model
-from musetalk.whisper.audio2feature import Audio2Feature
 
+from config.settings import settings
+from ..core import metrics
+from . import snapshot
 from .museasr import MuseASR
-import asyncio
-from av import AudioFrame, VideoFrame
-from .basereal import BaseReal
+from .ttsreal import build_tts
+from .basereal import BaseReal, read_imgs
+from .audiobatch import AudioBatch
 
-from tqdm import tqdm
+def get_device():
+    return torch.device("cuda" if torch.cuda.is_available() else ("mps" if (hasattr(torch.backends, "mps") and torch.backends.mps.is_available()) else "cpu"))
+
+def load_vae(use_snapshot=True):
+    if use_snapshot and snapshot.has_component(settings.snapshot_dir, "vae"):
+        return snapshot.load_vae(settings.snapshot_dir, get_device())
+    from musetalk.models.vae import VAE
+    vae = VAE(model_path=os.path.join("models", "sd-vae"))
+    vae.vae = vae.vae.half().to(get_device())
+    return vae
+
+def load_unet(use_snapshot=True):
+    from musetalk.models.unet import UNet,PositionalEncoding
+    pe = PositionalEncoding(d_model=384).half().to(get_device())
+    if use_snapshot and snapshot.has_component(settings.snapshot_dir, "unet"):
+        return snapshot.load_unet(settings.snapshot_dir, get_device()), pe
+    unet = UNet(unet_config=os.path.join("models", "musetalkV15", "musetalk.json"),
+                model_path=os.path.join("models", "musetalkV15", "unet.pth"))
+    unet.model = unet.model.half().to(get_device())
+    return unet, pe
+
+def load_whisper(use_snapshot=True):
+    if use_snapshot and snapshot.has_component(settings.snapshot_dir, "whisper"):
+        return snapshot.load_whisper(settings.snapshot_dir, get_device())
+    from musetalk.whisper.audio2feature import Audio2Feature
+    return Audio2Feature(model_path="./models/whisper")
 
 def load_model():
-    vae, unet, pe = load_all_model()
-    device = torch.device("cuda" if torch.cuda.is_available() else ("mps" if (hasattr(torch.backends, "mps") and torch.backends.mps.is_available()) else "cpu"))
-    timesteps = torch.tensor([0], device=device)
-    pe = pe.half().to(device)
-    vae.vae = vae.vae.half().to(device)
-    unet.model = unet.model.half().to(device)
-    audio_processor = Audio2Feature(model_path="./models/whisper")
+    vae = load_vae()
+    unet, pe = load_unet()
+    timesteps = torch.tensor([0], device=get_device())
+    audio_processor = load_whisper()
     return vae, unet, pe, timesteps, audio_processor
 
 def load_avatar(avatar_id):
@@ -75,13 +95,6 @@ def warm_up(batch_size,model):
                               encoder_hidden_states=audio_feature_batch).sample
     vae.decode_latents(pred_latents)
 
-def read_imgs(img_list):
-    frames = []
-    for img_path in tqdm(img_list):
-        frame = cv2.imread(img_path)
-        frames.append(frame)
-    return frames
-
 def __mirror_index(size, index):
     turn = index // size
     res = index % size
@@ -90,59 +103,75 @@ def __mirror_index(size, index):
     else:
         return size - res - 1 
 
+def __trace(stamps, feat_time, infer_time):
+    # frames driven by pushed audio carry its ingress stamp, idle frames are not traced
+    ingress = next((stamp for stamp in stamps if stamp is not None), None)
+    if ingress is None:
+        return None
+    return {"ingress": ingress, "feat": feat_time, "infer": infer_time}
+
 @torch.no_grad()
-def inference(quit_event,batch_size,input_latent_list_cycle,audio_feat_queue,audio_out_queue,res_frame_queue,
-              vae, unet, pe,timesteps):
-    
+def infer_batch(batch_size,input_latent_list_cycle,whisper_chunks,epoch,feat_time,audio_out_queue,res_frame_queue,
+                index,vae,unet,pe,timesteps,get_epoch=None,sessionid=0,block=True):
+    # one asr step worth of frames: its audio comes off the delay line, its faces go to res_frame_queue.
+    # block=False on the shared inference executor: the caller has reserved room in res_frame_queue
+    # and the asr step queued the audio before the features, neither call may wait there
     length = len(input_latent_list_cycle)
+    chunks = [audio_out_queue.get(block) for _ in range(batch_size*2)]
+    audio = AudioBatch.from_chunks(chunks,epoch)
+    stamps = [stamp if frame_epoch == epoch else None for _,_,_,frame_epoch,stamp in chunks]
+    is_all_silence = 0 not in audio.typelist
+    if get_epoch is not None and epoch != get_epoch():
+        metrics.dropped_frames.inc(batch_size, sessionid, 'interrupted')
+        return index
+    if is_all_silence:
+        infer_time = time.perf_counter()
+        for i in range(batch_size):
+            res_frame_queue.put((None,__mirror_index(length,index),audio.span(i*2),epoch,
+                                 __trace(stamps[i*2:i*2+2],feat_time,infer_time)),block)
+            index = index + 1
+    else:
+        t=time.perf_counter()
+        whisper_batch = np.stack(whisper_chunks)
+        latent_batch = []
+        for i in range(batch_size):
+            idx = __mirror_index(length,index+i)
+            latent = input_latent_list_cycle[idx]
+            latent_batch.append(latent)
+        latent_batch = torch.cat(latent_batch, dim=0)
+        
+        audio_feature_batch = torch.from_numpy(whisper_batch)
+        audio_feature_batch = audio_feature_batch.to(device=unet.device,
+                                                        dtype=unet.model.dtype)
+        audio_feature_batch = pe(audio_feature_batch)
+        latent_batch = latent_batch.to(dtype=unet.model.dtype)
+
+        pred_latents = unet.model(latent_batch, 
+                                    timesteps, 
+                                    encoder_hidden_states=audio_feature_batch).sample
+        if pred_latents.device.type == 'cuda':
+            torch.cuda.synchronize(pred_latents.device)
+        metrics.unet_seconds.observe(time.perf_counter() - t)
+        t=time.perf_counter()
+        recon = vae.decode_latents(pred_latents)
+        infer_time = time.perf_counter()
+        metrics.vae_decode_seconds.observe(infer_time - t)
+        for i,res_frame in enumerate(recon):
+            res_frame_queue.put((res_frame,__mirror_index(length,index),audio.span(i*2),epoch,
+                                 __trace(stamps[i*2:i*2+2],feat_time,infer_time)),block)
+            index = index + 1
+    return index
+
+def inference(quit_event,batch_size,input_latent_list_cycle,audio_feat_queue,audio_out_queue,res_frame_queue,
+              vae, unet, pe,timesteps,get_epoch=None,sessionid=0):
     index = 0
-    count=0
-    counttime=0
     while not quit_event.is_set():
-        starttime=time.perf_counter()
         try:
-            whisper_chunks = audio_feat_queue.get(block=True, timeout=1)
+            whisper_chunks,epoch,feat_time = audio_feat_queue.get(block=True, timeout=1)
         except queue.Empty:
             continue
-        is_all_silence=True
-        audio_frames = []
-        for _ in range(batch_size*2):
-            frame,type,eventpoint = audio_out_queue.get()
-            audio_frames.append((frame,type,eventpoint))
-            if type==0:
-                is_all_silence=False
-        if is_all_silence:
-            for i in range(batch_size):
-                res_frame_queue.put((None,__mirror_index(length,index),audio_frames[i*2:i*2+2]))
-                index = index + 1
-        else:
-            t=time.perf_counter()
-            whisper_batch = np.stack(whisper_chunks)
-            latent_batch = []
-            for i in range(batch_size):
-                idx = __mirror_index(length,index+i)
-                latent = input_latent_list_cycle[idx]
-                latent_batch.append(latent)
-            latent_batch = torch.cat(latent_batch, dim=0)
-            
-            audio_feature_batch = torch.from_numpy(whisper_batch)
-            audio_feature_batch = audio_feature_batch.to(device=unet.device,
-                                                            dtype=unet.model.dtype)
-            audio_feature_batch = pe(audio_feature_batch)
-            latent_batch = latent_batch.to(dtype=unet.model.dtype)
-
-            pred_latents = unet.model(latent_batch, 
-                                        timesteps, 
-                                        encoder_hidden_states=audio_feature_batch).sample
-            recon = vae.decode_latents(pred_latents)
-            counttime += (time.perf_counter() - t)
-            count += batch_size
-            if count>=100:
-                count=0
-                counttime=0
-            for i,res_frame in enumerate(recon):
-                res_frame_queue.put((res_frame,__mirror_index(length,index),audio_frames[i*2:i*2+2]))
-                index = index + 1
+        index = infer_batch(batch_size,input_latent_list_cycle,whisper_chunks,epoch,feat_time,audio_out_queue,
+                            res_frame_queue,index,vae,unet,pe,timesteps,get_epoch,sessionid)
 
 class MuseReal(BaseReal):
     @torch.no_grad()
@@ -151,14 +180,16 @@ class MuseReal(BaseReal):
         self.fps = opt.fps
 
         self.batch_size = opt.batch_size
+        self.render_ahead = getattr(opt, 'render_ahead', 0)
         self.idx = 0
-        self.res_frame_queue = mp.Queue(self.batch_size*2)
+        self.res_frame_queue = Queue(self.batch_size*2)
 
         self.vae, self.unet, self.pe, self.timesteps, self.audio_processor = model
         self.frame_list_cycle,self.mask_list_cycle,self.coord_list_cycle,self.mask_coords_list_cycle, self.input_latent_list_cycle = avatar
 
         self.asr = MuseASR(opt,self,self.audio_processor)
         self.asr.warm_up()
+        self.tts = build_tts(opt,self)
         
         self.render_event = mp.Event()
 
@@ -173,7 +204,7 @@ class MuseReal(BaseReal):
 
     def __warm_up(self): 
         self.asr.run_step()
-        whisper_chunks = self.asr.get_next_feat()
+        whisper_chunks,_,_ = self.asr.get_next_feat()
         whisper_batch = np.stack(whisper_chunks)
         latent_batch = []
         for i in range(self.batch_size):
@@ -224,12 +255,111 @@ class MuseReal(BaseReal):
         except Exception as e:
             return ori_frame
             
+    def start(self,loop,audio_track,video_track):
+        # the session as tasks on the shared runtime: the asr delay line and composition on the
+        # workers, whisper/unet/vae on the inference executor, sentences on the tts pool; no
+        # thread of its own
+        from ..core.runtime import runtime
+
+        self.init_customindex()
+        self.output_loop = loop
+        self.output_tracks = (video_track, audio_track)
+        self.asr.audio_wait = 0
+        self.step_strand = runtime.strand(runtime.workers)
+        self.infer_strand = runtime.strand(runtime.inference)
+        self.compose_strand = runtime.strand(runtime.workers)
+        self.tts.start(runtime.strand(runtime.tts))
+        self.running = True
+        self.clock.reset()
+        self._slot = 0
+        self._slot_epoch = self.epoch
+        self._infer_index = 0
+        # frames of submitted batches not composed yet: each batch reserves its room in
+        # res_frame_queue before it is handed to inference
+        self._in_flight = 0
+        self._in_flight_lock = Lock()
+        self.step_strand.submit(self._step,loop,audio_track,video_track)
+
+    def stop(self):
+        self.running = False
+        self.tts.stop()
+
+    def _step(self,loop,audio_track,video_track):
+        from ..core.runtime import runtime
+
+        if not self.running:
+            return
+        if self._slot_epoch != self.epoch:
+            # frames in flight were dropped by the flush, render again from what plays now
+            self._slot_epoch = self.epoch
+            self._slot = self.clock.slot()
+        lead = 1.5*self.batch_size
+        if self.asr.queue.qsize()>0:
+            lead = max(lead, self.render_ahead)
+        due = self.clock.deadline(self._slot-lead)
+        now = time.monotonic()
+        if due is None or due > now:
+            # before playout starts nothing is due until the first frame is pulled
+            runtime.call_at(now+0.05 if due is None else due, self.step_strand.submit, self._step, loop, audio_track, video_track)
+            return
+        if (self._in_flight+self.batch_size>self.res_frame_queue.maxsize
+                or video_track._queue.qsize()>=video_track._queue.maxsize-self.batch_size):
+            # inference, composition or the track is behind: the next batch waits for room instead of
+            # blocking a shared worker (or the inference thread) on a full queue
+            runtime.call_at(now+self.batch_size*self.clock.video_ptime/4, self.step_strand.submit, self._step, loop, audio_track, video_track)
+            return
+        self.clock.mark(due)
+        self._slot += self.batch_size
+        try:
+            step = self.asr.collect()
+            self._reserve(self.batch_size)
+            self.infer_strand.submit(self._infer,step,loop,audio_track,video_track)
+        finally:
+            # the strand logs a failed step; the session keeps rendering from the next slot
+            self.step_strand.submit(self._step,loop,audio_track,video_track)
+
+    def _reserve(self, frames: int):
+        # negative to give room back
+        with self._in_flight_lock:
+            self._in_flight += frames
+
+    def _infer(self,step,loop,audio_track,video_track):
+        # whisper, unet and vae of one batch, all on the inference executor
+        if step is None:
+            # the first steps only fill the asr context and have nothing to encode
+            self._reserve(-self.batch_size)
+            return
+        try:
+            whisper_chunks,epoch,feat_time = self.asr.encode(step)
+            index = infer_batch(self.batch_size,self.input_latent_list_cycle,whisper_chunks,epoch,feat_time,
+                                self.asr.output_queue,self.res_frame_queue,self._infer_index,
+                                self.vae,self.unet,self.pe,self.timesteps,lambda: self.epoch,self.sessionid,
+                                block=False)
+        except Exception:
+            self._reserve(-self.batch_size)
+            raise
+        # an interrupted batch queues no frames
+        self._reserve(index-self._infer_index-self.batch_size)
+        for _ in range(index-self._infer_index):
+            self.compose_strand.submit(self._compose,loop,audio_track,video_track)
+        self._infer_index = index
+
+    def _compose(self,loop,audio_track,video_track):
+        try:
+            item = self.res_frame_queue.get_nowait()
+            self.output_frame(item,loop,audio_track,video_track)
+        except queue.Empty:
+            pass
+        finally:
+            self._reserve(-1)
+
     def render(self,quit_event,loop=None,audio_track=None,video_track=None):
         self.init_customindex()
+        self.tts.render(quit_event)
         infer_quit_event = Event()
         infer_thread = Thread(target=inference, args=(infer_quit_event,self.batch_size,self.input_latent_list_cycle,
                                            self.asr.feat_queue,self.asr.output_queue,self.res_frame_queue,
-                                           self.vae, self.unet, self.pe,self.timesteps)) #mp.Process
+                                           self.vae, self.unet, self.pe,self.timesteps,lambda: self.epoch,self.sessionid)) #mp.Process
         infer_thread.start()
         
         process_quit_event = Event()
@@ -237,14 +367,28 @@ class MuseReal(BaseReal):
         process_thread.start()
 
         
-        count=0
-        totaltime=0
-        _starttime=time.perf_counter()
+        # playout starts a new timeline; every step fills the next batch of video slots
+        self.clock.reset()
+        slot = 0
+        epoch = self.epoch
         while not quit_event.is_set():
-            t = time.perf_counter()
+            if video_track:
+                if epoch != self.epoch:
+                    # frames in flight were dropped by the flush, render again from what plays now
+                    epoch = self.epoch
+                    slot = self.clock.slot()
+                # idle frames are kept just ahead of playback, speech already waiting in the
+                # asr queue is rendered up to render_ahead frames ahead of the track
+                lead = 1.5*self.opt.batch_size
+                if self.asr.queue.qsize()>0:
+                    lead = max(lead, self.render_ahead)
+                self.clock.wait_slot(slot-lead, quit_event)
+                if video_track._queue.qsize()>=video_track._queue.maxsize-self.opt.batch_size:
+                    # the track stopped pulling frames, hold off instead of piling up puts on the loop
+                    quit_event.wait(self.opt.batch_size*self.clock.video_ptime)
+                    continue
             self.asr.run_step()
-            if video_track and video_track._queue.qsize()>=1.5*self.opt.batch_size:
-                time.sleep(0.04*video_track._queue.qsize()*0.8)
+            slot += self.opt.batch_size
 
         infer_quit_event.set()
         infer_thread.join()
@@ -0,0 +1,115 @@
+import os
+import json
+import argparse
+
+import torch
+
+MANIFEST = "manifest.json"
+WEIGHTS = "model.safetensors"
+
+_DTYPES = {
+    "float16": torch.float16,
+    "bfloat16": torch.bfloat16,
+    "float32": torch.float32,
+}
+
+
+def _dtype_name(dtype: torch.dtype) -> str:
+    return str(dtype).replace("torch.", "")
+
+def read_manifest(snapshot_dir: str) -> dict:
+    path = os.path.join(snapshot_dir, MANIFEST)
+    if not snapshot_dir or not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def has_component(snapshot_dir: str, name: str) -> bool:
+    return name in read_manifest(snapshot_dir).get("components", {})
+
+def _save_weights(module: torch.nn.Module, component_dir: str):
+    from safetensors.torch import save_file
+
+    os.makedirs(component_dir, exist_ok=True)
+    state = {k: v.detach().cpu().contiguous() for k, v in module.state_dict().items()}
+    save_file(state, os.path.join(component_dir, WEIGHTS))
+    return _dtype_name(next(module.parameters()).dtype)
+
+def _load_weights(module: torch.nn.Module, component_dir: str, device: torch.device):
+    from safetensors.torch import load_file
+
+    # cpu loads are mmap-backed, cuda loads go straight to device memory
+    state = load_file(os.path.join(component_dir, WEIGHTS), device=str(device))
+    module.load_state_dict(state, strict=True, assign=True)
+    return module.to(device).eval().requires_grad_(False)
+
+def save_snapshot(vae, unet, audio_processor, snapshot_dir: str):
+    components = {}
+
+    vae_dir = os.path.join(snapshot_dir, "vae")
+    vae.vae.save_config(vae_dir)
+    components["vae"] = {"dtype": _save_weights(vae.vae, vae_dir)}
+
+    unet_dir = os.path.join(snapshot_dir, "unet")
+    unet.model.save_config(unet_dir)
+    components["unet"] = {"dtype": _save_weights(unet.model, unet_dir)}
+
+    whisper_dir = os.path.join(snapshot_dir, "whisper")
+    audio_processor.encoder.config.save_pretrained(whisper_dir)
+    audio_processor.feature_extractor.save_pretrained(whisper_dir)
+    components["whisper"] = {"dtype": _save_weights(audio_processor.encoder, whisper_dir)}
+
+    with open(os.path.join(snapshot_dir, MANIFEST), 'w') as f:
+        json.dump({"version": 1, "components": components}, f, indent=2)
+    return components
+
+def load_vae(snapshot_dir: str, device: torch.device):
+    from accelerate import init_empty_weights
+    from diffusers import AutoencoderKL
+    from musetalk.models.vae import VAE
+
+    component_dir = os.path.join(snapshot_dir, "vae")
+    with init_empty_weights():
+        module = AutoencoderKL.from_config(AutoencoderKL.load_config(component_dir))
+    module = _load_weights(module, component_dir, device)
+    return VAE(model_path=component_dir, vae=module)
+
+def load_unet(snapshot_dir: str, device: torch.device):
+    from accelerate import init_empty_weights
+    from diffusers import UNet2DConditionModel
+    from musetalk.models.unet import UNet
+
+    component_dir = os.path.join(snapshot_dir, "unet")
+    with init_empty_weights():
+        module = UNet2DConditionModel.from_config(UNet2DConditionModel.load_config(component_dir))
+    module = _load_weights(module, component_dir, device)
+    return UNet(unet_config=None, model_path=component_dir, device=device, model=module)
+
+def load_whisper(snapshot_dir: str, device: torch.device):
+    from accelerate import init_empty_weights
+    from transformers import AutoFeatureExtractor, WhisperConfig
+    from transformers.models.whisper.modeling_whisper import WhisperEncoder
+    from musetalk.whisper.audio2feature import Audio2Feature
+
+    component_dir = os.path.join(snapshot_dir, "whisper")
+    with init_empty_weights():
+        encoder = WhisperEncoder(WhisperConfig.from_pretrained(component_dir))
+    encoder = _load_weights(encoder, component_dir, device)
+    return Audio2Feature(model_path=component_dir,
+                         feature_extractor=AutoFeatureExtractor.from_pretrained(component_dir),
+                         encoder=encoder)
+
+
+if __name__ == "__main__":
+    from config.settings import settings
+    from .musereal import load_vae as load_source_vae, load_unet as load_source_unet, load_whisper as load_source_whisper
+
+    parser = argparse.ArgumentParser(description="Write the deployed model weights as a safetensors snapshot")
+    parser.add_argument("--out", default=settings.snapshot_dir)
+    args = parser.parse_args()
+
+    vae = load_source_vae(use_snapshot=False)
+    unet, pe = load_source_unet(use_snapshot=False)
+    audio_processor = load_source_whisper(use_snapshot=False)
+    components = save_snapshot(vae, unet, audio_processor, args.out)
+    print(f"snapshot written to {args.out}: {components}")
@@ -0,0 +1,212 @@
+import os
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+_WHISPER_SECONDS = 30
+
+
+def normalize_text(text: str) -> str:
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+def file_fingerprint(path: str) -> str:
+    # path, size and mtime: a reference audio swapped under the same path gets new keys
+    if not path:
+        return ''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return path
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+
+def cache_key(provider: str, voice: str, ref_file: str, text: str) -> str:
+    payload = '\x00'.join([provider, voice or '', file_fingerprint(ref_file), normalize_text(text)])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    # phrase -> (16khz float32 pcm, optional whisper features one block per audio frame)
+    # memory tier is an lru bounded by bytes, disk tier is .npy files opened with mmap and
+    # bounded by disk_bytes, least recently used by mtime first
+
+    def __init__(self, cache_dir: str = '', max_bytes: int = 256 << 20, disk_bytes: int = 1 << 30):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.disk_bytes = disk_bytes
+        self.disk_used = 0
+        self.disk_evictions = 0
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.disk_used = sum(size for _, _, size in self._disk_entries())
+
+    def _path(self, key: str, kind: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{kind}.npy")
+
+    def _remember(self, key: str, pcm: np.ndarray, feat: Optional[np.ndarray]):
+        size = pcm.nbytes + (feat.nbytes if feat is not None else 0)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            old_pcm, old_feat = self.entries.pop(key)
+            self.bytes -= old_pcm.nbytes + (old_feat.nbytes if old_feat is not None else 0)
+        self.entries[key] = (pcm, feat)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (old_pcm, old_feat) = self.entries.popitem(last=False)
+            self.bytes -= old_pcm.nbytes + (old_feat.nbytes if old_feat is not None else 0)
+
+    def get(self, key: str) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+        if self.cache_dir and os.path.exists(self._path(key, 'pcm')):
+            try:
+                pcm = np.load(self._path(key, 'pcm'), mmap_mode='r')
+                feat = None
+                if os.path.exists(self._path(key, 'feat')):
+                    feat = np.load(self._path(key, 'feat'), mmap_mode='r')
+            except (OSError, ValueError):
+                pass
+            else:
+                self._touch(key)
+                with self._lock:
+                    self._remember(key, pcm, feat)
+                    self.disk_hits += 1
+                return pcm, feat
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, pcm: np.ndarray, feat: Optional[np.ndarray] = None):
+        pcm = np.ascontiguousarray(pcm, dtype=np.float32)
+        pcm.setflags(write=False)
+        if feat is not None:
+            feat.setflags(write=False)
+        with self._lock:
+            self._remember(key, pcm, feat)
+        if not self.cache_dir:
+            return
+        try:
+            written = self._write(self._path(key, 'pcm'), pcm)
+            if feat is not None:
+                written += self._write(self._path(key, 'feat'), feat)
+        except OSError:
+            return
+        with self._lock:
+            self.disk_used += written
+            over = self.disk_used > self.disk_bytes
+        if over:
+            self._evict()
+
+    def _write(self, path: str, array: np.ndarray):
+        # write then rename so a concurrent reader never maps a partial file
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.save(f, array)
+            size = f.tell()
+        os.replace(tmp, path)
+        return size
+
+    def _touch(self, key: str):
+        # a disk hit counts as a use for eviction
+        for kind in ('pcm', 'feat'):
+            try:
+                os.utime(self._path(key, kind))
+            except OSError:
+                pass
+
+    def _disk_entries(self):
+        # (mtime of the pcm file, key, bytes of its files) per phrase on disk
+        entries = {}
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return []
+        for name in names:
+            parts = name.split('.')
+            if len(parts) != 3 or parts[2] != 'npy':
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            mtime, size = entries.get(parts[0], (0, 0))
+            if parts[1] == 'pcm':
+                mtime = stat.st_mtime_ns
+            entries[parts[0]] = (mtime, size + stat.st_size)
+        return [(mtime, key, size) for key, (mtime, size) in entries.items()]
+
+    def _evict(self):
+        # rescanned: other processes may share the directory. Maps of removed files stay valid
+        entries = sorted(self._disk_entries())
+        used = sum(size for _, _, size in entries)
+        for _, key, size in entries:
+            if used <= self.disk_bytes:
+                break
+            for kind in ('pcm', 'feat'):
+                try:
+                    os.remove(self._path(key, kind))
+                except OSError:
+                    pass
+            used -= size
+            self.disk_evictions += 1
+        with self._lock:
+            self.disk_used = used
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "disk_bytes": self.disk_used,
+                "disk_evictions": self.disk_evictions,
+                "hit_rate": round((self.hits + self.disk_hits) / lookups, 3) if lookups else None,
+            }
+
+
+def phrase_features(audio_processor, pcm: np.ndarray, chunk: int, fps: int, left: int, right: int) -> Optional[np.ndarray]:
+    # whisper rows are 20ms, so frames only line up with rows when 50 is a multiple of fps
+    frames = -(-pcm.shape[0] // chunk)
+    if 50 % fps != 0 or (left + frames + right) * chunk > _WHISPER_SECONDS * 16000:
+        return None
+    rows = 50 // fps
+    padded = np.zeros((left + frames + right) * chunk, dtype=np.float32)
+    padded[left * chunk:left * chunk + pcm.shape[0]] = pcm
+    feature = audio_processor.audio2feat(padded)
+    feature = feature[left * rows:(left + frames) * rows]
+    if feature.shape[0] != frames * rows:
+        return None
+    return np.ascontiguousarray(feature.reshape(frames, rows, *feature.shape[1:]))
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache(opt) -> Optional[TTSCache]:
+    global _cache
+
+    max_mb = int(getattr(opt, 'tts_cache_mb', 256))
+    if max_mb <= 0:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = TTSCache(getattr(opt, 'tts_cache_dir', ''), max_mb << 20,
+                              int(getattr(opt, 'tts_cache_disk_mb', 1024)) << 20)
+        return _cache
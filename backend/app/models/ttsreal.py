@@ -0,0 +1,308 @@
+import re
+import time
+import queue
+import asyncio
+from queue import Queue
+from threading import Thread
+from collections import deque
+from typing import Iterator, Tuple
+
+import numpy as np
+
+from .ttscache import cache_key, get_cache, phrase_features
+
+_SENTENCE_END = re.compile(r'[。！？!?；;…\n]+|(?<![0-9])[.](?![0-9])')
+
+
+def split_sentences(text: str, min_chars: int = 10) -> list:
+    buffer = SentenceBuffer(min_chars)
+    sentences = buffer.push(text)
+    tail = buffer.flush()
+    if tail:
+        sentences.append(tail)
+    return sentences
+
+class SentenceBuffer:
+    def __init__(self, min_chars: int = 10):
+        self.min_chars = min_chars
+        self.text = ''
+
+    def push(self, text: str) -> list:
+        self.text += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self.text):
+            end = match.end()
+            if len(self.text[start:end].strip()) >= self.min_chars:
+                sentences.append(self.text[start:end].strip())
+                start = end
+        self.text = self.text[start:]
+        return sentences
+
+    def flush(self) -> str:
+        text, self.text = self.text.strip(), ''
+        return text
+
+
+class TTSProvider:
+    name = 'base'
+
+    def __init__(self, opt):
+        self.voice = getattr(opt, 'tts_voice', '')
+        self.ref_file = opt.REF_FILE
+        self.ref_text = opt.REF_TEXT
+
+    def stream(self, text: str) -> Iterator[Tuple[np.ndarray, int]]:
+        # yields (mono float32 pcm, sample_rate) as soon as each piece is synthesized
+        raise NotImplementedError
+
+class EdgeTTSProvider(TTSProvider):
+    name = 'edge'
+
+    def stream(self, text):
+        import av
+        import edge_tts
+
+        loop = asyncio.new_event_loop()
+        chunks = edge_tts.Communicate(text, self.voice).stream()
+        decoder = av.CodecContext.create('mp3', 'r')
+        resampler = av.AudioResampler(format='flt', layout='mono', rate=16000)
+
+        def decode(packet):
+            try:
+                frames = decoder.decode(packet)
+            except av.InvalidDataError:
+                return
+            for frame in frames:
+                for out in resampler.resample(frame):
+                    yield out.to_ndarray()[0], 16000
+
+        try:
+            while True:
+                try:
+                    chunk = loop.run_until_complete(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                if chunk['type'] != 'audio':
+                    continue
+                for packet in decoder.parse(chunk['data']):
+                    yield from decode(packet)
+            yield from decode(None)
+        finally:
+            loop.run_until_complete(chunks.aclose())
+            loop.close()
+
+class HTTPTTSProvider(TTSProvider):
+    # POST {text, voice, ref_file, ref_text} to TTS_SERVER; the response body is
+    # streamed s16le mono pcm at the rate given by the X-Sample-Rate header
+    name = 'http'
+
+    def __init__(self, opt):
+        super().__init__(opt)
+        self.server = opt.TTS_SERVER
+        self.sample_rate = getattr(opt, 'tts_sample_rate', 16000)
+
+    def stream(self, text):
+        import requests
+
+        payload = {'text': text, 'voice': self.voice, 'ref_file': self.ref_file, 'ref_text': self.ref_text}
+        with requests.post(self.server, json=payload, stream=True, timeout=(5, 60)) as res:
+            res.raise_for_status()
+            sample_rate = int(res.headers.get('X-Sample-Rate', self.sample_rate))
+            remainder = b''
+            for data in res.iter_content(chunk_size=None):
+                data = remainder + data
+                usable = len(data) - len(data) % 2
+                remainder = data[usable:]
+                if usable:
+                    yield np.frombuffer(data[:usable], dtype=np.int16).astype(np.float32) / 32767, sample_rate
+
+PROVIDERS = {
+    'edge': EdgeTTSProvider,
+    'http': HTTPTTSProvider,
+}
+
+
+class StreamResampler:
+    def __init__(self, sample_rate: int = 16000):
+        self.sample_rate = sample_rate
+        self._resampler = None
+        self._rate = None
+
+    def resample(self, pcm: np.ndarray, sample_rate: int) -> np.ndarray:
+        if sample_rate == self.sample_rate:
+            return pcm
+        import av
+
+        if self._resampler is None or self._rate != sample_rate:
+            self._resampler = av.AudioResampler(format='flt', layout='mono', rate=self.sample_rate)
+            self._rate = sample_rate
+        frame = av.AudioFrame.from_ndarray(pcm.reshape(1, -1), format='flt', layout='mono')
+        frame.sample_rate = sample_rate
+        out = [f.to_ndarray()[0] for f in self._resampler.resample(frame)]
+        return np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+
+
+class TTSEngine:
+    def __init__(self, opt, parent, provider: TTSProvider):
+        self.opt = opt
+        self.parent = parent
+        self.provider = provider
+
+        self.sample_rate = 16000
+        self.chunk = self.sample_rate // opt.fps
+        self.msgqueue = Queue()
+        self.flush_count = 0
+        # set while the session runs on the shared runtime, sentences become tasks instead of a thread
+        self.strand = None
+
+        self.cache = get_cache(opt)
+        self.cache_features = bool(getattr(opt, 'tts_cache_features', False))
+
+        self.ttfa = deque(maxlen=200)
+        self.messages = 0
+        self.failures = 0
+
+    def put_msg_txt(self, msg: str, datainfo: dict = {}):
+        if len(msg) == 0:
+            return
+        queued_at = time.perf_counter()
+        for i, sentence in enumerate(split_sentences(msg)):
+            self.msgqueue.put((sentence, datainfo, queued_at if i == 0 else None))
+            if self.strand is not None:
+                self.strand.submit(self.process_one)
+
+    def flush_talk(self):
+        self.flush_count += 1
+        self.msgqueue.queue.clear()
+
+    def render(self, quit_event):
+        process_thread = Thread(target=self.process_tts, args=(quit_event,), daemon=True, name="tts")
+        process_thread.start()
+
+    def start(self, strand):
+        self.strand = strand
+        for _ in range(self.msgqueue.qsize()):
+            strand.submit(self.process_one)
+
+    def stop(self):
+        self.strand = None
+
+    def process_one(self):
+        # one queued sentence per task; sentences dropped by flush_talk leave nothing to do
+        if self.strand is None:
+            return
+        try:
+            msg = self.msgqueue.get_nowait()
+        except queue.Empty:
+            return
+        self.synthesize(msg)
+
+    def process_tts(self, quit_event):
+        while not quit_event.is_set():
+            try:
+                msg = self.msgqueue.get(block=True, timeout=1)
+            except queue.Empty:
+                continue
+            self.synthesize(msg)
+
+    def synthesize(self, msg):
+        try:
+            self.txt_to_audio(msg)
+        except Exception as e:
+            # provider errors (network, unknown voice) leave the sentence silent
+            self.failures += 1
+            print(f"tts for session {self.parent.sessionid} failed on {msg[0]!r}: {e!r}")
+
+    def txt_to_audio(self, msg):
+        text, datainfo, queued_at = msg
+        self.messages += 1
+        key = None
+        if self.cache is not None:
+            key = cache_key(self.provider.name, self.provider.voice, self.provider.ref_file, text)
+            entry = self.cache.get(key)
+            if entry is not None:
+                if queued_at is not None:
+                    self.ttfa.append(time.perf_counter() - queued_at)
+                self.replay(text, datainfo, *entry)
+                return
+
+        flush_count = self.flush_count
+        epoch = self.parent.epoch
+        resampler = StreamResampler(self.sample_rate)
+        buffer = np.zeros(0, dtype=np.float32)
+        pushed = []
+        first = True
+        for pcm, sample_rate in self.provider.stream(text):
+            if self.flush_count != flush_count:
+                return
+            buffer = np.concatenate([buffer, resampler.resample(pcm, sample_rate)])
+            while buffer.shape[0] >= self.chunk:
+                eventpoint = {}
+                if first:
+                    eventpoint = {'status': 'start', 'text': text, **datainfo}
+                    if queued_at is not None:
+                        self.ttfa.append(time.perf_counter() - queued_at)
+                    first = False
+                self.parent.put_audio_frame(buffer[:self.chunk], eventpoint, epoch=epoch)
+                pushed.append(buffer[:self.chunk])
+                buffer = buffer[self.chunk:]
+        if self.flush_count != flush_count or first:
+            return
+        tail = np.zeros(self.chunk, dtype=np.float32)
+        tail[:buffer.shape[0]] = buffer
+        self.parent.put_audio_frame(tail, {'status': 'end', 'text': text, **datainfo}, epoch=epoch)
+        pushed.append(tail)
+
+        if key is not None:
+            pcm = np.concatenate(pushed)
+            self.cache.put(key, pcm, self.features(pcm))
+
+    def replay(self, text, datainfo, pcm, feat):
+        # cached phrases are already synthesized, so every frame is queued at once
+        epoch = self.parent.epoch
+        frames = pcm.shape[0] // self.chunk
+        if feat is not None and feat.shape[0] != frames:
+            feat = None
+        for i in range(frames):
+            eventpoint = {}
+            if i == 0:
+                eventpoint = {'status': 'start', 'text': text, **datainfo}
+            elif i == frames - 1:
+                eventpoint = {'status': 'end', 'text': text, **datainfo}
+            self.parent.put_audio_frame(pcm[i * self.chunk:(i + 1) * self.chunk], eventpoint,
+                                        feat[i] if feat is not None else None, epoch)
+
+    def features(self, pcm):
+        if not self.cache_features:
+            return None
+        asr = getattr(self.parent, 'asr', None)
+        if asr is None or not hasattr(asr, 'audio_processor'):
+            return None
+        from ..core.runtime import runtime
+
+        gain = getattr(self.opt, 'audio_gain', 1.0)
+        # a whisper call like any other model call: queued on the inference executor, this
+        # tts thread waits for it
+        return runtime.inference.submit(phrase_features, asr.audio_processor, pcm * gain if gain != 1.0 else pcm,
+                                        self.chunk, self.opt.fps, asr.stride_left_size,
+                                        asr.stride_right_size).result()
+
+    def stats(self) -> dict:
+        ttfa = sorted(self.ttfa)
+        return {
+            "provider": self.provider.name,
+            "messages": self.messages,
+            "failures": self.failures,
+            "queued": self.msgqueue.qsize(),
+            "ttfa_last_ms": round(self.ttfa[-1] * 1000, 1) if ttfa else None,
+            "ttfa_p50_ms": round(ttfa[len(ttfa) // 2] * 1000, 1) if ttfa else None,
+            "ttfa_p90_ms": round(ttfa[int(len(ttfa) * 0.9)] * 1000, 1) if ttfa else None,
+            "cache": self.cache.stats() if self.cache is not None else None,
+        }
+
+
+def build_tts(opt, parent) -> TTSEngine:
+    if opt.tts not in PROVIDERS:
+        raise ValueError(f"Unknown tts type: {opt.tts}")
+    return TTSEngine(opt, parent, PROVIDERS[opt.tts](opt))
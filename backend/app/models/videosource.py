@@ -0,0 +1,128 @@
+import queue
+import threading
+
+from ..core import metrics
+
+video_underruns = metrics.registry.register(metrics.Counter(
+    'livetalking_video_underruns_total', 'Idle video frames repeated because the decoder had not caught up', ('session',)))
+
+
+def _open(path: str):
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        return None
+    return cap
+
+class ClipFrames:
+    # a short clip decoded once into read-only frames, shared by every session that loops it
+
+    def __init__(self, path: str):
+        frames = []
+        cap = _open(path)
+        if cap is not None:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                frame.setflags(write=False)
+                frames.append(frame)
+            cap.release()
+        self.frames = tuple(frames)
+
+_clips = {}
+_clips_lock = threading.Lock()
+
+def load_clip(path: str) -> ClipFrames:
+    with _clips_lock:
+        clip = _clips.get(path)
+        if clip is None:
+            clip = _clips[path] = ClipFrames(path)
+        return clip
+
+
+class ClipSource:
+    # one session's cursor over a shared in-memory clip
+
+    def __init__(self, clip: ClipFrames, sessionid: int = 0):
+        self.clip = clip
+        self.sessionid = sessionid
+        self.index = 0
+
+    def read(self):
+        if not self.clip.frames:
+            return None
+        frame = self.clip.frames[self.index % len(self.clip.frames)]
+        self.index += 1
+        return frame
+
+    def close(self):
+        pass
+
+class RingSource:
+    # a decoder thread keeps a bounded ring of frames ahead of the compositor and seeks back to
+    # the start on its own at the end of the file, so neither a loop point nor slow storage
+    # stalls composition; when the ring runs dry the last frame is shown again
+
+    def __init__(self, path: str, size: int = 50, sessionid: int = 0):
+        self.path = path
+        self.sessionid = sessionid
+        self._ring = queue.Queue(maxsize=size)
+        self._quit = threading.Event()
+        self._last = None
+        self._thread = threading.Thread(target=self._run, name=f"video-decode-{sessionid}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        import cv2
+
+        cap = _open(self.path)
+        if cap is None:
+            return
+        try:
+            empty = 0
+            while not self._quit.is_set():
+                ret, frame = cap.read()
+                if not ret:
+                    # end of file: loop, give up on a file that yields nothing at all
+                    empty += 1
+                    if empty > 1:
+                        return
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                empty = 0
+                while not self._quit.is_set():
+                    try:
+                        self._ring.put(frame, timeout=0.5)
+                        break
+                    except queue.Full:
+                        continue
+        finally:
+            cap.release()
+
+    def read(self):
+        try:
+            self._last = self._ring.get_nowait()
+        except queue.Empty:
+            if self._last is not None:
+                video_underruns.inc(1, self.sessionid)
+        return self._last
+
+    def close(self):
+        self._quit.set()
+
+
+def open_video(path: str, sessionid: int = 0, memory_mb: float = 256, ring: int = 50):
+    # clips that fit the memory budget are decoded once and shared, longer ones are streamed
+    cap = _open(path)
+    if cap is None:
+        return None
+    import cv2
+
+    size = (cap.get(cv2.CAP_PROP_FRAME_COUNT) * cap.get(cv2.CAP_PROP_FRAME_WIDTH)
+            * cap.get(cv2.CAP_PROP_FRAME_HEIGHT) * 3)
+    cap.release()
+    if 0 < size <= memory_mb * 1024 * 1024:
+        return ClipSource(load_clip(path), sessionid)
+    return RingSource(path, ring, sessionid)
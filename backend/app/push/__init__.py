@@ -0,0 +1,4 @@
+from .push import PushPlayer
+from .hls import HLSWriter
+
+__all__ = ['PushPlayer', 'HLSWriter']
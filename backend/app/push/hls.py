@@ -0,0 +1,386 @@
+import os
+import math
+import time
+import struct
+import threading
+from collections import OrderedDict, deque
+
+from ..core import metrics
+from .push import StreamWriter
+
+hls_segment_seconds = metrics.registry.register(metrics.Histogram(
+    'livetalking_hls_segment_seconds', 'Media duration of each completed hls segment',
+    buckets=(0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 6.0, 8.0, 10.0)))
+hls_part_latency_seconds = metrics.registry.register(metrics.Histogram(
+    'livetalking_hls_part_latency_seconds', 'Time from the playout slot of the first frame of a part until the part is published',
+    buckets=(0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0)))
+
+
+def iter_boxes(data: bytes, start: int = 0, end: int = None):
+    # (type, payload start, box end) for the iso-bmff boxes between start and end
+    end = len(data) if end is None else end
+    while start + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', data, start)
+        header = 8
+        if size == 1:
+            size = struct.unpack_from('>Q', data, start + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - start
+        yield kind, start + header, start + size
+        start += size
+
+def find_box(data: bytes, path, start: int = 0, end: int = None):
+    for kind, payload, box_end in iter_boxes(data, start, end):
+        if kind == path[0]:
+            if len(path) == 1:
+                return payload, box_end
+            found = find_box(data, path[1:], payload, box_end)
+            if found is not None:
+                return found
+    return None
+
+def video_track(init: bytes):
+    # (track id, timescale) of the video trak in an init segment
+    moov = find_box(init, (b'moov',))
+    for kind, payload, end in iter_boxes(init, *moov):
+        if kind != b'trak':
+            continue
+        hdlr = find_box(init, (b'mdia', b'hdlr'), payload, end)
+        if hdlr is None or init[hdlr[0] + 8:hdlr[0] + 12] != b'vide':
+            continue
+        tkhd = find_box(init, (b'tkhd',), payload, end)[0]
+        track_id = struct.unpack_from('>I', init, tkhd + (20 if init[tkhd] == 1 else 12))[0]
+        mdhd = find_box(init, (b'mdia', b'mdhd'), payload, end)[0]
+        timescale = struct.unpack_from('>I', init, mdhd + (20 if init[mdhd] == 1 else 12))[0]
+        return track_id, timescale
+    return None
+
+def fragment_timing(moof: bytes, track_id: int):
+    # (decode time, duration) of one track in a moof, in that track's timescale
+    for kind, payload, end in iter_boxes(moof, *find_box(moof, (b'moof',))):
+        if kind != b'traf':
+            continue
+        tfhd = find_box(moof, (b'tfhd',), payload, end)[0]
+        flags = struct.unpack_from('>I', moof, tfhd)[0] & 0xffffff
+        if struct.unpack_from('>I', moof, tfhd + 4)[0] != track_id:
+            continue
+        offset = tfhd + 8 + (8 if flags & 0x1 else 0) + (4 if flags & 0x2 else 0)
+        default_duration = struct.unpack_from('>I', moof, offset)[0] if flags & 0x8 else 0
+        tfdt = find_box(moof, (b'tfdt',), payload, end)[0]
+        if moof[tfdt] == 1:
+            decode_time = struct.unpack_from('>Q', moof, tfdt + 4)[0]
+        else:
+            decode_time = struct.unpack_from('>I', moof, tfdt + 4)[0]
+        duration = 0
+        for trun_kind, trun, trun_end in iter_boxes(moof, payload, end):
+            if trun_kind != b'trun':
+                continue
+            trun_flags = struct.unpack_from('>I', moof, trun)[0] & 0xffffff
+            count = struct.unpack_from('>I', moof, trun + 4)[0]
+            position = trun + 8 + (4 if trun_flags & 0x1 else 0) + (4 if trun_flags & 0x4 else 0)
+            stride = 4 * bin(trun_flags & 0xf00).count('1')
+            if trun_flags & 0x100:
+                for i in range(count):
+                    duration += struct.unpack_from('>I', moof, position + i * stride)[0]
+            else:
+                duration += default_duration * count
+        return decode_time, duration
+    return None
+
+
+class Part:
+    __slots__ = ('data', 'duration', 'independent')
+
+    def __init__(self, data: bytes, duration: float, independent: bool):
+        self.data = data
+        self.duration = duration
+        self.independent = independent
+
+class Segment:
+
+    def __init__(self, msn: int, init: int, discontinuity: bool = False):
+        self.msn = msn
+        self.init = init
+        self.discontinuity = discontinuity
+        self.parts = []
+        self.complete = False
+
+    @property
+    def duration(self) -> float:
+        return sum(part.duration for part in self.parts)
+
+    @property
+    def data(self) -> bytes:
+        return b''.join(part.data for part in self.parts)
+
+
+class HLSStore:
+    # cmaf init segment, segments and their parts for one session, kept in memory for the
+    # http handlers and mirrored to a directory when one is configured
+
+    def __init__(self, segment_duration: float = 2.0, part_duration: float = 0.2, window: int = 6,
+                 directory: str = ''):
+        self.segment_duration = segment_duration
+        self.part_duration = part_duration
+        self.window = window
+        self.directory = directory
+        self.inits = {}
+        self.segments = OrderedDict()
+        self.sequence = 0
+        self.init_sequence = -1
+        self.max_part = part_duration
+        self.max_segment = segment_duration
+        self.version = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def add_init(self, data: bytes):
+        with self._lock:
+            self.init_sequence += 1
+            self.inits[self.init_sequence] = data
+            # a new encoder (reopened output) starts a new segment after a discontinuity
+            current = self._current()
+            if current is not None and current.parts:
+                # the closed segment keeps its number, the new encoder starts the next one
+                self._close(current)
+                self.sequence += 1
+            self.segments[self.sequence] = Segment(self.sequence, self.init_sequence, discontinuity=bool(self.sequence))
+            self._changed()
+        self._write(self.init_name(self.init_sequence), data)
+
+    def add_part(self, data: bytes, duration: float, independent: bool):
+        with self._lock:
+            current = self._current()
+            if independent and current.parts and current.duration >= self.segment_duration * 0.5:
+                self._close(current)
+                self.sequence += 1
+                current = self.segments[self.sequence] = Segment(self.sequence, self.init_sequence)
+            current.parts.append(Part(data, duration, independent))
+            self.max_part = max(self.max_part, duration)
+            while len(self.segments) > self.window + 1:
+                msn, old = self.segments.popitem(last=False)
+                self._remove(old)
+            self._changed()
+            name = self.part_name(current.msn, len(current.parts) - 1)
+        self._write(name, data)
+
+    def _current(self):
+        return self.segments[self.sequence] if self.sequence in self.segments else None
+
+    def _close(self, segment: Segment):
+        segment.complete = True
+        self.max_segment = max(self.max_segment, segment.duration)
+        hls_segment_seconds.observe(segment.duration)
+        self._write(self.segment_name(segment.msn), segment.data)
+
+    def _changed(self):
+        self.version += 1
+        if self.directory:
+            self._write('index.m3u8', self._render_playlist().encode())
+
+    def _write(self, name: str, data: bytes):
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def _remove(self, segment: Segment):
+        if not self.directory:
+            return
+        names = [self.segment_name(segment.msn)] + [self.part_name(segment.msn, i) for i in range(len(segment.parts))]
+        for name in names:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def init_name(index: int) -> str:
+        return f"init{index}.mp4"
+
+    @staticmethod
+    def segment_name(msn: int) -> str:
+        return f"seg{msn}.m4s"
+
+    @staticmethod
+    def part_name(msn: int, part: int) -> str:
+        return f"seg{msn}.{part}.m4s"
+
+    def has(self, msn: int, part: int = None) -> bool:
+        # blocking playlist reload: is segment msn (or its part) published yet
+        with self._lock:
+            segment = self.segments.get(msn)
+            if segment is None:
+                return msn < self.sequence
+            if part is None:
+                return segment.complete
+            return len(segment.parts) > part
+
+    def playlist(self) -> str:
+        # the http handlers run on the event loop while the writer thread adds parts
+        with self._lock:
+            return self._render_playlist()
+
+    def _render_playlist(self) -> str:
+        segments = [segment for segment in self.segments.values() if segment.parts]
+        if not segments:
+            return ''
+        part_target = math.ceil(self.max_part * 1000) / 1000
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:9',
+            f'#EXT-X-TARGETDURATION:{math.ceil(self.max_segment)}',
+            f'#EXT-X-PART-INF:PART-TARGET={part_target:.3f}',
+            f'#EXT-X-SERVER-CONTROL:CAN-BLOCK-RELOAD=YES,PART-HOLD-BACK={3 * part_target:.3f}',
+            f'#EXT-X-MEDIA-SEQUENCE:{segments[0].msn}',
+        ]
+        # always sent: once the window slides past a reconnect clients would fall back to 0
+        lines.append(f'#EXT-X-DISCONTINUITY-SEQUENCE:{segments[0].init}')
+        init = None
+        for position, segment in enumerate(segments):
+            if segment.discontinuity and position:
+                lines.append('#EXT-X-DISCONTINUITY')
+            if segment.init != init:
+                init = segment.init
+                lines.append(f'#EXT-X-MAP:URI="{self.init_name(init)}"')
+            # parts are only listed for the live edge, older segments are fetched whole
+            if position >= len(segments) - 3:
+                for index, part in enumerate(segment.parts):
+                    attributes = f'DURATION={part.duration:.3f},URI="{self.part_name(segment.msn, index)}"'
+                    if part.independent:
+                        attributes += ',INDEPENDENT=YES'
+                    lines.append(f'#EXT-X-PART:{attributes}')
+            if segment.complete:
+                lines.append(f'#EXTINF:{segment.duration:.3f},')
+                lines.append(self.segment_name(segment.msn))
+        return '\n'.join(lines) + '\n'
+
+    def get(self, name: str):
+        # bytes of an init segment, segment or part by file name, None when not (or no longer) held
+        with self._lock:
+            if name.startswith('init') and name.endswith('.mp4'):
+                return self.inits.get(int(name[4:-4]))
+            if not (name.startswith('seg') and name.endswith('.m4s')):
+                return None
+            numbers = name[3:-4].split('.')
+            segment = self.segments.get(int(numbers[0]))
+            if segment is None:
+                return None
+            if len(numbers) == 1:
+                return segment.data if segment.complete else None
+            index = int(numbers[1])
+            return segment.parts[index].data if index < len(segment.parts) else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            current = self._current()
+            return {
+                "segments": sum(1 for segment in self.segments.values() if segment.complete),
+                "sequence": self.sequence,
+                "parts": len(current.parts) if current is not None else 0,
+                "max_segment_s": round(self.max_segment, 3),
+                "max_part_s": round(self.max_part, 3),
+            }
+
+
+class CMAFSink:
+    # file object for the mp4 muxer: splits its byte stream into the init segment and one part
+    # per moof+mdat fragment, and hands them to the store
+
+    def __init__(self, writer: 'HLSWriter'):
+        self.writer = writer
+        self.buffer = bytearray()
+        self.init = b''
+        self.track = None
+        self.moof = None
+
+    def write(self, data) -> int:
+        self.buffer += data
+        while len(self.buffer) >= 8:
+            size, kind = struct.unpack_from('>I4s', self.buffer)
+            if size == 1:
+                if len(self.buffer) < 16:
+                    break
+                size = struct.unpack_from('>Q', self.buffer, 8)[0]
+            if size < 8 or len(self.buffer) < size:
+                break
+            box = bytes(self.buffer[:size])
+            del self.buffer[:size]
+            self.box(kind, box)
+        return len(data)
+
+    def box(self, kind: bytes, box: bytes):
+        if kind in (b'ftyp', b'moov'):
+            self.init += box
+            if kind == b'moov':
+                self.track = video_track(self.init)
+                self.writer.store.add_init(self.init)
+        elif kind == b'moof':
+            self.moof = box
+        elif kind == b'mdat' and self.moof is not None:
+            self.writer.part(self.moof, box, self.track)
+            self.moof = None
+
+
+class HLSWriter(StreamWriter):
+    # encodes once into fragmented mp4 and publishes cmaf parts for ll-hls; keyframes are forced
+    # on segment boundaries so every segment starts independently
+
+    def __init__(self, sessionid: int = 0, fps: float = 25, bitrate: int = 2000000,
+                 segment_duration: float = 2.0, part_duration: float = 0.2, window: int = 6,
+                 directory: str = ''):
+        super().__init__(f"hls:{sessionid}", sessionid, fps, bitrate)
+        self.part_duration = part_duration
+        self.gop = max(1, round(segment_duration * fps))
+        self.store = HLSStore(segment_duration, part_duration, window, directory)
+        self.keyframes = set()
+        self.slots = deque(maxlen=max(64, 4 * self.gop))
+        self.pending = b''
+
+    def open_output(self):
+        import av
+
+        self.keyframes.clear()
+        self.slots.clear()
+        self.pending = b''
+        return av.open(CMAFSink(self), mode='w', format='mp4', options={
+            'movflags': 'empty_moov+default_base_moof+frag_keyframe+cmaf',
+            'frag_duration': str(int(self.part_duration * 1e6)),
+        })
+
+    def video_options(self) -> dict:
+        return {'preset': 'veryfast', 'tune': 'zerolatency', 'g': str(self.gop), 'sc_threshold': '0'}
+
+    def before_encode(self, frame, index: int):
+        from av.video.frame import PictureType
+
+        if index % self.gop == 0:
+            frame.pict_type = PictureType.I
+            self.keyframes.add(frame.pts)
+        # frames arrive here at their playout slot, parts are measured against it
+        self.slots.append((frame.pts, time.monotonic()))
+
+    def part(self, moof: bytes, mdat: bytes, track):
+        timing = fragment_timing(moof, track[0]) if track is not None else None
+        if timing is None or timing[1] == 0:
+            # a fragment without video samples is carried into the next part, a part may hold
+            # several fragments
+            self.pending += moof + mdat
+            return
+        decode_time, duration = timing
+        start_ms = round(decode_time * 1000 / track[1])
+        independent = start_ms in self.keyframes
+        self.keyframes.discard(start_ms)
+        data, self.pending = self.pending + moof + mdat, b''
+        self.store.add_part(data, duration / track[1], independent)
+        for pts, slot in self.slots:
+            if pts == start_ms:
+                hls_part_latency_seconds.observe(time.monotonic() - slot)
+                break
+
+    def stats(self) -> dict:
+        return dict(super().stats(), hls=self.store.stats())
@@ -0,0 +1,299 @@
+import time
+import queue
+import asyncio
+import threading
+import fractions
+from typing import Optional
+
+import numpy as np
+
+from config.settings import settings
+from ..core import metrics
+
+SAMPLE_RATE = 16000
+VIDEO_TIME_BASE = fractions.Fraction(1, 1000)
+AUDIO_TIME_BASE = fractions.Fraction(1, SAMPLE_RATE)
+# stamps for watch-only webrtc viewers, same units as the webrtc tracks
+VIEWER_CLOCK_RATE = {'video': 90000, 'audio': SAMPLE_RATE}
+AAC_FRAME_SIZE = 1024
+
+# room for the render-ahead buffer plus the batches in flight, as for the webrtc tracks
+VIDEO_QUEUE_SIZE = max(100, settings.render_ahead + 4 * settings.batch_size)
+
+
+def container_format(url: str) -> Optional[str]:
+    # rtmp wants flv and srt/udp an mpeg-ts stream; files are guessed from their extension
+    scheme = url.split('://', 1)[0].lower() if '://' in url else ''
+    if scheme in ('rtmp', 'rtmps'):
+        return 'flv'
+    if scheme in ('srt', 'udp', 'tcp'):
+        return 'mpegts'
+    return None
+
+
+class AACEncoder:
+    # s16 mono frames in, aac muxed out; a clock correction leaves a hole in the timeline,
+    # it is filled with silence so audio stays on the video timeline
+
+    def __init__(self, container):
+        self.container = container
+        self.stream = container.add_stream('aac', rate=SAMPLE_RATE, layout='mono')
+        self.samples = np.zeros(0, dtype=np.float32)
+        self.pts = 0
+
+    def encode(self, frame, offset: float):
+        import av
+
+        pcm = frame.to_ndarray().reshape(-1).astype(np.float32) / 32768
+        gap = round(offset * SAMPLE_RATE) - (self.pts + self.samples.shape[0])
+        if gap > 0:
+            pcm = np.concatenate([np.zeros(gap, dtype=np.float32), pcm])
+        self.samples = np.concatenate([self.samples, pcm])
+        while self.samples.shape[0] >= AAC_FRAME_SIZE:
+            out = av.AudioFrame.from_ndarray(self.samples[:AAC_FRAME_SIZE].reshape(1, -1), format='fltp', layout='mono')
+            out.sample_rate = SAMPLE_RATE
+            out.pts = self.pts
+            out.time_base = AUDIO_TIME_BASE
+            for packet in self.stream.encode(out):
+                self.container.mux(packet)
+            self.pts += AAC_FRAME_SIZE
+            self.samples = self.samples[AAC_FRAME_SIZE:]
+
+    def flush(self):
+        for packet in self.stream.encode(None):
+            self.container.mux(packet)
+
+
+class StreamWriter:
+    # one long-lived encoder and muxer per pushed session; frames are queued without blocking
+    # the event loop and dropped when the writer falls behind, a lost connection is reopened
+
+    drop_reason = 'push_backlog'
+
+    def __init__(self, url: str, sessionid: int = 0, fps: float = 25, bitrate: int = 2000000,
+                 queue_size: int = 200, retry_max: float = 10.0, drop_policy: str = 'newest'):
+        self.url = url
+        self.sessionid = sessionid
+        self.fps = fps
+        self.bitrate = bitrate
+        self.retry_max = retry_max
+        # a full queue drops the incoming frame ('newest') or evicts the longest queued one ('oldest')
+        self.drop_policy = drop_policy
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._quit = threading.Event()
+        self._thread = None
+
+        self.connected = False
+        self.connects = 0
+        self.reconnects = 0
+        self.dropped = 0
+        self.video_frames = 0
+        self.audio_frames = 0
+        self.last_error = None
+
+    def start(self):
+        if self._thread is None:
+            self._quit.clear()
+            self._thread = threading.Thread(target=self._run, name=f"push-{self.sessionid}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._quit.set()
+            self._thread.join()
+            self._thread = None
+
+    def put(self, kind: str, frame, position: float):
+        try:
+            self._queue.put_nowait((kind, frame, position))
+            return
+        except queue.Full:
+            pass
+        self.dropped += 1
+        metrics.dropped_frames.inc(1, self.sessionid, self.drop_reason)
+        if self.drop_policy == 'oldest':
+            try:
+                self._queue.get_nowait()
+                self._queue.put_nowait((kind, frame, position))
+            except (queue.Empty, queue.Full):
+                pass
+
+    def _run(self):
+        retry = 0.5
+        while not self._quit.is_set():
+            try:
+                self._stream()
+                retry = 0.5
+            except Exception as e:
+                self.last_error = repr(e)
+                self.reconnects += 1
+                print(f"push to {self.url} failed, retrying in {retry:.1f}s: {e!r}")
+                # frames keep arriving while disconnected, only the newest are worth sending
+                self._quit.wait(retry)
+                retry = min(retry * 2, self.retry_max)
+            finally:
+                self.connected = False
+
+    def _next(self):
+        while not self._quit.is_set():
+            try:
+                return self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return None
+
+    def _stream(self):
+        # the output opens at the first video frame, which fixes the size and the pts origin
+        item = self._next()
+        while item is not None and item[0] != 'video':
+            item = self._next()
+        if item is None:
+            return
+        _, frame, base = item
+
+        container = self.open_output()
+        try:
+            video = container.add_stream('libx264', rate=round(self.fps), options=self.video_options())
+            video.width = frame.width
+            video.height = frame.height
+            video.pix_fmt = 'yuv420p'
+            video.bit_rate = self.bitrate
+            video.codec_context.time_base = VIDEO_TIME_BASE
+            audio = AACEncoder(container)
+            self.connected = True
+            self.connects += 1
+
+            last_pts = -1
+            index = 0
+            while item is not None:
+                kind, frame, position = item
+                offset = position - base
+                if offset >= 0 and kind == 'video':
+                    pts = round(offset * 1000)
+                    if pts > last_pts:
+                        out = frame.reformat(format='yuv420p')
+                        out.pts = pts
+                        out.time_base = VIDEO_TIME_BASE
+                        self.before_encode(out, index)
+                        index += 1
+                        for packet in video.encode(out):
+                            container.mux(packet)
+                        last_pts = pts
+                        self.video_frames += 1
+                elif offset >= 0:
+                    audio.encode(frame, offset)
+                    self.audio_frames += 1
+                item = self._next()
+
+            for packet in video.encode(None):
+                container.mux(packet)
+            audio.flush()
+        finally:
+            container.close()
+
+    def open_output(self):
+        import av
+        return av.open(self.url, mode='w', format=container_format(self.url), timeout=5)
+
+    def video_options(self) -> dict:
+        return {'preset': 'veryfast', 'tune': 'zerolatency', 'g': str(2 * round(self.fps))}
+
+    def before_encode(self, frame, index: int):
+        pass
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "connected": self.connected,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "dropped": self.dropped,
+            "backlog": self._queue.qsize(),
+            "video_frames": self.video_frames,
+            "audio_frames": self.audio_frames,
+            "last_error": self.last_error,
+        }
+
+
+class PushStreamTrack:
+    # same queue protocol as the webrtc PlayerStreamTrack, frames go to the shared encoder instead of a peer
+
+    def __init__(self, player, kind):
+        self.kind = kind
+        self._player = player
+        self._queue = asyncio.Queue(maxsize=VIDEO_QUEUE_SIZE if kind == 'video' else 2 * VIDEO_QUEUE_SIZE)
+        self.current_frame_count = 0
+        self.fps = None
+
+    async def run(self):
+        clock = self._player.clock
+        ptime = clock.video_ptime if self.kind == 'video' else clock.audio_ptime
+        count, started = 0, time.perf_counter()
+        while True:
+            frame, eventpoint, trace = await self._queue.get()
+            position = await clock.pace(self.kind, self.current_frame_count, ptime)
+            self.current_frame_count += 1
+            self._player.writer.put(self.kind, frame, position)
+            frame.pts = round(position * VIEWER_CLOCK_RATE[self.kind])
+            frame.time_base = fractions.Fraction(1, VIEWER_CLOCK_RATE[self.kind])
+            self._player.publish(self.kind, frame)
+            if trace is not None:
+                self._player.record_trace(trace)
+            if eventpoint:
+                self._player.notify(eventpoint)
+            if self.kind == 'video':
+                count += 1
+                if count == 100:
+                    self.fps = round(count / (time.perf_counter() - started), 2)
+                    count, started = 0, time.perf_counter()
+
+
+class PushPlayer:
+    # drives a session without a browser: render, pace on the session clock, encode once, push
+
+    def __init__(self, nerfreal, url: str = '', writer: StreamWriter = None):
+        self.__container = nerfreal
+        self.clock = nerfreal.clock
+        # the writer encodes raw frames, recordings are taken from the frames as well
+        nerfreal.record_source = 'frames'
+        self.writer = writer or StreamWriter(url, nerfreal.sessionid, 1 / self.clock.video_ptime,
+                                             getattr(settings, 'push_bitrate', 2000000))
+        self.audio = PushStreamTrack(self, kind="audio")
+        self.video = PushStreamTrack(self, kind="video")
+        self.__tasks = []
+        self.__thread = None
+        self.__thread_quit = None
+
+    def notify(self, eventpoint):
+        self.__container.notify(eventpoint)
+
+    def record_trace(self, trace):
+        self.__container.tracer.record(trace)
+
+    def publish(self, kind, frame):
+        self.__container.broadcast.publish(kind, frame)
+
+    def start(self, loop):
+        self.writer.start()
+        self.__tasks = [loop.create_task(self.audio.run()), loop.create_task(self.video.run())]
+        if settings.runtime == 'pool':
+            self.__container.start(loop, self.audio, self.video)
+        else:
+            self.__thread_quit = threading.Event()
+            self.__thread = threading.Thread(target=self.__container.render, name="push-render",
+                                             args=(self.__thread_quit, loop, self.audio, self.video))
+            self.__thread.start()
+
+    def stop(self):
+        if self.__thread is not None:
+            self.__thread_quit.set()
+            self.__thread.join()
+            self.__thread = None
+        else:
+            self.__container.stop()
+        for task in self.__tasks:
+            task.cancel()
+        self.writer.stop()
+
+    def stats(self) -> dict:
+        return dict(self.writer.stats(), fps=self.video.fps)
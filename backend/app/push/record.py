@@ -0,0 +1,179 @@
+import os
+import time
+import queue
+import weakref
+
+import numpy as np
+
+from .push import StreamWriter, AACEncoder, SAMPLE_RATE
+
+# fragments are flushed to disk about once a second, a crash loses at most the last one
+FRAGMENT_OPTIONS = {'movflags': 'empty_moov+default_base_moof+frag_keyframe', 'frag_duration': '1000000'}
+
+# every recorder whose writer thread may still be running, for stop_all
+_recorders = weakref.WeakSet()
+
+
+class Recorder(StreamWriter):
+    # records one session into its own fragmented mp4 on the writer thread: the render side only
+    # enqueues raw frames, a full queue drops by policy and stopping closes the file without a
+    # remux. Timestamps are given at enqueue time, so a dropped frame leaves a gap (the previous
+    # picture holds, audio is filled with silence) instead of shifting everything after it.
+    # With source 'packets' the tracks hand over what they send: h264 packets are remuxed as
+    # they are and only the audio is encoded
+
+    drop_reason = 'record_backlog'
+
+    def __init__(self, path: str, sessionid: int = 0, fps: float = 25, bitrate: int = 2000000,
+                 queue_size: int = 100, drop_policy: str = 'newest', source: str = 'frames'):
+        super().__init__(path, sessionid, fps, bitrate, queue_size=queue_size, drop_policy=drop_policy)
+        self.path = path
+        self.source = source
+        self.video_index = 0
+        self.audio_samples = 0
+        self.started_at = None
+        self.finished_at = None
+        self._closing = False
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.started_at = time.time()
+        _recorders.add(self)
+        super().start()
+
+    def put_video(self, image: np.ndarray):
+        # bgr24 frame as composed by the render thread; converted on the writer thread
+        position = self.video_index / self.fps
+        self.video_index += 1
+        self.put('video', image, position)
+
+    def put_audio(self, pcm: np.ndarray):
+        # int16 samples at SAMPLE_RATE
+        position = self.audio_samples / SAMPLE_RATE
+        self.audio_samples += pcm.shape[0]
+        self.put('audio', pcm, position)
+
+    def put(self, kind: str, frame, position: float):
+        # nothing is taken after close, the writer only drains what was queued before it
+        if not self._closing:
+            super().put(kind, frame, position)
+
+    @property
+    def active(self) -> bool:
+        # started, not closed and not failed; a closed recorder may still be finishing its file
+        return self._thread is not None and self._thread.is_alive() and not self._closing
+
+    @property
+    def failed(self) -> bool:
+        return self.last_error is not None
+
+    def close(self):
+        # returns at once: the writer drains what is queued, flushes the encoders and closes the file
+        self._closing = True
+
+    def stop(self):
+        # blocks until the file is complete, for shutdown
+        self.close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        # a recording is not reopened after an error, that would truncate the file
+        try:
+            if self.source == 'packets':
+                self._remux()
+            else:
+                self._stream()
+        except Exception as e:
+            self.last_error = repr(e)
+            print(f"recording {self.path} failed: {e!r}")
+        finally:
+            self.connected = False
+            self.finished_at = time.time()
+
+    def _next(self):
+        from av import AudioFrame, VideoFrame
+
+        while not self._quit.is_set():
+            try:
+                kind, frame, position = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._closing:
+                    return None
+                continue
+            if self.source == 'packets':
+                return kind, frame, position
+            if kind == 'video':
+                frame = VideoFrame.from_ndarray(frame, format='bgr24')
+            else:
+                samples = frame
+                frame = AudioFrame(format='s16', layout='mono', samples=samples.shape[0])
+                frame.planes[0].update(samples.tobytes())
+                frame.sample_rate = SAMPLE_RATE
+            return kind, frame, position
+        return None
+
+    def _remux(self):
+        import av
+        from ..webrtc.encoder import parameter_sets
+
+        # a decodable file starts at a keyframe, which also fixes the size and the pts origin
+        item = self._next()
+        while item is not None and not (item[0] == 'video' and item[1][0].is_keyframe):
+            item = self._next()
+        if item is None:
+            return
+        _, (packet, width, height), base = item
+
+        container = self.open_output()
+        try:
+            video = container.add_stream('h264', rate=round(self.fps))
+            video.width = width
+            video.height = height
+            video.pix_fmt = 'yuv420p'
+            video.time_base = packet.time_base
+            video.codec_context.extradata = parameter_sets(bytes(packet))
+            audio = AACEncoder(container)
+            self.connected = True
+            self.connects += 1
+
+            last_pts = -1
+            while item is not None:
+                kind, data, position = item
+                offset = position - base
+                if offset >= 0 and kind == 'video':
+                    packet = data[0]
+                    pts = round(offset / packet.time_base)
+                    if pts > last_pts and packet.size:
+                        # a copy: the sender still reads the original
+                        out = av.Packet(bytes(packet))
+                        out.pts = out.dts = pts
+                        out.time_base = packet.time_base
+                        out.is_keyframe = packet.is_keyframe
+                        out.stream = video
+                        container.mux(out)
+                        last_pts = pts
+                        self.video_frames += 1
+                elif offset >= 0:
+                    audio.encode(data, offset)
+                    self.audio_frames += 1
+                item = self._next()
+            audio.flush()
+        finally:
+            container.close()
+
+    def open_output(self):
+        import av
+
+        return av.open(self.path, mode='w', format='mp4', options=FRAGMENT_OPTIONS)
+
+    def stats(self) -> dict:
+        return dict(super().stats(), path=self.path, source=self.source,
+                    recording=self.active, failed=self.failed, finished=self.finished_at is not None)
+
+
+def stop_all():
+    # shutdown: waits until every recording, closed or not, has written its last fragment
+    for recorder in list(_recorders):
+        recorder.stop()
@@ -0,0 +1,164 @@
+import os
+import asyncio
+import random
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Query, Request
+from fastapi.responses import JSONResponse, Response
+
+from config.settings import settings
+from ..core.session_manager import session_manager
+from ..core.session_pool import session_pool
+from ..services.model_service import readiness
+
+router = APIRouter()
+pushers = {}
+
+
+async def start_push(url: str = '', hls: bool = False) -> int:
+    from ..push import PushPlayer, HLSWriter
+
+    sessionid = random.randint(100000, 999999)
+    session_manager.create_session(sessionid)
+
+    t = time.perf_counter()
+    nerfreal = session_pool.claim(sessionid)
+    if nerfreal is None:
+        nerfreal = await asyncio.get_event_loop().run_in_executor(
+            None, session_manager.build_nerfreal, sessionid
+        )
+    session_pool.record_claim(time.perf_counter() - t)
+    session_manager.nerfreals[sessionid] = nerfreal
+
+    writer = None
+    if hls:
+        fps = 1 / nerfreal.clock.video_ptime
+        directory = os.path.join(settings.hls_dir, str(sessionid)) if settings.hls_dir else ''
+        writer = HLSWriter(sessionid, fps, settings.push_bitrate, settings.hls_segment_duration,
+                           settings.hls_part_duration, settings.hls_window, directory)
+    player = PushPlayer(nerfreal, url, writer)
+    pushers[sessionid] = player
+    player.start(asyncio.get_running_loop())
+    return sessionid
+
+async def stop_push(sessionid: int):
+    player = pushers.pop(sessionid, None)
+    if player is None:
+        return None
+    await asyncio.get_running_loop().run_in_executor(None, player.stop)
+    session_manager.cleanup_session(sessionid)
+    return player.stats()
+
+
+@router.post("/push")
+async def push(request: Request):
+    if not readiness.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"code": -1, "msg": readiness.error or "Models are still loading", "data": readiness.snapshot()}
+        )
+    try:
+        params = await request.json()
+    except Exception:
+        params = {}
+    url = params.get('url') or settings.push_url
+    if not url:
+        return JSONResponse(content={"code": -1, "msg": "No push url given and LIVETALKING_PUSH_URL is not set"})
+    try:
+        sessionid = await start_push(url)
+    except Exception as e:
+        return JSONResponse(content={"code": -1, "msg": str(e)})
+    return JSONResponse(content={"code": 0, "sessionid": sessionid})
+
+
+@router.post("/push/stop")
+async def push_stop(request: Request):
+    try:
+        params = await request.json()
+        sessionid = params.get('sessionid', 0)
+        stats = await stop_push(sessionid)
+        if stats is None:
+            return JSONResponse(content={"code": -1, "msg": f"Push session {sessionid} not found"})
+        return JSONResponse(content={"code": 0, "data": stats})
+    except Exception as e:
+        return JSONResponse(content={"code": -1, "msg": str(e)})
+
+
+@router.get("/push")
+async def push_list():
+    return JSONResponse(
+        content={"code": 0, "data": {sessionid: player.stats() for sessionid, player in pushers.items()}}
+    )
+
+
+@router.post("/hls")
+async def hls(request: Request):
+    # encoded once and served as ll-hls from /hls/{sessionid}/index.m3u8, stopped with /push/stop
+    if not readiness.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"code": -1, "msg": readiness.error or "Models are still loading", "data": readiness.snapshot()}
+        )
+    try:
+        sessionid = await start_push(hls=True)
+    except Exception as e:
+        return JSONResponse(content={"code": -1, "msg": str(e)})
+    return JSONResponse(content={"code": 0, "sessionid": sessionid,
+                                 "playlist": f"/hls/{sessionid}/index.m3u8"})
+
+
+@router.get("/hls/{sessionid}/{name}")
+async def hls_file(sessionid: int, name: str,
+                   msn: Optional[int] = Query(None, alias='_HLS_msn'),
+                   part: Optional[int] = Query(None, alias='_HLS_part')):
+    player = pushers.get(sessionid)
+    store = getattr(player.writer, 'store', None) if player is not None else None
+    if store is None:
+        return Response(status_code=404)
+    if name == 'index.m3u8':
+        # blocking playlist reload: hold the request until the asked segment or part exists
+        if msn is not None:
+            deadline = time.monotonic() + 3 * store.max_segment
+            while not store.has(msn, part):
+                if time.monotonic() > deadline or pushers.get(sessionid) is not player:
+                    return Response(status_code=503)
+                await asyncio.sleep(0.02)
+        playlist = store.playlist()
+        if not playlist:
+            return Response(status_code=404)
+        return Response(content=playlist, media_type='application/vnd.apple.mpegurl',
+                        headers={"Cache-Control": "no-cache"})
+    try:
+        data = store.get(name)
+    except ValueError:
+        data = None
+    if data is None:
+        return Response(status_code=404)
+    media_type = 'video/mp4' if name.endswith('.mp4') else 'video/iso.segment'
+    return Response(content=data, media_type=media_type, headers={"Cache-Control": "max-age=60"})
+
+
+async def on_startup():
+    # with LIVETALKING_TRANSPORT=rtmp the server pushes one session as soon as the models are
+    # ready, with LIVETALKING_TRANSPORT=hls it serves one as ll-hls
+    if not (settings.transport == 'rtmp' and settings.push_url) and settings.transport != 'hls':
+        return
+
+    async def autostart():
+        while not readiness.ready:
+            if readiness.error:
+                return
+            await asyncio.sleep(0.5)
+        if settings.transport == 'hls':
+            sessionid = await start_push(hls=True)
+            print(f"serving session {sessionid} at /hls/{sessionid}/index.m3u8")
+        else:
+            sessionid = await start_push(settings.push_url)
+            print(f"pushing session {sessionid} to {settings.push_url}")
+
+    asyncio.get_running_loop().create_task(autostart())
+
+async def on_shutdown():
+    for sessionid in list(pushers):
+        await stop_push(sessionid)
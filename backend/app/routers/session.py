@@ -1,8 +1,12 @@
 from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 
 from config.settings import settings
 from ..core.session_manager import session_manager
+from ..core.session_pool import session_pool
+from ..core.runtime import runtime
+from ..core import importtime, metrics
+from ..services.model_service import readiness
 
 router = APIRouter()
 
@@ -110,13 +114,21 @@ async def record(request: Request):
                 content={"code": -1, "msg": f"Session {sessionid} not found"}
             )
 
+        path = None
         if params['type'] == 'start_record':
-            session_manager.start_recording(sessionid)
+            path = session_manager.start_recording(sessionid)
         elif params['type'] == 'end_record':
-            session_manager.stop_recording(sessionid)
+            # returns at once, the file is finished by the recorder thread
+            path = session_manager.stop_recording(sessionid)
 
+        stats = session_manager.nerfreals[sessionid].recording_stats()
+        if stats is not None and stats["failed"]:
+            # the writer thread gave up, the file is incomplete or missing
+            return JSONResponse(
+                content={"code": -1, "msg": f"recording failed: {stats['last_error']}", "data": {"path": path}}
+            )
         return JSONResponse(
-            content={"code": 0, "msg": "ok"}
+            content={"code": 0, "msg": "ok", "data": {"path": path}}
         )
     except KeyError as e:
         return JSONResponse(
@@ -182,6 +194,50 @@ async def is_speaking(request: Request):
         )
 
 
+@router.get("/stats")
+async def stats():
+    return JSONResponse(
+        content={"code": 0, "data": {
+            "sessions": session_manager.session_count(),
+            "pool": session_pool.stats(),
+            "runtime": runtime.stats(),
+            "session_stats": session_manager.session_stats(),
+            "imports": [
+                {"module": name, "self_ms": round(self_s * 1000, 1), "cumulative_ms": round(cumulative_s * 1000, 1)}
+                for name, self_s, cumulative_s in importtime.recorder.top(10)
+            ],
+        }}
+    )
+
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/trace")
+async def trace(sessionid: int = 0):
+    # sampled per-frame latency trace in chrome trace event format
+    data = session_manager.chrome_trace(sessionid)
+    if data is None:
+        return JSONResponse(
+            status_code=200,
+            content={"code": -1, "msg": f"Session {sessionid} not found"}
+        )
+    return JSONResponse(
+        content=data,
+        headers={"Content-Disposition": f'attachment; filename="livetalking-trace-{sessionid}.json"'}
+    )
+
+
+@router.get("/ready")
+async def ready():
+    return JSONResponse(
+        status_code=200 if readiness.ready else 503,
+        content={"code": 0 if readiness.ready else -1, "data": readiness.snapshot()}
+    )
+
+
 @router.websocket("/ws/audio")
 async def audio_websocket(websocket: WebSocket, sessionid: int = 0):
     await websocket.accept()
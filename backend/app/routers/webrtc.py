@@ -1,15 +1,15 @@
 import asyncio
 import random
+import time
 from typing import Dict
 
 from fastapi import APIRouter, Request, Response, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.responses import JSONResponse
-from aiortc import RTCPeerConnection, RTCSessionDescription, RTCIceServer, RTCConfiguration
-from aiortc.rtcrtpsender import RTCRtpSender
 
 from config.settings import settings
-from ..webrtc import HumanPlayer
 from ..core.session_manager import session_manager
+from ..core.session_pool import session_pool
+from ..services.model_service import readiness
 
 router = APIRouter()
 pcs = set()
@@ -37,18 +37,8 @@ def randN(N: int) -> int:
     return random.randint(min_val, max_val - 1)
 
 
-@router.post("/offer")
-async def offer(request: Request):
-    params = await request.json()
-    offer = RTCSessionDescription(sdp=params["sdp"], type=params["type"])
-
-    sessionid = randN(6)
-    session_manager.create_session(sessionid)
-
-    nerfreal = await asyncio.get_event_loop().run_in_executor(
-        None, session_manager.build_nerfreal, sessionid
-    )
-    session_manager.nerfreals[sessionid] = nerfreal
+def ice_configuration():
+    from aiortc import RTCIceServer, RTCConfiguration
 
     ice_servers = [
         RTCIceServer(urls=[
@@ -64,7 +54,90 @@ async def offer(request: Request):
             credential='webrtc'
         )
     ]
-    pc = RTCPeerConnection(configuration=RTCConfiguration(iceServers=ice_servers))
+    return RTCConfiguration(iceServers=ice_servers)
+
+def prefer_video_codecs(pc):
+    from aiortc.rtcrtpsender import RTCRtpSender
+
+    capabilities = RTCRtpSender.getCapabilities("video")
+    preferences = list(filter(lambda x: x.name == "H264", capabilities.codecs))
+    if settings.record_source != 'packets' and not settings.idle_cache:
+        # the video track sends h264 packets in those modes, vp8 cannot be negotiated
+        preferences += list(filter(lambda x: x.name == "VP8", capabilities.codecs))
+    preferences += list(filter(lambda x: x.name == "rtx", capabilities.codecs))
+    transceiver = pc.getTransceivers()[1]
+    transceiver.setCodecPreferences(preferences)
+
+
+async def watch(offer, sessionid: int):
+    # a watch-only peer: no new render, it receives a copy of what the session already plays out
+    from aiortc import RTCPeerConnection
+    from ..webrtc import ViewerStreamTrack
+
+    if not session_manager.session_exists(sessionid):
+        return JSONResponse(
+            content={"code": -1, "msg": f"Session {sessionid} not found"}
+        )
+    broadcast = session_manager.nerfreals[sessionid].broadcast
+
+    pc = RTCPeerConnection(configuration=ice_configuration())
+    pcs.add(pc)
+    tracks = (ViewerStreamTrack(broadcast, "audio"), ViewerStreamTrack(broadcast, "video"))
+
+    @pc.on("connectionstatechange")
+    async def on_connectionstatechange():
+        if pc.connectionState in ("failed", "closed"):
+            for track in tracks:
+                track.stop()
+            pcs.discard(pc)
+            if pc.connectionState == "failed":
+                try:
+                    await asyncio.wait_for(pc.close(), timeout=2.0)
+                except Exception:
+                    pass
+
+    for track in tracks:
+        pc.addTrack(track)
+    prefer_video_codecs(pc)
+
+    await pc.setRemoteDescription(offer)
+    answer = await pc.createAnswer()
+    await pc.setLocalDescription(answer)
+
+    return JSONResponse(
+        content={"sdp": pc.localDescription.sdp, "type": pc.localDescription.type, "sessionid": sessionid, "watch": True}
+    )
+
+
+@router.post("/offer")
+async def offer(request: Request):
+    if not readiness.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"code": -1, "msg": readiness.error or "Models are still loading", "data": readiness.snapshot()}
+        )
+
+    from aiortc import RTCPeerConnection, RTCSessionDescription
+    from ..webrtc import HumanPlayer
+
+    params = await request.json()
+    offer = RTCSessionDescription(sdp=params["sdp"], type=params["type"])
+    if params.get("watch") is not None:
+        return await watch(offer, int(params["watch"]))
+
+    sessionid = randN(6)
+    session_manager.create_session(sessionid)
+
+    t = time.perf_counter()
+    nerfreal = session_pool.claim(sessionid)
+    if nerfreal is None:
+        nerfreal = await asyncio.get_event_loop().run_in_executor(
+            None, session_manager.build_nerfreal, sessionid
+        )
+    session_pool.record_claim(time.perf_counter() - t)
+    session_manager.nerfreals[sessionid] = nerfreal
+
+    pc = RTCPeerConnection(configuration=ice_configuration())
     pcs.add(pc)
 
     @pc.on("connectionstatechange")
@@ -91,12 +164,7 @@ async def offer(request: Request):
     player = HumanPlayer(session_manager.nerfreals[sessionid])
     audio_sender = pc.addTrack(player.audio)
     video_sender = pc.addTrack(player.video)
-    capabilities = RTCRtpSender.getCapabilities("video")
-    preferences = list(filter(lambda x: x.name == "H264", capabilities.codecs))
-    preferences += list(filter(lambda x: x.name == "VP8", capabilities.codecs))
-    preferences += list(filter(lambda x: x.name == "rtx", capabilities.codecs))
-    transceiver = pc.getTransceivers()[1]
-    transceiver.setCodecPreferences(preferences)
+    prefer_video_codecs(pc)
 
     await pc.setRemoteDescription(offer)
 
@@ -0,0 +1,70 @@
+import time
+from typing import AsyncIterator, List
+
+from config.settings import settings
+
+
+class LLMProvider:
+    name = 'base'
+
+    async def stream(self, messages: List[dict]) -> AsyncIterator[str]:
+        # yields text deltas as the model produces them
+        raise NotImplementedError
+        yield
+
+class OpenAIProvider(LLMProvider):
+    # any server speaking the openai chat completions api (vllm, ollama, llama.cpp, ...)
+    name = 'openai'
+
+    def __init__(self, base_url: str, api_key: str, model: str):
+        from openai import AsyncOpenAI
+
+        self.model = model
+        self.client = AsyncOpenAI(base_url=base_url or None, api_key=api_key or 'EMPTY')
+
+    async def stream(self, messages):
+        response = await self.client.chat.completions.create(model=self.model, messages=messages, stream=True)
+        try:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await response.close()
+
+_provider = None
+
+def get_provider() -> LLMProvider:
+    global _provider
+
+    if _provider is None:
+        _provider = OpenAIProvider(settings.llm_base_url, settings.llm_api_key, settings.llm_model)
+    return _provider
+
+
+async def llm_response(text: str, nerfreal, provider: LLMProvider = None) -> str:
+    from ..models.ttsreal import SentenceBuffer
+
+    provider = provider or get_provider()
+    messages = []
+    if settings.llm_system_prompt:
+        messages.append({'role': 'system', 'content': settings.llm_system_prompt})
+    messages.append({'role': 'user', 'content': text})
+
+    start = time.perf_counter()
+    first = None
+    buffer = SentenceBuffer()
+    answer = []
+    async for delta in provider.stream(messages):
+        answer.append(delta)
+        for sentence in buffer.push(delta):
+            if first is None:
+                first = time.perf_counter() - start
+            nerfreal.put_msg_txt(sentence)
+    tail = buffer.flush()
+    if tail:
+        if first is None:
+            first = time.perf_counter() - start
+        nerfreal.put_msg_txt(tail)
+    if first is not None:
+        print(f"llm first sentence in {first:.3f}s, answer in {time.perf_counter() - start:.3f}s")
+    return ''.join(answer)
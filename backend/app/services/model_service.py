@@ -1,7 +1,65 @@
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 from config.settings import settings
+from ..core import importtime
 
 model = None
 avatar = None
+custom_assets = None
+
+
+class Readiness:
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self.ready = False
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def add(self, name: str):
+        with self._lock:
+            self.phases[name] = {"status": "pending", "seconds": None}
+
+    def run(self, name: str, fn, *args):
+        with self._lock:
+            phase = self.phases.setdefault(name, {"status": "pending", "seconds": None})
+            phase["status"] = "running"
+        t = time.perf_counter()
+        try:
+            result = fn(*args)
+        except Exception as e:
+            with self._lock:
+                phase["status"] = "failed"
+                phase["seconds"] = round(time.perf_counter() - t, 3)
+                self.error = f"{name}: {e}"
+            raise
+        with self._lock:
+            phase["status"] = "done"
+            phase["seconds"] = round(time.perf_counter() - t, 3)
+        return result
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            phases = {name: dict(phase) for name, phase in self.phases.items()}
+        done = sum(1 for phase in phases.values() if phase["status"] == "done")
+        elapsed = None
+        if self.started_at is not None:
+            elapsed = round((self.finished_at or time.perf_counter()) - self.started_at, 3)
+        return {
+            "ready": self.ready,
+            "error": self.error,
+            "progress": f"{done}/{len(phases)}",
+            "elapsed": elapsed,
+            "phases": phases,
+        }
+
+readiness = Readiness()
 
 
 def load_model():
@@ -17,10 +75,58 @@ def load_avatar():
     global avatar
 
     from ..models.musereal import load_avatar as load_muse_avatar
-    avatar = load_muse_avatar(settings.avatar_id)  
+    avatar = load_muse_avatar(settings.avatar_id)
 
     return avatar
 
+def load_custom():
+    global custom_assets
+
+    from ..models.basereal import load_custom_assets
+    custom_assets = load_custom_assets(settings.customopt)
+
+    return custom_assets
+
 def warm_up(batch_size: int):
     from ..models.musereal import warm_up as muse_warm_up
     muse_warm_up(batch_size, model)
+
+def load_all():
+    global model
+
+    import torch
+    from ..models.musereal import load_vae, load_unet, load_whisper, get_device
+    from ..core.session_pool import session_pool
+
+    if readiness.started_at is None:
+        readiness.started_at = time.perf_counter()
+    for name in ("vae", "unet", "whisper", "avatar", "custom", "warm_up"):
+        readiness.add(name)
+    try:
+        with ThreadPoolExecutor(max_workers=5, thread_name_prefix="model-loader") as executor:
+            vae = executor.submit(readiness.run, "vae", load_vae)
+            unet = executor.submit(readiness.run, "unet", load_unet)
+            whisper = executor.submit(readiness.run, "whisper", load_whisper)
+            avatar_future = executor.submit(readiness.run, "avatar", load_avatar)
+            custom = executor.submit(readiness.run, "custom", load_custom)
+            unet, pe = unet.result()
+            model = (vae.result(), unet, pe, torch.tensor([0], device=get_device()), whisper.result())
+            avatar_future.result()
+            custom.result()
+        readiness.run("warm_up", warm_up, settings.batch_size)
+    except Exception as e:
+        readiness.finished_at = time.perf_counter()
+        print(f"model loading failed after {readiness.finished_at - readiness.started_at:.1f}s: {e!r}\n{traceback.format_exc()}")
+        return
+    readiness.finished_at = time.perf_counter()
+    readiness.ready = True
+    session_pool.start()
+    print(f"models ready in {readiness.finished_at - readiness.started_at:.1f}s")
+    if importtime.recorder.records:
+        print(f"slowest imports:\n{importtime.recorder.report(15)}")
+
+def start_loading():
+    if readiness.started_at is not None:
+        return
+    readiness.started_at = time.perf_counter()
+    threading.Thread(target=load_all, name="model-loader", daemon=True).start()
@@ -1,3 +1,3 @@
-from .webrtc import HumanPlayer
+from .webrtc import HumanPlayer, ViewerStreamTrack
 
-__all__ = ['HumanPlayer']
+__all__ = ['HumanPlayer', 'ViewerStreamTrack']
@@ -0,0 +1,53 @@
+import fractions
+
+VIDEO_TIME_BASE = fractions.Fraction(1, 90000)
+
+
+def parameter_sets(data: bytes) -> bytes:
+    # sps and pps nal units of an annex-b keyframe, as extradata for a muxer
+    units = []
+    for unit in data.replace(b'\x00\x00\x00\x01', b'\x00\x00\x01').split(b'\x00\x00\x01'):
+        if unit and unit[0] & 0x1f in (7, 8):
+            units.append(b'\x00\x00\x00\x01' + unit.rstrip(b'\x00'))
+    return b''.join(units)
+
+
+class H264PacketEncoder:
+    # encodes the video track once on the sending side: aiortc packetizes the returned av.Packet
+    # as is and the recorder remuxes the same bitstream, so recording costs no second encode.
+    # Same profile as aiortc's own encoder; keyframes come every gop frames because a keyframe
+    # request from the peer does not reach a track that sends packets
+
+    def __init__(self, fps: float, gop: int, bitrate: int = None):
+        from aiortc.codecs.h264 import DEFAULT_BITRATE
+
+        self.fps = fps
+        self.gop = gop
+        self.bitrate = bitrate or DEFAULT_BITRATE
+        self.codec = None
+        self.width = self.height = 0
+
+    def encode(self, frame, keyframe: bool = False):
+        import av
+
+        if self.codec is None or frame.width != self.width or frame.height != self.height:
+            self.width, self.height = frame.width, frame.height
+            self.codec = av.CodecContext.create('libx264', 'w')
+            self.codec.width = frame.width
+            self.codec.height = frame.height
+            self.codec.bit_rate = self.bitrate
+            self.codec.pix_fmt = 'yuv420p'
+            self.codec.framerate = fractions.Fraction(round(self.fps), 1)
+            self.codec.time_base = VIDEO_TIME_BASE
+            self.codec.options = {'level': '31', 'tune': 'zerolatency', 'g': str(self.gop)}
+            self.codec.profile = 'Baseline'
+        out = frame.reformat(format='yuv420p')
+        out.pts = frame.pts
+        out.time_base = frame.time_base
+        out.pict_type = av.video.frame.PictureType.I if keyframe else av.video.frame.PictureType.NONE
+        packets = self.codec.encode(out)
+        # zerolatency emits one packet per frame; an empty packet is skipped by the sender
+        packet = packets[0] if packets else av.Packet(b'')
+        packet.pts = packet.dts = frame.pts
+        packet.time_base = frame.time_base
+        return packet
@@ -0,0 +1,146 @@
+import threading
+
+from ..core import metrics
+
+idle_packets = metrics.registry.register(metrics.Counter(
+    'livetalking_idle_packets_total', 'Idle video frames sent from the pre-encoded loop instead of being encoded', ('session',)))
+
+
+def mirror_index(size: int, index: int) -> int:
+    turn = index // size
+    res = index % size
+    return res if turn % 2 == 0 else size - res - 1
+
+
+class IdleFrame:
+    # placeholder the compositor queues for an untouched avatar frame: position in the mirrored
+    # loop over cycle. It only becomes a VideoFrame when something has to encode or show it
+
+    __slots__ = ('cycle', 'position', 'pts', 'time_base', '_frame')
+
+    def __init__(self, cycle, position: int):
+        self.cycle = cycle
+        self.position = position
+        self.pts = None
+        self.time_base = None
+        self._frame = None
+
+    @property
+    def image(self):
+        return self.cycle[mirror_index(len(self.cycle), self.position)]
+
+    @property
+    def width(self) -> int:
+        return self.image.shape[1]
+
+    @property
+    def height(self) -> int:
+        return self.image.shape[0]
+
+    def video_frame(self):
+        from av import VideoFrame
+
+        if self._frame is None:
+            self._frame = VideoFrame.from_ndarray(self.image, format="bgr24")
+        self._frame.pts = self.pts
+        self._frame.time_base = self.time_base
+        return self._frame
+
+
+class IdleLoop:
+    # the mirrored idle cycle of one avatar encoded once for one encoder profile: packet bytes and
+    # keyframe flags by loop position. The loop wraps onto a keyframe, so it can repeat forever
+
+    def __init__(self, cycle, width: int, height: int, fps: float, gop: int, bitrate: int):
+        self.cycle = cycle
+        self.profile = (width, height, fps, gop, bitrate)
+        self.packets = None
+        self.error = None
+
+    def build(self):
+        import av
+        from .encoder import H264PacketEncoder, VIDEO_TIME_BASE
+
+        try:
+            width, height, fps, gop, bitrate = self.profile
+            encoder = H264PacketEncoder(fps, gop, bitrate)
+            period = 2 * len(self.cycle)
+            packets = []
+            for position in range(period):
+                frame = av.VideoFrame.from_ndarray(self.cycle[mirror_index(len(self.cycle), position)], format="bgr24")
+                frame.pts = round(position * 90000 / fps)
+                frame.time_base = VIDEO_TIME_BASE
+                packet = encoder.encode(frame, keyframe=position % gop == 0)
+                packets.append((bytes(packet), packet.is_keyframe))
+            self.packets = packets
+        except Exception as e:
+            self.error = repr(e)
+
+    @property
+    def ready(self) -> bool:
+        return self.packets is not None
+
+    def packet(self, position: int, pts: int, time_base):
+        import av
+
+        data, keyframe = self.packets[position % len(self.packets)]
+        packet = av.Packet(data)
+        packet.pts = packet.dts = pts
+        packet.time_base = time_base
+        packet.is_keyframe = keyframe
+        return packet
+
+    def keyframe(self, position: int) -> bool:
+        return self.packets[position % len(self.packets)][1]
+
+_loops = {}
+_loops_lock = threading.Lock()
+
+def idle_loop(cycle, width: int, height: int, fps: float, gop: int, bitrate: int) -> IdleLoop:
+    # one encode per avatar and profile, shared by every session; built in the background, the
+    # sessions keep encoding live until it is ready
+    key = (id(cycle), width, height, fps, gop, bitrate)
+    with _loops_lock:
+        loop = _loops.get(key)
+        if loop is None:
+            loop = _loops[key] = IdleLoop(cycle, width, height, fps, gop, bitrate)
+            threading.Thread(target=loop.build, name="idle-encode", daemon=True).start()
+        return loop
+
+
+class IdleSwitch:
+    # per track: sends the cached loop while the session is idle and the stream sits on a cached
+    # keyframe, goes back to the live encoder at the first live frame with a forced keyframe
+
+    def __init__(self, encoder, sessionid: int = 0):
+        self.encoder = encoder
+        self.sessionid = sessionid
+        self.on_loop = False
+        self.position = None
+
+    def cached(self, frame):
+        # the cached packet for an IdleFrame when the stream is on (or can join) the cached loop
+        if not isinstance(frame, IdleFrame):
+            return None
+        encoder = self.encoder
+        loop = idle_loop(frame.cycle, frame.width, frame.height, encoder.fps, encoder.gop, encoder.bitrate)
+        if not loop.ready:
+            return None
+        continuous = self.on_loop and frame.position == (self.position + 1) % len(loop.packets)
+        if not (continuous or loop.keyframe(frame.position)):
+            return None
+        self.on_loop = True
+        self.position = frame.position
+        idle_packets.inc(1, self.sessionid)
+        return loop.packet(frame.position, frame.pts, frame.time_base)
+
+    def encode(self, frame):
+        packet = self.cached(frame)
+        if packet is not None:
+            return packet
+        if isinstance(frame, IdleFrame):
+            frame = frame.video_frame()
+        # leaving the cached stream, the peer's decoder only resyncs on a live keyframe
+        keyframe = self.on_loop
+        self.on_loop = False
+        return self.encoder.encode(frame, keyframe=keyframe)
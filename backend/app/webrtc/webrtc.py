@@ -9,9 +9,7 @@ from av import AudioFrame
 import fractions
 import numpy as np
 
-AUDIO_PTIME = 0.020
 VIDEO_CLOCK_RATE = 90000
-VIDEO_PTIME = 0.040
 VIDEO_TIME_BASE = fractions.Fraction(1, VIDEO_CLOCK_RATE)
 SAMPLE_RATE = 16000
 AUDIO_TIME_BASE = fractions.Fraction(1, SAMPLE_RATE)
@@ -20,66 +18,84 @@ from aiortc import (
     MediaStreamTrack,
 )
 
+from config.settings import settings
+from .encoder import H264PacketEncoder
+from .idle import IdleFrame, IdleSwitch
+
+# room for the render-ahead buffer plus the batches in flight; two audio frames per video frame
+VIDEO_QUEUE_SIZE = max(100, settings.render_ahead + 4 * settings.batch_size)
+# viewers get frames already paced, the queue only absorbs a slow sender
+WATCH_QUEUE_SIZE = settings.watch_queue_size
+
 class PlayerStreamTrack(MediaStreamTrack):
     def __init__(self, player, kind):
         super().__init__()
         self.kind = kind
         self._player = player
-        self._queue = asyncio.Queue(maxsize=100)
-        self.timelist = []
+        self._queue = asyncio.Queue(maxsize=VIDEO_QUEUE_SIZE if kind == 'video' else 2 * VIDEO_QUEUE_SIZE)
         self.current_frame_count = 0
         if self.kind == 'video':
             self.framecount = 0
             self.lasttime = time.perf_counter()
             self.totaltime = 0
+            self.fps = None
     
-    _start: float
-    _timestamp: int
-
     async def next_timestamp(self) -> Tuple[int, fractions.Fraction]:
         if self.readyState != "live":
             raise Exception
 
-        if not hasattr(self, "_start"):
-            self._start = self._player.get_shared_start_time()
-            self._timestamp = 0
-            self.timelist.append(self._start)
-
+        # both tracks are paced by the session clock, pts is the slot position on its timeline
+        clock = self._player.clock
         if self.kind == 'video':
-            self._timestamp += int(VIDEO_PTIME * VIDEO_CLOCK_RATE)
+            position = await clock.pace('video', self.current_frame_count, clock.video_ptime)
             self.current_frame_count += 1
-            wait = self._start + self.current_frame_count * VIDEO_PTIME - time.time()
-            if wait>0:
-                await asyncio.sleep(wait)
-            return self._timestamp, VIDEO_TIME_BASE
+            return int(round(position * VIDEO_CLOCK_RATE)), VIDEO_TIME_BASE
         else:
-            self._timestamp += int(AUDIO_PTIME * SAMPLE_RATE)
+            position = await clock.pace('audio', self.current_frame_count, clock.audio_ptime)
             self.current_frame_count += 1
-            wait = self._start + self.current_frame_count * AUDIO_PTIME - time.time()
-            if wait>0:
-                await asyncio.sleep(wait)
-            return self._timestamp, AUDIO_TIME_BASE
+            return int(round(position * SAMPLE_RATE)), AUDIO_TIME_BASE
 
     async def recv(self) -> Union[Frame, Packet]:
         self._player._start(self)
-        frame,eventpoint = await self._queue.get()
+        frame,eventpoint,trace = await self._queue.get()
         pts, time_base = await self.next_timestamp()
+        if trace is not None and self._player is not None:
+            self._player.record_trace(trace)
         frame.pts = pts
         frame.time_base = time_base
+        if self._player is not None:
+            self._player.publish(self.kind, frame)
         if eventpoint and self._player is not None:
             self._player.notify(eventpoint)
         if frame is None:
             self.stop()
             raise Exception
+        position = pts * time_base
+        if self.kind == 'video' and self._player.encoder is not None:
+            # encoded here once (or taken from the idle loop), for the peer and for the recorder
+            encoder = self._player.encoder
+            packet = encoder.cached(frame) if isinstance(encoder, IdleSwitch) else None
+            if packet is None:
+                packet = await asyncio.get_running_loop().run_in_executor(None, encoder.encode, frame)
+            self._player.record(self.kind, (packet, frame.width, frame.height), position)
+            frame = packet
+        else:
+            self._player.record(self.kind, frame, position)
         if self.kind == 'video':
             self.totaltime += (time.perf_counter() - self.lasttime)
             self.framecount += 1
             self.lasttime = time.perf_counter()
             if self.framecount==100:
+                self.fps = round(self.framecount / self.totaltime, 2) if self.totaltime > 0 else None
                 self.framecount = 0
                 self.totaltime=0
         return frame
     
+    @property
+    def idle_cache(self) -> bool:
+        # the compositor may queue IdleFrames instead of VideoFrames
+        return self._player is not None and isinstance(self._player.encoder, IdleSwitch)
+
     def stop(self):
         super().stop()
         while not self._queue.empty():
@@ -89,6 +105,29 @@ class PlayerStreamTrack(MediaStreamTrack):
             self._player._stop(self)
             self._player = None
 
+class ViewerStreamTrack(MediaStreamTrack):
+    # watch-only copy of a session track: frames come paced and stamped by the session's own track
+
+    def __init__(self, broadcast, kind):
+        super().__init__()
+        self.kind = kind
+        self._broadcast = broadcast
+        self._queue = asyncio.Queue(maxsize=WATCH_QUEUE_SIZE if kind == 'video' else 2 * WATCH_QUEUE_SIZE)
+        broadcast.subscribe(self)
+
+    async def recv(self) -> Union[Frame, Packet]:
+        if self.readyState != "live":
+            raise Exception
+        frame = await self._queue.get()
+        if frame is None:
+            self.stop()
+            raise Exception
+        return frame
+
+    def stop(self):
+        super().stop()
+        self._broadcast.unsubscribe(self)
+
 def player_worker_thread(
     quit_event,
     loop,
@@ -108,30 +147,51 @@ class HumanPlayer:
     ):
         self.__thread: Optional[threading.Thread] = None
         self.__thread_quit: Optional[threading.Event] = None
+        self.__rendering = False
 
         self.__started: Set[PlayerStreamTrack] = set()
         self.__audio: Optional[PlayerStreamTrack] = None
         self.__video: Optional[PlayerStreamTrack] = None
 
-        self.__shared_start_time: Optional[float] = None
-        self.__start_time_lock = threading.Lock()
-
         self.__audio = PlayerStreamTrack(self, kind="audio")
         self.__video = PlayerStreamTrack(self, kind="video")
 
         self.__container = nerfreal
+        self.clock = nerfreal.clock
         self.__loop = None
-    
-    def get_shared_start_time(self) -> float:
-        with self.__start_time_lock:
-            if self.__shared_start_time is None:
-                self.__shared_start_time = time.time()
-            return self.__shared_start_time
+        # the video track sends h264 it encoded itself when recording from packets or replaying
+        # the idle loop from cache
+        self.encoder = None
+        if settings.record_source == 'packets' or settings.idle_cache:
+            fps = 1 / self.clock.video_ptime
+            self.encoder = H264PacketEncoder(fps, 2 * round(fps))
+            if settings.record_source == 'packets':
+                nerfreal.record_source = 'packets'
+            if settings.idle_cache:
+                # silent stretches replay the avatar's idle loop encoded once per profile
+                self.encoder = IdleSwitch(self.encoder, nerfreal.sessionid)
 
     def notify(self,eventpoint):
         if self.__container is not None:
             self.__container.notify(eventpoint)
 
+    def record_trace(self,trace):
+        if self.__container is not None:
+            self.__container.tracer.record(trace)
+
+    def publish(self,kind,frame):
+        if self.__container is not None:
+            broadcast = self.__container.broadcast
+            if isinstance(frame, IdleFrame):
+                if not broadcast.viewers():
+                    return
+                frame = frame.video_frame()
+            broadcast.publish(kind,frame)
+
+    def record(self,kind,data,position):
+        if self.__container is not None:
+            self.__container.record_track_data(kind,data,float(position))
+
     @property
     def audio(self) -> MediaStreamTrack:
         return self.__audio
@@ -141,9 +201,15 @@ class HumanPlayer:
         return self.__video
 
     def start_render(self, loop):
-        if self.__thread is None:
+        if self.__rendering:
+            return
+        self.__rendering = True
+        self.__loop = loop
+        if settings.runtime == 'pool':
+            # tasks on the shared runtime, no per-session threads
+            self.__container.start(loop, self.__audio, self.__video)
+        else:
             self.__thread_quit = threading.Event()
-            self.__loop = loop
             self.__thread = threading.Thread(
                 name="media-player",
                 target=player_worker_thread,
@@ -159,7 +225,7 @@ class HumanPlayer:
 
     def _start(self, track: PlayerStreamTrack) -> None:
         self.__started.add(track)
-        if self.__thread is None:
+        if not self.__rendering:
             try:
                 loop = asyncio.get_running_loop()
             except RuntimeError:
@@ -169,10 +235,14 @@ class HumanPlayer:
     def _stop(self, track: PlayerStreamTrack) -> None:
         self.__started.discard(track)
 
-        if not self.__started and self.__thread is not None:
-            self.__thread_quit.set()
-            self.__thread.join()
-            self.__thread = None
+        if not self.__started and self.__rendering:
+            if self.__thread is not None:
+                self.__thread_quit.set()
+                self.__thread.join()
+                self.__thread = None
+            elif self.__container is not None:
+                self.__container.stop()
+            self.__rendering = False
 
         if not self.__started and self.__container is not None:
             self.__container = None
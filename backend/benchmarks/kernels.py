@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "kernels_baseline.json")
+
+# registered as (group, name, setup); setup builds fixed-seed inputs once and returns the call to time
+CASES = []
+
+def case(group: str, *params):
+    def register(setup):
+        for param in params or (None,):
+            name = f"{group}[{param}]" if param is not None else group
+            CASES.append((group, name, setup, param))
+        return setup
+    return register
+
+
+def _avatar(size: int, face: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    offset = (size - face) // 2
+    margin = face // 4
+    frame = rng.integers(0, 255, (size, size, 3), dtype=np.uint8)
+    mask = rng.integers(0, 255, (face + 2 * margin, face + 2 * margin, 3), dtype=np.uint8)
+    face_box = (offset, offset, offset + face, offset + face)
+    crop_box = (offset - margin, offset - margin, offset + face + margin, offset + face + margin)
+    return frame, mask, face_box, crop_box
+
+@case("get_image_blending", "512", "720", "1080")
+def blending(resolution):
+    from musetalk.myutil import get_image_blending
+
+    frame, mask, face_box, crop_box = _avatar(int(resolution), int(resolution) // 2)
+    face = np.random.default_rng(1).integers(0, 255, (face_box[3] - face_box[1], face_box[2] - face_box[0], 3), dtype=np.uint8)
+    return lambda: get_image_blending(frame, face, face_box, mask, crop_box)
+
+@case("paste_back_frame", "512", "720", "1080")
+def paste_back(resolution):
+    from app.models.musereal import MuseReal
+
+    frame, mask, face_box, crop_box = _avatar(int(resolution), int(resolution) // 2)
+    real = SimpleNamespace(frame_list_cycle=[frame], mask_list_cycle=[mask],
+                           coord_list_cycle=[face_box], mask_coords_list_cycle=[crop_box])
+    pred = np.random.default_rng(1).integers(0, 255, (256, 256, 3), dtype=np.uint8)
+    return lambda: MuseReal.paste_back_frame(real, pred, 0)
+
+@case("detect_voice_activity", "320", "640")
+def voice_activity(chunk):
+    from app.models.baseasr import BaseASR
+
+    asr = SimpleNamespace(sample_rate=16000)
+    frame = (np.random.default_rng(0).normal(0, 0.2, int(chunk))).astype(np.float32)
+    return lambda: BaseASR.detect_voice_activity(asr, frame)
+
+def _audio2feature():
+    from musetalk.whisper.audio2feature import Audio2Feature
+
+    # only the numpy slicing is timed, so no encoder is loaded
+    return object.__new__(Audio2Feature)
+
+@case("feature2chunks", "4", "8", "16")
+def feature_chunks(batch_size):
+    processor = _audio2feature()
+    # whisper-tiny layout: 50 rows per second, 5 hidden states of 384
+    feature = np.random.default_rng(0).standard_normal((1500, 5, 384), dtype=np.float32)
+    return lambda: processor.feature2chunks(feature_array=feature, fps=12.5, batch_size=int(batch_size), start=25)
+
+@case("get_sliced_feature")
+def sliced_feature(_):
+    processor = _audio2feature()
+    feature = np.random.default_rng(0).standard_normal((1500, 5, 384), dtype=np.float32)
+    return lambda: processor.get_sliced_feature(feature_array=feature, vid_idx=100, fps=25)
+
+@case("decode_latents_postprocess", "4x256", "8x256", "16x256")
+def decode_postprocess(shape):
+    from musetalk.models.vae import VAE
+
+    batch, size = (int(v) for v in shape.split("x"))
+    torch.manual_seed(0)
+    image = torch.rand(batch, 3, size, size) * 2 - 1
+    return lambda: VAE.postprocess(image)
+
+class _FakeS3FD:
+    # replays fixed s3fd head outputs so only the box decoding in batch_detect is timed
+
+    def __init__(self, batch: int, size: int, density: float = 0.002, seed: int = 0):
+        generator = torch.Generator().manual_seed(seed)
+        self.outputs = []
+        for i in range(6):
+            stride = 2 ** (i + 2)
+            h = w = max(1, size // stride)
+            cls = torch.zeros(batch, 2, h, w)
+            cls[:, 0] = 4.0
+            hits = torch.rand(batch, h, w, generator=generator) < density
+            cls[:, 1][hits] = 6.0
+            reg = torch.randn(batch, 4, h, w, generator=generator) * 0.1
+            self.outputs += [cls, reg]
+
+    def __call__(self, imgs):
+        return list(self.outputs)
+
+@case("s3fd_batch_detect", "4x256", "8x512")
+def s3fd_decode(shape):
+    from musetalk.utils.face_detection.detection.sfd.detect import batch_detect
+
+    batch, size = (int(v) for v in shape.split("x"))
+    net = _FakeS3FD(batch, size)
+    imgs = np.random.default_rng(0).integers(0, 255, (batch, size, size, 3)).astype(np.float32)
+    return lambda: batch_detect(net, imgs, 'cpu')
+
+@case("nms", "100", "1000", "5000")
+def nms_boxes(count):
+    from musetalk.utils.face_detection.detection.sfd.bbox import nms
+
+    rng = np.random.default_rng(0)
+    n = int(count)
+    xy = rng.uniform(0, 500, (n, 2))
+    wh = rng.uniform(20, 120, (n, 2))
+    dets = np.concatenate([xy, xy + wh, rng.uniform(0, 1, (n, 1))], axis=1)
+    return lambda: nms(dets, 0.3)
+
+
+def measure(fn, min_time: float, min_rounds: int, warmup: int = 3) -> dict:
+    for _ in range(warmup):
+        fn()
+    times = []
+    start = time.perf_counter()
+    while len(times) < min_rounds or time.perf_counter() - start < min_time:
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return {
+        "rounds": len(times),
+        "min_us": round(min(times) * 1e6, 2),
+        "median_us": round(statistics.median(times) * 1e6, 2),
+        "mean_us": round(statistics.fmean(times) * 1e6, 2),
+    }
+
+def compare(results: dict, baseline: dict, threshold: float, stat: str) -> list:
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if reference is None:
+            result["baseline_us"] = None
+            continue
+        ratio = result[stat] / reference[stat]
+        result["baseline_us"] = reference[stat]
+        result["ratio"] = round(ratio, 3)
+        if ratio > 1 + threshold:
+            regressions.append((name, ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the per-frame numeric kernels, checked against a baseline")
+    parser.add_argument("-k", dest="select", default="", help="only run cases whose name contains this string")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="fail when a case is this fraction slower than the baseline")
+    parser.add_argument("--stat", choices=("min_us", "median_us"), default="min_us",
+                        help="statistic compared with the baseline; the minimum is the least noisy")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds spent timing each case")
+    parser.add_argument("--min-rounds", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=1, help="torch and opencv threads, 1 keeps numbers stable")
+    parser.add_argument("--json", action="store_true", help="print the full report as json")
+    args = parser.parse_args()
+
+    import cv2
+    torch.set_num_threads(args.threads)
+    cv2.setNumThreads(args.threads)
+
+    results = {}
+    for group, name, setup, param in CASES:
+        if args.select and args.select not in name:
+            continue
+        results[name] = dict(group=group, **measure(setup(param), args.min_time, args.min_rounds))
+
+    report = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "torch": torch.__version__,
+            "opencv": cv2.__version__,
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "threads": args.threads,
+        },
+        "results": results,
+    }
+
+    if args.save:
+        if args.select and os.path.exists(args.baseline):
+            # a partial run only replaces the cases it measured
+            with open(args.baseline) as f:
+                saved = json.load(f)
+            saved["environment"] = report["environment"]
+            saved["results"].update(results)
+            report = saved
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"baseline written to {args.baseline} ({len(results)} cases)")
+        return
+
+    regressions = []
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold, args.stat)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'case':<40} {'median us':>12} {'min us':>12} {'baseline':>12} {'ratio':>7}")
+        for name, result in results.items():
+            baseline = result.get("baseline_us")
+            print(f"{name:<40} {result['median_us']:>12.1f} {result['min_us']:>12.1f} "
+                  f"{baseline if baseline is not None else '-':>12} {result.get('ratio', '-'):>7}")
+    if regressions:
+        for name, ratio in regressions:
+            print(f"REGRESSION {name}: {ratio:.2f}x baseline (threshold {1 + args.threshold:.2f}x)", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import os
+import copy
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import threading
+
+import numpy as np
+import torch
+
+from config.settings import settings
+from app.core import metrics
+from app.core.runtime import runtime
+from app.models.musereal import MuseReal
+from .synthetic import tiny_model, synthetic_avatar, synthetic_speech, load_wav
+
+STAGES = {
+    "asr_step": metrics.asr_step_seconds,
+    "whisper_encode": metrics.whisper_encode_seconds,
+    "unet": metrics.unet_seconds,
+    "vae_decode": metrics.vae_decode_seconds,
+    "paste_back": metrics.paste_back_seconds,
+    "track_send": metrics.track_send_seconds,
+}
+
+
+class SinkTrack:
+    # stands in for PlayerStreamTrack: same queue protocol, frames are counted and dropped
+
+    def __init__(self, kind: str, clock, tracer=None):
+        self.kind = kind
+        self.clock = clock
+        self.tracer = tracer
+        self._queue = asyncio.Queue(maxsize=200 if kind == 'video' else 400)
+        self.frames = 0
+        self.fps = None
+
+    async def consume(self, stop: threading.Event):
+        ptime = self.clock.video_ptime if self.kind == 'video' else self.clock.audio_ptime
+        while not stop.is_set():
+            try:
+                frame, eventpoint, trace = await asyncio.wait_for(self._queue.get(), 0.5)
+            except asyncio.TimeoutError:
+                continue
+            await self.clock.pace(self.kind, self.frames, ptime)
+            self.frames += 1
+            if trace is not None and self.tracer is not None:
+                self.tracer.record(trace)
+
+
+def feed_audio(real, audio: np.ndarray, paced: bool, stop: threading.Event):
+    # paced: real-time ingress like a live client; unpaced: keep the asr queue topped up
+    chunk = real.chunk
+    position = 0
+    start = time.perf_counter()
+    sent = 0
+    while not stop.is_set():
+        if paced:
+            wait = start + sent * chunk / 16000 - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        elif real.asr.queue.qsize() >= 8 * real.batch_size:
+            time.sleep(0.005)
+            continue
+        if position + chunk > audio.shape[0]:
+            position = 0
+        real.put_audio_frame(audio[position:position + chunk])
+        position += chunk
+        sent += 1
+
+def stage_delta(before: dict, after: dict) -> dict:
+    result = {}
+    for name, histogram in STAGES.items():
+        counts = [b - a for a, b in zip(before[name][0], after[name][0])]
+        total = after[name][1] - before[name][1]
+        count = sum(counts)
+        if count == 0:
+            continue
+        bounds = histogram.buckets + (float('inf'),)
+
+        def quantile(q):
+            seen = 0
+            for bound, n in zip(bounds, counts):
+                seen += n
+                if seen >= q * count:
+                    return None if bound == float('inf') else round(bound * 1000, 2)
+
+        result[name] = {"count": count, "mean_ms": round(total / count * 1000, 3),
+                        "p50_le_ms": quantile(0.5), "p99_le_ms": quantile(0.99)}
+    return result
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 1)
+
+def rss_mb() -> float:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+
+def run(args, model, avatar, audio, batch_size: int) -> dict:
+    opt = copy.copy(settings)
+    opt.batch_size = batch_size
+    opt.fps = args.fps
+    opt.tts = 'edge'
+    opt.customopt = []
+    opt.video = ''
+    opt.transport = 'webrtc'
+
+    loop = asyncio.new_event_loop()
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True, name="bench-loop")
+    loop_thread.start()
+    stop = threading.Event()
+
+    sessions = []
+    consumers = []
+    for sessionid in range(args.sessions):
+        session_opt = copy.copy(opt)
+        session_opt.sessionid = sessionid
+        real = MuseReal(session_opt, model, avatar)
+        real.tracer.sample_rate = 0
+        # unpaced: the render thread and the sinks run as fast as the pipeline allows
+        real.clock.paced = args.paced
+        video, audio_track = SinkTrack('video', real.clock, real.tracer), SinkTrack('audio', real.clock)
+        consumers.append(asyncio.run_coroutine_threadsafe(video.consume(stop), loop))
+        consumers.append(asyncio.run_coroutine_threadsafe(audio_track.consume(stop), loop))
+        sessions.append((real, video, audio_track))
+
+    quit_event = threading.Event()
+    threads = []
+    for real, video, audio_track in sessions:
+        if args.runtime == 'pool':
+            real.start(loop, audio_track, video)
+        else:
+            threads.append(threading.Thread(target=real.render, args=(quit_event, loop, audio_track, video), name=f"render-{real.sessionid}"))
+        threads.append(threading.Thread(target=feed_audio, args=(real, audio, args.paced, stop), daemon=True, name=f"feed-{real.sessionid}"))
+    for thread in threads:
+        thread.start()
+
+    time.sleep(args.warmup)
+    before = {name: histogram.totals() for name, histogram in STAGES.items()}
+    frames_before = [video.frames for _, video, _ in sessions]
+    for real, _, _ in sessions:
+        real.tracer.latencies.clear()
+    start = time.perf_counter()
+    time.sleep(args.seconds)
+    elapsed = time.perf_counter() - start
+    frames = [video.frames - n for (_, video, _), n in zip(sessions, frames_before)]
+    after = {name: histogram.totals() for name, histogram in STAGES.items()}
+    latencies = [latency for real, _, _ in sessions for latency in real.tracer.latencies]
+    # feeders excluded: they stand in for the clients
+    thread_count = threading.active_count() - args.sessions
+
+    stop.set()
+    quit_event.set()
+    for real, _, _ in sessions:
+        if args.runtime == 'pool':
+            real.stop()
+    for thread in threads:
+        thread.join(timeout=10)
+    for consumer in consumers:
+        consumer.result(timeout=2)
+    loop.call_soon_threadsafe(loop.stop)
+
+    return {
+        "sessions": args.sessions,
+        "batch_size": batch_size,
+        "seconds": round(elapsed, 3),
+        "frames": sum(frames),
+        "fps_total": round(sum(frames) / elapsed, 2),
+        "fps_per_session": [round(n / elapsed, 2) for n in frames],
+        "latency_ms": {"samples": len(latencies), "p50": percentile(latencies, 0.5), "p99": percentile(latencies, 0.99)},
+        "clock": [real.clock.stats() for real, _, _ in sessions],
+        "stages": stage_delta(before, after),
+        "rss_mb": round(rss_mb(), 1),
+        "threads": thread_count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless MuseReal throughput and latency benchmark (no browser, no network)")
+    parser.add_argument("--models", choices=("tiny", "real"), default="tiny",
+                        help="tiny random-weight models, or the deployed weights/snapshot")
+    parser.add_argument("--avatar", default="", help="avatar id under data/avatars (default: synthetic avatar)")
+    parser.add_argument("--avatar-frames", type=int, default=50)
+    parser.add_argument("--resolution", type=int, default=512, help="synthetic avatar frame size")
+    parser.add_argument("--audio", default="", help="wav file to loop (default: synthetic speech)")
+    parser.add_argument("--sessions", type=int, default=1)
+    parser.add_argument("--batch-size", default="8", help="comma separated list, one run per value")
+    parser.add_argument("--fps", type=int, default=settings.fps)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--paced", action="store_true",
+                        help="feed audio and drain tracks in real time instead of as fast as possible")
+    parser.add_argument("--runtime", choices=("pool", "threads"), default=settings.runtime,
+                        help="shared worker pools, or the render/inference/compose threads per session")
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 keeps the default)")
+    parser.add_argument("--out", default="", help="write the json report here instead of stdout")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    t = time.perf_counter()
+    if args.models == "tiny":
+        model = tiny_model()
+    else:
+        from app.models.musereal import load_model
+        model = load_model()
+    if args.avatar:
+        from app.models.musereal import load_avatar
+        avatar = load_avatar(args.avatar)
+    else:
+        avatar = synthetic_avatar(args.avatar_frames, args.resolution)
+    audio = load_wav(args.audio) if args.audio else synthetic_speech(10.0)
+    load_seconds = time.perf_counter() - t
+
+    runs = [run(args, model, avatar, audio, int(batch_size)) for batch_size in args.batch_size.split(",")]
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key != "out"},
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "device": str(model[1].device),
+            "cpu_count": os.cpu_count(),
+            "torch_threads": torch.get_num_threads(),
+        },
+        "load_seconds": round(load_seconds, 2),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_cuda_mb": round(torch.cuda.max_memory_allocated() / 2**20, 1) if torch.cuda.is_available() else None,
+        "runs": runs,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    runtime.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import numpy as np
+import torch
+
+# fixed-seed stand-ins for the avatar, the models and speech, so benchmarks need no downloads
+
+
+def tiny_model(device=None):
+    from diffusers import AutoencoderKL, UNet2DConditionModel
+    from transformers import WhisperConfig, WhisperFeatureExtractor, WhisperModel
+    from musetalk.models.unet import UNet, PositionalEncoding
+    from musetalk.models.vae import VAE
+    from musetalk.whisper.audio2feature import Audio2Feature
+
+    torch.manual_seed(0)
+    device = device or torch.device("cpu")
+    # same tensor interfaces as musetalk (8 latent channels in, 384-d whisper features), far fewer weights
+    unet = UNet2DConditionModel(sample_size=32, in_channels=8, out_channels=4, layers_per_block=1,
+                                block_out_channels=(32, 64),
+                                down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"),
+                                up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"),
+                                cross_attention_dim=384, attention_head_dim=8)
+    vae = AutoencoderKL(block_out_channels=(32, 32, 32, 32), down_block_types=("DownEncoderBlock2D",) * 4,
+                        up_block_types=("UpDecoderBlock2D",) * 4, layers_per_block=1, latent_channels=4)
+    encoder = WhisperModel(WhisperConfig(d_model=384, encoder_layers=4, encoder_attention_heads=6,
+                                         decoder_layers=1, decoder_attention_heads=6,
+                                         encoder_ffn_dim=256, decoder_ffn_dim=256)).encoder
+    for module in (unet, vae, encoder):
+        module.eval().requires_grad_(False)
+
+    unet = UNet(unet_config=None, model_path=None, device=device, model=unet)
+    vae = VAE(model_path=None, vae=vae)
+    audio_processor = Audio2Feature(feature_extractor=WhisperFeatureExtractor(feature_size=80), encoder=encoder)
+    pe = PositionalEncoding(d_model=384).to(device).requires_grad_(False)
+    return vae, unet, pe, torch.tensor([0], device=device), audio_processor
+
+def synthetic_avatar(frames: int = 50, size: int = 512, face: int = 256, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    offset = (size - face) // 2
+    frame_list = [rng.integers(0, 255, (size, size, 3), dtype=np.uint8) for _ in range(frames)]
+    # masks cover the face box plus a margin, like the ones written by avatar preparation
+    margin = face // 4
+    mask_list = [rng.integers(0, 255, (face + 2 * margin, face + 2 * margin, 3), dtype=np.uint8) for _ in range(frames)]
+    coord_list = [(offset, offset, offset + face, offset + face)] * frames
+    mask_coord_list = [(offset - margin, offset - margin, offset + face + margin, offset + face + margin)] * frames
+    latent_list = [torch.randn(1, 8, 32, 32, generator=torch.Generator().manual_seed(seed + i)) for i in range(frames)]
+    return frame_list, mask_list, coord_list, mask_coord_list, latent_list
+
+def synthetic_speech(seconds: float, sample_rate: int = 16000, seed: int = 0) -> np.ndarray:
+    # voiced harmonics plus noise: passes the asr voice activity check, so every batch runs the unet
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.5 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = 0.6 + 0.4 * np.sin(2 * np.pi * 3 * t) ** 2
+    audio = 0.3 * voice * envelope + rng.normal(0, 0.05, t.shape[0])
+    return (audio / np.abs(audio).max() * 0.8).astype(np.float32)
+
+def load_wav(path: str, sample_rate: int = 16000) -> np.ndarray:
+    import resampy
+    import soundfile as sf
+
+    audio, rate = sf.read(path, dtype='float32')
+    if audio.ndim > 1:
+        audio = audio[:, 0]
+    if rate != sample_rate:
+        audio = resampy.resample(audio, sr_orig=rate, sr_new=sample_rate)
+    return audio.astype(np.float32)
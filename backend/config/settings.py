@@ -17,24 +17,58 @@ class Settings:
 
         self.avatar_id: str = os.getenv('LIVETALKING_AVATAR_ID', 'avator')
         self.batch_size: int = int(os.getenv('LIVETALKING_BATCH_SIZE', '8'))
+        self.trace_sample: float = float(os.getenv('LIVETALKING_TRACE_SAMPLE', '0.1'))
+        self.render_ahead: int = int(os.getenv('LIVETALKING_RENDER_AHEAD', '50'))
+        self.watch_queue_size: int = int(os.getenv('LIVETALKING_WATCH_QUEUE_SIZE', '10'))
+        self.clock_max_late: float = float(os.getenv('LIVETALKING_CLOCK_MAX_LATE', '0.2'))
+        self.runtime: str = os.getenv('LIVETALKING_RUNTIME', 'pool')
+        self.worker_threads: int = int(os.getenv('LIVETALKING_WORKER_THREADS', str(min(8, os.cpu_count() or 1))))
+        self.inference_threads: int = int(os.getenv('LIVETALKING_INFERENCE_THREADS', '1'))
+        self.tts_threads: int = int(os.getenv('LIVETALKING_TTS_THREADS', '4'))
         self.audio_gain: float = float(os.getenv('LIVETALKING_AUDIO_GAIN', '1.0'))
         self.customvideo_config: str = os.getenv('LIVETALKING_CUSTOMVIDEO_CONFIG', '')
         self.tts: str = os.getenv('LIVETALKING_TTS', 'edge')
         self.model: str = os.getenv('LIVETALKING_MODEL', 'musetalk')
+        self.snapshot_dir: str = os.getenv('LIVETALKING_SNAPSHOT_DIR', './models/snapshot')
 
         self.REF_FILE: str = os.getenv('LIVETALKING_REF_FILE', '')
         self.REF_TEXT: str = os.getenv('LIVETALKING_REF_TEXT', '')
 
         self.TTS_SERVER: str = os.getenv('LIVETALKING_TTS_SERVER', '')
+        self.tts_voice: str = os.getenv('LIVETALKING_TTS_VOICE', 'en-US-AriaNeural')
+        self.tts_sample_rate: int = int(os.getenv('LIVETALKING_TTS_SAMPLE_RATE', '16000'))
+        self.tts_cache_dir: str = os.getenv('LIVETALKING_TTS_CACHE_DIR', './data/tts_cache')
+        self.tts_cache_mb: int = int(os.getenv('LIVETALKING_TTS_CACHE_MB', '256'))
+        self.tts_cache_disk_mb: int = int(os.getenv('LIVETALKING_TTS_CACHE_DISK_MB', '1024'))
+        self.tts_cache_features: bool = os.getenv('LIVETALKING_TTS_CACHE_FEATURES', '0') == '1'
+        self.llm_base_url: str = os.getenv('LIVETALKING_LLM_BASE_URL', '')
+        self.llm_api_key: str = os.getenv('LIVETALKING_LLM_API_KEY', os.getenv('OPENAI_API_KEY', ''))
+        self.llm_model: str = os.getenv('LIVETALKING_LLM_MODEL', 'gpt-4o-mini')
+        self.llm_system_prompt: str = os.getenv('LIVETALKING_LLM_SYSTEM_PROMPT', 'You are a helpful assistant. Answer briefly in plain spoken sentences.')
         self.transport: str = os.getenv('LIVETALKING_TRANSPORT', 'webrtc')
         self.push_url: str = os.getenv('LIVETALKING_PUSH_URL', '')
+        self.push_bitrate: int = int(os.getenv('LIVETALKING_PUSH_BITRATE', '2000000'))
+        self.hls_segment_duration: float = float(os.getenv('LIVETALKING_HLS_SEGMENT_DURATION', '2.0'))
+        self.hls_part_duration: float = float(os.getenv('LIVETALKING_HLS_PART_DURATION', '0.2'))
+        self.hls_window: int = int(os.getenv('LIVETALKING_HLS_WINDOW', '6'))
+        self.hls_dir: str = os.getenv('LIVETALKING_HLS_DIR', '')
+        self.record_dir: str = os.getenv('LIVETALKING_RECORD_DIR', './data/record')
+        self.record_queue_size: int = int(os.getenv('LIVETALKING_RECORD_QUEUE_SIZE', '100'))
+        self.record_drop_policy: str = os.getenv('LIVETALKING_RECORD_DROP_POLICY', 'newest')
+        self.record_source: str = os.getenv('LIVETALKING_RECORD_SOURCE', 'frames')
+        self.idle_cache: bool = os.getenv('LIVETALKING_IDLE_CACHE', '0') == '1'
         self.max_session: int = int(os.getenv('LIVETALKING_MAX_SESSION', '10'))
+        self.import_budget_ms: float = float(os.getenv('LIVETALKING_IMPORT_BUDGET_MS', '1000'))
+        self.import_profile: bool = os.getenv('LIVETALKING_IMPORT_PROFILE', '0') == '1'
+        self.pool_size: int = int(os.getenv('LIVETALKING_POOL_SIZE', '1'))
         self.listenport: int = int(os.getenv('LIVETALKING_LISTENPORT', '8000'))
 
         self.ssl_cert: str = os.getenv('LIVETALKING_SSL_CERT', '')
         self.ssl_key: str = os.getenv('LIVETALKING_SSL_KEY', '')
 
         self.video: str = os.getenv('LIVETALKING_VIDEO', '')
+        self.video_memory_mb: float = float(os.getenv('LIVETALKING_VIDEO_MEMORY_MB', '256'))
+        self.video_ring: int = int(os.getenv('LIVETALKING_VIDEO_RING', '50'))
 
         self.customopt: list = []
         if self.customvideo_config and os.path.exists(self.customvideo_config):
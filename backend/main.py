@@ -1,19 +1,34 @@
+from config.settings import settings
+if settings.import_profile:
+    # per-module import times for /stats and the startup report; the timing loaders wrap every
+    # module loaded afterwards, so this stays off in production
+    from app.core import importtime
+    importtime.install()
+
 import asyncio
 import ssl
 import os
-import torch.multiprocessing as mp
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from config.settings import settings
 from app.routers.webrtc import router as webrtc_router, on_shutdown
 from app.routers.session import router as session_router
-from app.services.model_service import load_model, load_avatar, warm_up
+from app.routers.push import router as push_router, on_startup as push_on_startup, on_shutdown as push_on_shutdown
+from app.core.session_pool import session_pool
+from app.core.session_manager import session_manager
+from app.core.runtime import runtime
+from app.services.model_service import start_loading
 
 
 def create_app():
     app = FastAPI(title="LiveTalking API", client_max_size=1024**2*100)
+    app.add_event_handler("startup", start_loading)
+    app.add_event_handler("startup", push_on_startup)
     app.add_event_handler("shutdown", on_shutdown)
+    app.add_event_handler("shutdown", push_on_shutdown)
+    app.add_event_handler("shutdown", session_pool.stop)
+    app.add_event_handler("shutdown", session_manager.stop_recordings)
+    app.add_event_handler("shutdown", runtime.shutdown)
 
     app.add_middleware(
         CORSMiddleware,
@@ -25,10 +40,7 @@ def create_app():
 
     app.include_router(webrtc_router)
     app.include_router(session_router)
-
-    load_model()
-    load_avatar()
-    warm_up(settings.batch_size)
+    app.include_router(push_router)
 
     return app
 
@@ -37,6 +49,7 @@ app = create_app()
 
 
 if __name__ == '__main__':
+    import torch.multiprocessing as mp
     mp.set_start_method('spawn')
 
     ssl_context = None
@@ -31,18 +31,22 @@ class UNet():
                  unet_config,
                  model_path,
                  use_float16=False,
-                 device=None
+                 device=None,
+                 model=None
         ):
-        with open(unet_config, 'r') as f:
-            unet_config = json.load(f)
-        self.model = UNet2DConditionModel(**unet_config)
         self.pe = PositionalEncoding(d_model=384)
         if device != None:
             self.device = device
         else:
             self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        weights = torch.load(model_path, weights_only=True) if torch.cuda.is_available() else torch.load(model_path, map_location=self.device, weights_only=True)
-        self.model.load_state_dict(weights)
+        if model is not None:
+            self.model = model
+        else:
+            with open(unet_config, 'r') as f:
+                unet_config = json.load(f)
+            self.model = UNet2DConditionModel(**unet_config)
+            weights = torch.load(model_path, weights_only=True) if torch.cuda.is_available() else torch.load(model_path, map_location=self.device, weights_only=True)
+            self.model.load_state_dict(weights)
         if use_float16:
             self.model = self.model.half()
         self.model.to(self.device)
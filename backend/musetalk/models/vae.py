@@ -9,9 +9,9 @@ import os
 
 class VAE():
 
-    def __init__(self, model_path="./models/sd-vae-ft-mse/", resized_img=256, use_float16=False):
+    def __init__(self, model_path="./models/sd-vae-ft-mse/", resized_img=256, use_float16=False, vae=None):
         self.model_path = model_path
-        self.vae = AutoencoderKL.from_pretrained(self.model_path)
+        self.vae = vae if vae is not None else AutoencoderKL.from_pretrained(self.model_path)
 
         self.device = torch.device("cuda" if torch.cuda.is_available() else ("mps" if (hasattr(torch.backends, "mps") and torch.backends.mps.is_available()) else "cpu"))
         self.vae.to(self.device)
@@ -69,6 +69,11 @@ class VAE():
     def decode_latents(self, latents):
         latents = (1/  self.scaling_factor) * latents
         image = self.vae.decode(latents.to(self.vae.dtype)).sample
+        return self.postprocess(image)
+
+    @staticmethod
+    def postprocess(image):
+        # decoder output in [-1, 1], NCHW rgb -> NHWC bgr uint8
         image = (image / 2 + 0.5).clamp(0, 1)
         image = image.detach().cpu().permute(0, 2, 3, 1).float().numpy()
         image = (image * 255).round().astype("uint8")
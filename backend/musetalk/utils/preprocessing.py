@@ -1,5 +1,4 @@
 import sys
-from face_detection import FaceAlignment,LandmarksType
 from os import listdir, path
 import subprocess
 import numpy as np
@@ -7,18 +6,27 @@ import cv2
 import pickle
 import os
 import json
-from mmpose.apis import inference_topdown, init_model
-from mmpose.structures import merge_data_samples
-import torch
+from functools import lru_cache
 from tqdm import tqdm
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 config_file = './musetalk/utils/dwpose/rtmpose-l_8xb32-270e_coco-ubody-wholebody-384x288.py'
 checkpoint_file = './models/dwpose/dw-ll_ucoco_384.pth'
-model = init_model(config_file, checkpoint_file, device=device)
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-fa = FaceAlignment(LandmarksType._2D, flip_input=False,device=device)
+@lru_cache(maxsize=None)
+def get_pose_model():
+    import torch
+    from mmpose.apis import init_model
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    return init_model(config_file, checkpoint_file, device=device)
+
+@lru_cache(maxsize=None)
+def get_face_alignment():
+    import torch
+    from face_detection import FaceAlignment,LandmarksType
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    return FaceAlignment(LandmarksType._2D, flip_input=False,device=device)
 
 coord_placeholder = (0.0,0.0,0.0,0.0)
 
@@ -49,6 +57,10 @@ def get_bbox_range(img_list,upperbondrange =0):
         print('get key_landmark and face bounding boxes with the default value')
     average_range_minus = []
     average_range_plus = []
+    from mmpose.apis import inference_topdown
+    from mmpose.structures import merge_data_samples
+    model = get_pose_model()
+    fa = get_face_alignment()
     for fb in tqdm(batches):
         results = inference_topdown(model, np.asarray(fb)[0])
         results = merge_data_samples(results)
@@ -87,6 +99,10 @@ def get_landmark_and_bbox(img_list,upperbondrange =0):
         print('get key_landmark and face bounding boxes with the default value')
     average_range_minus = []
     average_range_plus = []
+    from mmpose.apis import inference_topdown
+    from mmpose.structures import merge_data_samples
+    model = get_pose_model()
+    fa = get_face_alignment()
     for fb in tqdm(batches):
         results = inference_topdown(model, np.asarray(fb)[0])
         results = merge_data_samples(results)
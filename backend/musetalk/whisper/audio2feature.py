@@ -1,5 +1,4 @@
 import os
-from .whisper import load_model
 import soundfile as sf
 import numpy as np
 import time
@@ -14,11 +13,16 @@ weight_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
 class Audio2Feature():
     def __init__(self, 
                  whisper_model_type="tiny",
-                 model_path="./models/whisper"):
-        self.feature_extractor = AutoFeatureExtractor.from_pretrained(model_path)
-        self.whisper = WhisperModel.from_pretrained(model_path)
-        self.whisper = self.whisper.to(device=device, dtype=weight_dtype).eval()
-        self.whisper.requires_grad_(False)
+                 model_path="./models/whisper",
+                 feature_extractor=None,
+                 encoder=None):
+        if feature_extractor is None:
+            feature_extractor = AutoFeatureExtractor.from_pretrained(model_path)
+        self.feature_extractor = feature_extractor
+        if encoder is None:
+            encoder = WhisperModel.from_pretrained(model_path).encoder
+        self.encoder = encoder.to(device=device, dtype=weight_dtype).eval()
+        self.encoder.requires_grad_(False)
 
     def get_sliced_feature(self,
                            feature_array, 
@@ -89,7 +93,7 @@ class Audio2Feature():
             sampling_rate=16000
         ).input_features
         input_feature = input_feature.to(device).to(weight_dtype)
-        whisper_feature = self.whisper.encoder(input_feature, output_hidden_states=True).hidden_states
+        whisper_feature = self.encoder(input_feature, output_hidden_states=True).hidden_states
         whisper_feature = torch.stack(whisper_feature, dim=2)
         return whisper_feature.squeeze(0).cpu().numpy()
 
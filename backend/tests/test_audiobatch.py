@@ -0,0 +1,50 @@
+import numpy as np
+
+from app.models.audiobatch import AudioBatch
+
+
+def chunk(value: float, type: int = 0, eventpoint=None, epoch: int = 1, samples: int = 320):
+    return np.full(samples, value, dtype=np.float32), type, eventpoint, epoch, 0.0
+
+
+def test_batch_keeps_order_types_and_eventpoints():
+    chunks = [chunk(0.1), chunk(0.2, eventpoint={'status': 'start'}), chunk(0.0, type=1), chunk(0.5)]
+    batch = AudioBatch.from_chunks(chunks, epoch=1)
+    assert len(batch) == 4
+    assert batch.pcm.shape == (4, 320)
+    assert batch.typelist == [0, 0, 1, 0]
+    assert batch.eventpoints == {1: {'status': 'start'}}
+    assert batch.pcm16[3, 0] == round(0.5 * 32767 - 0.5)
+
+
+def test_older_epoch_is_silenced_and_loses_its_eventpoint():
+    chunks = [chunk(0.3, eventpoint={'status': 'end'}, epoch=0), chunk(0.3)]
+    batch = AudioBatch.from_chunks(chunks, epoch=1)
+    assert not batch.pcm[0].any()
+    assert batch.typelist == [1, 0]
+    assert batch.eventpoints == {}
+    assert batch.span(0, 1).silent
+    assert not batch.span(0, 2).silent
+
+
+def test_short_chunk_is_padded_with_silence():
+    batch = AudioBatch.from_chunks([chunk(0.2), chunk(0.4, samples=100)], epoch=1)
+    assert batch.pcm.shape == (2, 320)
+    assert np.all(batch.pcm[1, :100] == np.float32(0.4))
+    assert not batch.pcm[1, 100:].any()
+
+
+def test_span_yields_views_of_one_int16_conversion():
+    chunks = [chunk(index / 10, type=index % 2, eventpoint={'n': index} if index == 3 else None) for index in range(4)]
+    batch = AudioBatch.from_chunks(chunks, epoch=1)
+    span = batch.span(2)
+    assert span.type == 0
+    assert not span.silent
+    frames = list(span.frames())
+    assert [eventpoint for _, eventpoint in frames] == [None, {'n': 3}]
+    samples, _ = frames[1]
+    assert samples.dtype == np.int16
+    assert samples.base is batch.pcm16
+    assert np.shares_memory(samples, batch.pcm16)
+    # only type 1 chunks
+    assert batch.span(1, 1).silent and batch.span(3, 1).silent
@@ -0,0 +1,65 @@
+import asyncio
+
+from app.core import metrics
+from app.core.broadcast import Broadcast
+
+
+class Viewer:
+    def __init__(self, kind: str, size: int = 3):
+        self.kind = kind
+        self._queue = asyncio.Queue(maxsize=size)
+
+def drained(viewer: Viewer) -> list:
+    items = []
+    while not viewer._queue.empty():
+        items.append(viewer._queue.get_nowait())
+    return items
+
+
+def test_frames_go_to_every_viewer_of_their_kind():
+    broadcast = Broadcast(1)
+    video, other, audio = Viewer('video'), Viewer('video'), Viewer('audio')
+    for viewer in (video, other, audio):
+        broadcast.subscribe(viewer)
+    broadcast.publish('video', 'v0')
+    broadcast.publish('audio', 'a0')
+    assert drained(video) == ['v0'] and drained(other) == ['v0']
+    assert drained(audio) == ['a0']
+    assert broadcast.viewers() == 2
+
+
+def test_slow_viewer_loses_its_oldest_frames_only():
+    broadcast = Broadcast(41)
+    slow, fast = Viewer('video', size=2), Viewer('video', size=10)
+    broadcast.subscribe(slow)
+    broadcast.subscribe(fast)
+    for index in range(5):
+        broadcast.publish('video', index)
+    assert drained(slow) == [3, 4]
+    assert drained(fast) == [0, 1, 2, 3, 4]
+    assert broadcast.stats()['dropped'] == 3
+    assert 'livetalking_dropped_frames_total{session="41",reason="slow_viewer"} 3.0' in list(metrics.dropped_frames.samples())
+    metrics.dropped_frames.remove(41)
+
+
+def test_unsubscribed_viewer_gets_nothing():
+    broadcast = Broadcast()
+    viewer = Viewer('video')
+    broadcast.subscribe(viewer)
+    broadcast.unsubscribe(viewer)
+    broadcast.publish('video', 'v')
+    assert drained(viewer) == []
+    assert broadcast.viewers() == 0
+
+
+def test_close_replaces_the_backlog_with_end_of_stream():
+    broadcast = Broadcast()
+    video, audio = Viewer('video'), Viewer('audio')
+    broadcast.subscribe(video)
+    broadcast.subscribe(audio)
+    for index in range(3):
+        broadcast.publish('video', index)
+    broadcast.close()
+    assert drained(video) == [None]
+    assert drained(audio) == [None]
+    assert broadcast.viewers() == 0
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+
+from app.core.clock import MasterClock
+
+
+def test_nothing_is_due_before_playout_starts():
+    clock = MasterClock(25)
+    assert clock.slot() == 0
+    assert clock.deadline(4) is None
+    # the first batch renders at once
+    assert clock.deadline(-12) == 0.0
+    origin = clock.start()
+    assert clock.start() == origin
+    assert abs(clock.deadline(10) - (origin + 10 * clock.video_ptime)) < 1e-9
+
+
+def test_tracks_are_paced_on_one_timeline():
+    async def main():
+        clock = MasterClock(50)
+        start = time.monotonic()
+        positions = [await clock.pace('video', index, clock.video_ptime) for index in range(4)]
+        audio = await clock.pace('audio', 6, clock.audio_ptime)
+        return time.monotonic() - start, positions, audio, clock
+    elapsed, positions, audio, clock = asyncio.run(main())
+    assert positions == [index * 0.04 for index in range(4)]
+    assert audio == 6 * 0.02
+    assert 0.11 <= elapsed < 0.3
+    assert clock.corrections == 0
+
+
+def test_late_track_moves_the_timeline_for_both():
+    async def main():
+        clock = MasterClock(50, max_late=0.05)
+        await clock.pace('video', 0, clock.video_ptime)
+        origin = clock.origin
+        await asyncio.sleep(0.2)
+        # slot 1 was due 0.16s ago: the clock shifts instead of bursting the backlog
+        position = await clock.pace('video', 1, clock.video_ptime)
+        return clock, origin, position
+    clock, origin, position = asyncio.run(main())
+    assert clock.corrections == 1
+    assert clock.origin - origin >= 0.15
+    assert abs(position - (0.04 + clock.shift)) < 1e-9
+    assert clock.stats()['corrections'] == 1
+
+
+def test_unpaced_clock_never_waits():
+    async def main():
+        clock = MasterClock(1)
+        clock.paced = False
+        start = time.monotonic()
+        positions = [await clock.pace('video', index, clock.video_ptime) for index in range(50)]
+        return time.monotonic() - start, positions, clock
+    elapsed, positions, clock = asyncio.run(main())
+    assert elapsed < 0.1
+    assert positions[-1] == 49 * 2
+    assert clock.deadline(1000) == 0.0
+
+
+def test_wait_slot_blocks_until_playout_starts_and_the_slot_is_due():
+    clock = MasterClock(50)
+    quit_event = threading.Event()
+    done = []
+    thread = threading.Thread(target=lambda: done.append((clock.wait_slot(2, quit_event), time.monotonic())))
+    thread.start()
+    time.sleep(0.1)
+    assert not done
+    origin = clock.start()
+    thread.join(1)
+    assert done and done[0][1] >= origin + 2 * clock.video_ptime
+    # a stopped session is not held by a clock that never starts
+    clock.reset()
+    quit_event.set()
+    clock.wait_slot(5, quit_event)
+
+
+def test_reset_starts_a_new_timeline():
+    clock = MasterClock(25)
+    clock.start()
+    clock.shift = 1.0
+    clock.reset()
+    assert clock.origin is None and clock.shift == 0.0
+    assert clock.deadline(1) is None
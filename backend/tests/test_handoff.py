@@ -0,0 +1,97 @@
+import asyncio
+import threading
+
+from app.core.handoff import Handoff
+
+
+class Track:
+    def __init__(self, maxsize: int = 0):
+        self._queue = asyncio.Queue(maxsize=maxsize)
+
+def drained(queue: asyncio.Queue) -> list:
+    items = []
+    while not queue.empty():
+        items.append(queue.get_nowait())
+    return items
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_puts_before_the_loop_runs_share_one_wakeup():
+    async def main():
+        handoff = Handoff(asyncio.get_running_loop())
+        video, audio = Track(), Track()
+        for index in range(10):
+            handoff.put([(video._queue, index), (audio._queue, index), (audio._queue, -index)])
+        await settle()
+        assert handoff.batches == 1
+        assert handoff.items == 30
+        assert drained(video._queue) == list(range(10))
+        assert drained(audio._queue)[:4] == [0, 0, 1, -1]
+    asyncio.run(main())
+
+
+def test_puts_from_another_thread_arrive_in_order():
+    async def main():
+        handoff = Handoff(asyncio.get_running_loop())
+        track = Track()
+        thread = threading.Thread(target=lambda: [handoff.put([(track._queue, index)]) for index in range(200)])
+        thread.start()
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+        await settle()
+        assert drained(track._queue) == list(range(200))
+        assert handoff.backlog() == 0
+    asyncio.run(main())
+
+
+def test_full_queue_backs_up_in_order_without_drops():
+    async def main():
+        handoff = Handoff(asyncio.get_running_loop())
+        full, other = Track(maxsize=2), Track()
+        handoff.put([(full._queue, index) for index in range(5)] + [(other._queue, 'x')])
+        await settle()
+        # the other queue is not held up by the full one
+        assert drained(other._queue) == ['x']
+        assert handoff.backlog() == 3
+        handoff.put([(full._queue, 5)])
+        await settle()
+        assert handoff.backlog() == 4
+        received = []
+        while len(received) < 6:
+            received.append(await asyncio.wait_for(full._queue.get(), 1))
+        assert received == list(range(6))
+        await settle()
+        assert handoff.backlog() == 0
+        assert not handoff._refills
+    asyncio.run(main())
+
+
+def test_discard_drops_what_was_not_played_and_keeps_later_puts():
+    async def main():
+        handoff = Handoff(asyncio.get_running_loop())
+        track = Track(maxsize=2)
+        handoff.put([(track._queue, index) for index in range(4)])
+        await settle()
+        # still pending when the talk is interrupted: never reaches the queue
+        handoff.put([(track._queue, 'stale')])
+        handoff.discard([track])
+        handoff.put([(track._queue, 'new')])
+        await settle()
+        assert drained(track._queue) == ['new']
+        assert handoff.backlog() == 0
+        assert not handoff._refills
+    asyncio.run(main())
+
+
+def test_callback_scheduled_before_discard_moves_nothing():
+    async def main():
+        handoff = Handoff(asyncio.get_running_loop())
+        track = Track()
+        handoff.put([(track._queue, 'stale')])
+        handoff.discard([track])
+        await settle()
+        assert drained(track._queue) == []
+        assert handoff.batches == 0
+    asyncio.run(main())
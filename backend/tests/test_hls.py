@@ -0,0 +1,121 @@
+import struct
+
+from app.push.hls import HLSStore, find_box, fragment_timing, iter_boxes, video_track
+
+
+def box(kind: bytes, *payload: bytes) -> bytes:
+    data = b''.join(payload)
+    return struct.pack('>I4s', 8 + len(data), kind) + data
+
+def full_box(kind: bytes, version: int, flags: int, *payload: bytes) -> bytes:
+    return box(kind, struct.pack('>I', version << 24 | flags), *payload)
+
+
+def test_iter_boxes_handles_large_and_open_ended_sizes():
+    large = struct.pack('>I4sQ', 1, b'mdat', 16 + 3) + b'abc'
+    data = box(b'ftyp', b'isom') + large + struct.pack('>I4s', 0, b'free') + b'rest'
+    boxes = list(iter_boxes(data))
+    assert [kind for kind, _, _ in boxes] == [b'ftyp', b'mdat', b'free']
+    _, payload, end = boxes[1]
+    assert data[payload:end] == b'abc'
+    assert boxes[2][2] == len(data)
+
+
+def test_find_box_descends_a_path():
+    data = box(b'moov', box(b'mvhd', b'x'), box(b'trak', box(b'mdia', box(b'hdlr', b'h1'))),
+               box(b'trak', box(b'mdia', box(b'mdhd', b'm2'))))
+    payload, end = find_box(data, (b'moov', b'trak', b'mdia', b'mdhd'))
+    assert data[payload:end] == b'm2'
+    assert find_box(data, (b'moov', b'udta')) is None
+
+
+def trak(track_id: int, handler: bytes, timescale: int) -> bytes:
+    tkhd = full_box(b'tkhd', 0, 3, struct.pack('>III', 0, 0, track_id), bytes(68))
+    mdhd = full_box(b'mdhd', 0, 0, struct.pack('>III', 0, 0, timescale), bytes(8))
+    hdlr = full_box(b'hdlr', 0, 0, bytes(4), handler, bytes(13))
+    return box(b'trak', tkhd, box(b'mdia', mdhd, hdlr))
+
+def test_video_track_skips_audio():
+    init = box(b'ftyp', b'iso6') + box(b'moov', trak(1, b'soun', 48000), trak(2, b'vide', 90000))
+    assert video_track(init) == (2, 90000)
+    assert video_track(box(b'ftyp', b'iso6') + box(b'moov', trak(1, b'soun', 48000))) is None
+
+
+def traf(track_id: int, tfhd_flags: int, tfhd_fields: bytes, tfdt: bytes, *truns: bytes) -> bytes:
+    return box(b'traf', full_box(b'tfhd', 0, tfhd_flags, struct.pack('>I', track_id), tfhd_fields), tfdt, *truns)
+
+def test_fragment_timing_sums_sample_durations():
+    # per-sample duration and size, after a data offset and first sample flags
+    samples = b''.join(struct.pack('>II', duration, 100) for duration in (3000, 3600, 3000))
+    trun = full_box(b'trun', 0, 0x1 | 0x4 | 0x100 | 0x200, struct.pack('>Iii', 3, 0, 0), samples)
+    audio = traf(1, 0x8, struct.pack('>I', 1024), full_box(b'tfdt', 0, 0, struct.pack('>I', 5)),
+                 full_box(b'trun', 0, 0, struct.pack('>I', 4)))
+    video = traf(2, 0x2, struct.pack('>I', 1), full_box(b'tfdt', 1, 0, struct.pack('>Q', 2 ** 33)), trun)
+    moof = box(b'moof', full_box(b'mfhd', 0, 0, struct.pack('>I', 1)), audio, video)
+    assert fragment_timing(moof, 2) == (2 ** 33, 9600)
+    # default duration from tfhd when the trun carries none
+    assert fragment_timing(moof, 1) == (5, 4096)
+    assert fragment_timing(moof, 3) is None
+
+
+def test_fragment_timing_skips_base_data_offset():
+    trun = full_box(b'trun', 0, 0, struct.pack('>I', 2))
+    fields = struct.pack('>QII', 1234, 1, 1500)
+    moof = box(b'moof', traf(7, 0x1 | 0x2 | 0x8, fields, full_box(b'tfdt', 0, 0, struct.pack('>I', 0)), trun))
+    assert fragment_timing(moof, 7) == (0, 3000)
+
+
+def fill(store: HLSStore, parts: int, every: int = 5):
+    for index in range(parts):
+        store.add_part(b'p', 0.2, index % every == 0)
+
+def test_store_cuts_segments_at_independent_parts():
+    store = HLSStore(segment_duration=1.0, part_duration=0.2, window=6)
+    store.add_init(b'init')
+    fill(store, 12)
+    assert store.sequence == 2
+    assert store.has(1) and not store.has(2) and store.has(2, 1) and not store.has(2, 2)
+    assert store.get('seg0.m4s') == b'p' * 5
+    assert store.get('seg2.m4s') is None
+    assert store.get('seg2.1.m4s') == b'p'
+    assert store.get('init0.mp4') == b'init'
+
+
+def test_playlist_keeps_discontinuity_sequence_after_window_slides():
+    store = HLSStore(segment_duration=1.0, part_duration=0.2, window=2)
+    store.add_init(b'a')
+    fill(store, 10)
+    store.add_init(b'b')
+    playlist = store.playlist()
+    assert '#EXT-X-DISCONTINUITY-SEQUENCE:0' in playlist
+    fill(store, 20)
+    playlist = store.playlist()
+    # the first listed segment already follows the reconnect
+    assert '#EXT-X-DISCONTINUITY\n' not in playlist
+    assert '#EXT-X-DISCONTINUITY-SEQUENCE:1' in playlist
+    assert '#EXT-X-MAP:URI="init1.mp4"' in playlist
+    assert store.get('seg0.m4s') is None
+
+
+def test_reopen_mid_segment_keeps_the_closed_segment():
+    store = HLSStore(segment_duration=1.0, part_duration=0.2, window=6)
+    store.add_init(b'a')
+    fill(store, 3)
+    store.add_init(b'b')
+    fill(store, 5)
+    assert store.sequence == 1
+    assert store.get('seg0.m4s') == b'p' * 3
+    first, second = store.segments[0], store.segments[1]
+    assert first.complete and not first.discontinuity and first.init == 0
+    assert len(second.parts) == 5 and second.discontinuity and second.init == 1
+    playlist = store.playlist()
+    assert playlist.index('seg0.m4s') < playlist.index('#EXT-X-DISCONTINUITY\n') < playlist.index('init1.mp4')
+
+
+def test_init_before_any_part_opens_no_empty_segment():
+    store = HLSStore(segment_duration=1.0, part_duration=0.2, window=6)
+    store.add_init(b'a')
+    store.add_init(b'b')
+    fill(store, 2)
+    assert list(store.segments) == [0]
+    assert store.segments[0].init == 1
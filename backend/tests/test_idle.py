@@ -0,0 +1,86 @@
+from fractions import Fraction
+
+import numpy as np
+
+from app.webrtc import idle
+from app.webrtc.idle import IdleFrame, IdleLoop, IdleSwitch, mirror_index
+
+
+class Encoder:
+    fps, gop, bitrate = 25, 4, 1000
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, frame, keyframe=False):
+        self.calls.append(keyframe)
+        return ('live', keyframe)
+
+def cycle(frames: int = 3):
+    return [np.full((16, 16, 3), index, dtype=np.uint8) for index in range(frames)]
+
+def prebuilt(frames, encoder: Encoder, keyframes=(0, 4)) -> IdleLoop:
+    # stands in for the background encode: one packet per position of the mirrored loop
+    loop = IdleLoop(frames, 16, 16, encoder.fps, encoder.gop, encoder.bitrate)
+    loop.packets = [(bytes([position]), position in keyframes) for position in range(2 * len(frames))]
+    idle._loops[(id(frames), 16, 16, encoder.fps, encoder.gop, encoder.bitrate)] = loop
+    return loop
+
+def idle_frame(frames, position: int) -> IdleFrame:
+    frame = IdleFrame(frames, position)
+    frame.pts = position * 3600
+    frame.time_base = Fraction(1, 90000)
+    return frame
+
+
+def test_mirror_index_runs_the_cycle_forth_and_back():
+    assert [mirror_index(3, index) for index in range(8)] == [0, 1, 2, 2, 1, 0, 0, 1]
+
+
+def test_live_encoding_until_the_loop_is_built():
+    encoder, frames = Encoder(), cycle()
+    loop = prebuilt(frames, encoder)
+    loop.packets = None
+    switch = IdleSwitch(encoder)
+    assert switch.encode(idle_frame(frames, 0)) == ('live', False)
+    assert not switch.on_loop
+
+
+def test_joins_the_loop_only_on_a_cached_keyframe():
+    encoder, frames = Encoder(), cycle()
+    prebuilt(frames, encoder)
+    switch = IdleSwitch(encoder)
+    assert switch.encode(idle_frame(frames, 3)) == ('live', False)
+    packet = switch.encode(idle_frame(frames, 4))
+    assert bytes(packet) == bytes([4]) and packet.is_keyframe and packet.pts == 4 * 3600
+    assert switch.on_loop
+
+
+def test_stays_on_the_loop_while_positions_are_continuous():
+    encoder, frames = Encoder(), cycle()
+    prebuilt(frames, encoder)
+    switch = IdleSwitch(encoder)
+    packets = [switch.encode(idle_frame(frames, position)) for position in (0, 1, 2, 3, 4, 5, 0)]
+    assert [bytes(packet) for packet in packets] == [bytes([position]) for position in (0, 1, 2, 3, 4, 5, 0)]
+    assert encoder.calls == []
+
+
+def test_a_gap_falls_back_to_live_until_the_next_keyframe():
+    encoder, frames = Encoder(), cycle()
+    prebuilt(frames, encoder)
+    switch = IdleSwitch(encoder)
+    switch.encode(idle_frame(frames, 0))
+    assert switch.encode(idle_frame(frames, 2)) == ('live', True)
+    assert switch.encode(idle_frame(frames, 3)) == ('live', False)
+    assert bytes(switch.encode(idle_frame(frames, 4))) == bytes([4])
+
+
+def test_first_live_frame_after_the_loop_is_a_keyframe():
+    encoder, frames = Encoder(), cycle()
+    prebuilt(frames, encoder)
+    switch = IdleSwitch(encoder)
+    switch.encode(idle_frame(frames, 0))
+    switch.encode(idle_frame(frames, 1))
+    assert switch.encode('speaking') == ('live', True)
+    assert switch.encode('speaking') == ('live', False)
+    assert not switch.on_loop
@@ -0,0 +1,30 @@
+from app.core import metrics
+
+
+def test_remove_drops_every_series_of_a_session():
+    counter = metrics.Counter('c_total', 'c', ('session', 'reason'))
+    histogram = metrics.Histogram('h_seconds', 'h', ('session', 'kind'), buckets=(1.0,))
+    for session in (1, 2):
+        counter.inc(1, session, 'a')
+        counter.inc(1, session, 'b')
+        histogram.observe(0.5, session, 'video')
+    counter.remove(1)
+    histogram.remove(1)
+    assert all('session="1"' not in line for line in counter.samples())
+    assert all('session="1"' not in line for line in histogram.samples())
+    assert len(list(counter.samples())) == 2
+    assert histogram.totals(2, 'video') == ([1, 0], 0.5)
+
+
+def test_registry_removes_a_session_from_session_labelled_metrics_only():
+    registry = metrics.Registry()
+    by_session = registry.register(metrics.Counter('s_total', 's', ('session',)))
+    by_reason = registry.register(metrics.Counter('r_total', 'r', ('reason',)))
+    registry.register(metrics.Gauge('g', 'g', ('session',), lambda: {(7,): 1}))
+    by_session.inc(1, 7)
+    by_reason.inc(1, 7)
+    registry.remove_session(7)
+    text = registry.render()
+    assert 's_total{' not in text
+    assert 'r_total{reason="7"} 1.0' in text
+    assert 'g{session="7"} 1.0' in text
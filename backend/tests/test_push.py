@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+
+from app.push.push import StreamWriter
+
+
+def queued(writer: StreamWriter) -> list:
+    return [position for _, _, position in list(writer._queue.queue)]
+
+
+def test_full_queue_drops_the_newest_frame_by_default():
+    writer = StreamWriter('null', queue_size=3)
+    for index in range(5):
+        writer.put('video', None, index)
+    assert queued(writer) == [0, 1, 2]
+    assert writer.dropped == 2
+    assert writer.stats()['backlog'] == 3
+
+
+def test_oldest_policy_keeps_the_latest_frames():
+    writer = StreamWriter('null', queue_size=3, drop_policy='oldest')
+    for index in range(5):
+        writer.put('video', None, index)
+    assert queued(writer) == [2, 3, 4]
+    assert writer.dropped == 2
+
+
+class FlakyWriter(StreamWriter):
+    # the first connection is refused, the second goes to a local file
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(path, **kwargs)
+        self.opens = 0
+
+    def open_output(self):
+        import av
+
+        self.opens += 1
+        if self.opens == 1:
+            raise ConnectionRefusedError('refused')
+        return av.open(self.url, mode='w', format='matroska')
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_a_failed_connection_is_retried_and_streaming_resumes(tmp_path):
+    import av
+
+    path = tmp_path / 'out.mkv'
+    writer = FlakyWriter(str(path), fps=25, queue_size=500)
+    writer.start()
+    image = np.zeros((64, 64, 3), dtype=np.uint8)
+    for index in range(100):
+        writer.put('video', av.VideoFrame.from_ndarray(image, format='bgr24'), index / 25)
+        time.sleep(0.005)
+    assert wait_for(lambda: writer.video_frames > 0)
+    stats = writer.stats()
+    assert stats['reconnects'] == 1 and stats['connects'] == 1
+    assert 'refused' in stats['last_error']
+    assert stats['connected']
+    writer.stop()
+    assert not writer.connected
+    with av.open(str(path)) as container:
+        decoded = sum(1 for _ in container.decode(video=0))
+    assert decoded == writer.video_frames
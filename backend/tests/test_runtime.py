@@ -0,0 +1,79 @@
+import threading
+import time
+
+from app.core.runtime import Runtime
+
+
+def wait_for(condition, timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def test_strand_runs_its_calls_in_order_one_at_a_time():
+    runtime = Runtime(4, 1, 1)
+    strand = runtime.strand(runtime.workers)
+    seen, running = [], []
+
+    def call(index):
+        running.append(index)
+        assert len(running) == 1
+        time.sleep(0.001)
+        seen.append(index)
+        running.pop()
+
+    for index in range(50):
+        strand.submit(call, index)
+    assert wait_for(lambda: len(seen) == 50)
+    assert seen == list(range(50))
+    runtime.shutdown()
+
+
+def test_strands_share_the_workers():
+    runtime = Runtime(2, 1, 1)
+    gate = threading.Event()
+    started = []
+    for index in range(2):
+        runtime.strand(runtime.workers).submit(lambda index=index: (started.append(index), gate.wait(2)))
+    # two strands blocked at once on two workers
+    assert wait_for(lambda: len(started) == 2)
+    gate.set()
+    runtime.shutdown()
+
+
+def test_a_failing_call_is_counted_and_the_strand_goes_on():
+    runtime = Runtime(1, 1, 1)
+    strand = runtime.strand(runtime.workers)
+    seen = []
+    strand.submit(lambda: 1 / 0)
+    strand.submit(seen.append, 'after')
+    assert wait_for(lambda: seen == ['after'])
+    assert runtime.failures == 1
+    runtime.shutdown()
+
+
+def test_timer_runs_calls_by_due_time():
+    runtime = Runtime(1, 1, 1)
+    seen = []
+    now = time.monotonic()
+    for delay, name in ((0.06, 'c'), (0.02, 'a'), (0.04, 'b')):
+        runtime.call_at(now + delay, seen.append, name)
+    runtime.call_at(now + 0.03, lambda: 1 / 0)
+    assert wait_for(lambda: len(seen) == 3)
+    # the raising callback did not stop the timer thread
+    assert seen == ['a', 'b', 'c']
+    assert time.monotonic() - now >= 0.06
+    runtime.shutdown()
+
+
+def test_shutdown_drops_later_work():
+    runtime = Runtime(1, 1, 1)
+    seen = []
+    runtime.call_at(time.monotonic() + 0.05, seen.append, 'timer')
+    runtime.shutdown()
+    runtime.strand(runtime.workers).submit(seen.append, 'strand')
+    runtime.call_at(time.monotonic(), seen.append, 'late')
+    time.sleep(0.1)
+    assert seen == []
+    assert runtime.timer._thread is None
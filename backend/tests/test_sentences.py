@@ -0,0 +1,35 @@
+from app.models.ttsreal import SentenceBuffer, split_sentences
+
+
+def test_sentences_are_released_as_soon_as_they_end():
+    buffer = SentenceBuffer()
+    assert buffer.push('Hello there, my') == []
+    assert buffer.push(' friend. It co') == ['Hello there, my friend.']
+    assert buffer.push('sts a lot! And') == ['It costs a lot!']
+    assert buffer.flush() == 'And'
+    assert buffer.flush() == ''
+
+
+def test_short_sentences_are_merged_with_the_next():
+    assert split_sentences('Hi. Short. This one is long enough.') == ['Hi. Short.', 'This one is long enough.']
+    assert split_sentences('Hi. Ok.', min_chars=2) == ['Hi.', 'Ok.']
+
+
+def test_decimal_point_does_not_end_a_sentence():
+    buffer = SentenceBuffer()
+    # the number is split across two pushes
+    assert buffer.push('It costs about 3.') == []
+    assert buffer.push('5 dollars. Next') == ['It costs about 3.5 dollars.']
+
+
+def test_cjk_and_repeated_punctuation():
+    assert split_sentences('你好，我是数字人。今天天气很好！谢谢', min_chars=5) == ['你好，我是数字人。', '今天天气很好！', '谢谢']
+    assert split_sentences('Wait... what?! Really.') == ['Wait... what?!', 'Really.']
+    assert split_sentences('first line here\nsecond line here') == ['first line here', 'second line here']
+
+
+def test_whitespace_only_input_yields_nothing():
+    assert split_sentences('   ') == []
+    buffer = SentenceBuffer()
+    assert buffer.push('\n\n') == []
+    assert buffer.flush() == ''
@@ -0,0 +1,104 @@
+import numpy as np
+
+from app.models.ttscache import TTSCache, cache_key, normalize_text
+
+
+def test_key_ignores_whitespace_and_width():
+    assert normalize_text('  hello　 world \n') == 'hello world'
+    assert cache_key('edge', 'v', '', 'hello  world') == cache_key('edge', 'v', '', ' hello world ')
+    assert cache_key('edge', 'v', '', 'ＡＢＣ') == cache_key('edge', 'v', '', 'ABC')
+
+
+def test_key_separates_provider_voice_and_reference():
+    keys = {
+        cache_key('edge', 'a', '', 'text'),
+        cache_key('edge', 'b', '', 'text'),
+        cache_key('cosyvoice', 'a', '', 'text'),
+        cache_key('edge', 'a', 'ref.wav', 'text'),
+        cache_key('edge', 'a', '', 'other'),
+    }
+    assert len(keys) == 5
+    # fields are separated, moving text between them changes the key
+    assert cache_key('edge', 'ab', '', 'c') != cache_key('edge', 'a', '', 'bc')
+    assert cache_key('edge', None, None, 'text') == cache_key('edge', '', '', 'text')
+
+
+def pcm(samples):
+    return np.zeros(samples, dtype=np.float32)
+
+
+def test_memory_tier_evicts_least_recently_used_within_budget():
+    cache = TTSCache(max_bytes=3 * 400)
+    for key in 'abc':
+        cache.put(key, pcm(100))
+    assert cache.bytes == 1200
+    assert cache.get('a') is not None
+    cache.put('d', pcm(100))
+    assert 'b' not in cache.entries
+    assert list(cache.entries) == ['c', 'a', 'd']
+    assert cache.bytes == 1200
+
+
+def test_budget_counts_features_and_replacements():
+    cache = TTSCache(max_bytes=1000)
+    cache.put('a', pcm(100), np.zeros(25, dtype=np.float32))
+    assert cache.bytes == 500
+    cache.put('a', pcm(50))
+    assert cache.bytes == 200
+    assert len(cache.entries) == 1
+
+
+def test_entry_over_budget_is_not_kept():
+    cache = TTSCache(max_bytes=100)
+    cache.put('big', pcm(100))
+    assert cache.bytes == 0
+    assert cache.get('big') is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_entries_are_read_only():
+    cache = TTSCache(max_bytes=1000)
+    cache.put('a', pcm(10))
+    entry, _ = cache.get('a')
+    assert not entry.flags.writeable
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    cache = TTSCache(str(tmp_path), max_bytes=1000)
+    cache.put('a', np.arange(10, dtype=np.float32), np.ones((5, 2), dtype=np.float32))
+    other = TTSCache(str(tmp_path), max_bytes=1000)
+    audio, feat = other.get('a')
+    assert np.array_equal(audio, np.arange(10))
+    assert feat.shape == (5, 2)
+    assert other.stats()['disk_hits'] == 1
+    assert 'a' in other.entries
+    assert not list(tmp_path.glob('*.tmp'))
+
+
+def test_key_follows_the_reference_file_contents(tmp_path):
+    ref = tmp_path / 'ref.wav'
+    ref.write_bytes(b'voice a')
+    before = cache_key('http', 'v', str(ref), 'text')
+    assert cache_key('http', 'v', str(ref), 'text') == before
+    ref.write_bytes(b'another voice')
+    assert cache_key('http', 'v', str(ref), 'text') != before
+
+
+def test_disk_tier_evicts_least_recently_used_over_budget(tmp_path):
+    import os
+
+    cache = TTSCache(str(tmp_path), max_bytes=1 << 20, disk_bytes=1 << 20)
+    for key in 'abc':
+        cache.put(key, pcm(1000))
+    entry = os.path.getsize(tmp_path / 'a.pcm.npy')
+    for index, key in enumerate('abc'):
+        os.utime(tmp_path / f'{key}.pcm.npy', (1000 + index, 1000 + index))
+    # a disk hit makes a the most recently used
+    TTSCache(str(tmp_path), max_bytes=1 << 20).get('a')
+
+    cache = TTSCache(str(tmp_path), max_bytes=1 << 20, disk_bytes=3 * entry)
+    assert cache.disk_used == 3 * entry
+    cache.put('d', pcm(1000))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['a.pcm.npy', 'c.pcm.npy', 'd.pcm.npy']
+    assert cache.disk_used == 3 * entry
+    assert cache.stats()['disk_evictions'] == 1
@@ -0,0 +1,74 @@
+import cv2
+import numpy as np
+
+from app.models.videosource import ClipSource, RingSource, load_clip, open_video, video_underruns
+
+SHADES = (0, 80, 160, 240)
+
+
+def write_clip(path) -> str:
+    # one flat shade per frame, so a frame's position survives the lossy codec
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 25, (32, 32))
+    for shade in SHADES:
+        writer.write(np.full((32, 32, 3), shade, dtype=np.uint8))
+    writer.release()
+    return str(path)
+
+def shade(frame) -> int:
+    return min(SHADES, key=lambda value: abs(value - float(frame.mean())))
+
+def underruns(sessionid) -> float:
+    return video_underruns._values.get((sessionid,), 0)
+
+
+def test_clip_source_loops_over_the_shared_frames(tmp_path):
+    path = write_clip(tmp_path / 'idle.avi')
+    clip = load_clip(path)
+    assert load_clip(path) is clip
+    assert not clip.frames[0].flags.writeable
+    first, second = ClipSource(clip), ClipSource(clip)
+    assert [shade(first.read()) for _ in range(6)] == [0, 80, 160, 240, 0, 80]
+    assert shade(second.read()) == 0
+
+def test_clip_source_of_an_unreadable_file_reads_nothing(tmp_path):
+    assert ClipSource(load_clip(str(tmp_path / 'missing.avi'))).read() is None
+
+
+def test_ring_source_loops_at_the_end_of_the_file(tmp_path):
+    source = RingSource(write_clip(tmp_path / 'idle.avi'), size=2)
+    shades = []
+    while len(shades) < 10:
+        frame = source._ring.get(timeout=5)
+        shades.append(shade(frame))
+    source.close()
+    assert shades == [0, 80, 160, 240, 0, 80, 160, 240, 0, 80]
+
+def test_ring_source_repeats_the_last_frame_on_underrun(tmp_path):
+    source = RingSource(write_clip(tmp_path / 'idle.avi'), size=4, sessionid=48)
+    first = source._ring.get(timeout=5)
+    source._ring.put(first)
+    source.close()
+    source._thread.join(timeout=5)
+    frames = []
+    while not source._ring.empty():
+        frames.append(source.read())
+    before = underruns(48)
+    assert source.read() is frames[-1]
+    assert source.read() is frames[-1]
+    assert underruns(48) == before + 2
+    video_underruns.remove(48)
+
+def test_ring_source_without_a_frame_yet_reads_nothing(tmp_path):
+    source = RingSource(str(tmp_path / 'missing.avi'), sessionid=49)
+    source._thread.join(timeout=5)
+    assert source.read() is None
+    assert underruns(49) == 0
+
+
+def test_open_video_streams_clips_over_the_memory_budget(tmp_path):
+    path = write_clip(tmp_path / 'idle.avi')
+    assert isinstance(open_video(path, memory_mb=1), ClipSource)
+    ring = open_video(path, memory_mb=0.001)
+    assert isinstance(ring, RingSource)
+    ring.close()
+    assert open_video(str(tmp_path / 'missing.avi')) is None